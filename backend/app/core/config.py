@@ -1,8 +1,11 @@
 # backend/app/core/config.py
+import logging
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
 from typing import ClassVar
 
+logger = logging.getLogger(__name__)
+
 class Settings(BaseSettings):
     """Loads and validates application settings."""
 
@@ -36,9 +39,8 @@ class Settings(BaseSettings):
 # Create a single instance of the settings to be imported by other modules
 settings = Settings()
 
-# Optional: Print loaded settings during startup (for debugging)
-print(f"DEBUG: Loaded settings - MONGODB_URI set: {'*' * 5 if settings.MONGODB_URI else 'No'}")
-print(f"DEBUG: Loaded settings - DB_NAME: {settings.DB_NAME}")
-print(f"DEBUG: Loaded settings - SECRET_KEY set: {'*' * 5 if settings.SECRET_KEY else 'No'}")
-print(f"DEBUG: Loaded settings - ALGORITHM: {settings.ALGORITHM}")
-print(f"DEBUG: Loaded settings - ACCESS_TOKEN_EXPIRE_MINUTES: {settings.ACCESS_TOKEN_EXPIRE_MINUTES}")
\ No newline at end of file
+# Loaded settings at DEBUG (secrets are only reported as set / not set)
+logger.debug(
+    "Loaded settings: MONGODB_URI set=%s DB_NAME=%s SECRET_KEY set=%s ALGORITHM=%s ACCESS_TOKEN_EXPIRE_MINUTES=%s",
+    bool(settings.MONGODB_URI), settings.DB_NAME, bool(settings.SECRET_KEY), settings.ALGORITHM, settings.ACCESS_TOKEN_EXPIRE_MINUTES,
+)
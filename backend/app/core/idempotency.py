@@ -0,0 +1,246 @@
+# backend/app/core/idempotency.py
+#
+# Idempotency-Key support for non-idempotent POSTs (conversation turns, memory creation).
+# The first request with a key claims it in Mongo and computes the response; the stored 2xx
+# response is replayed to later requests with the same key (Idempotent-Replayed: true) until
+# the record's TTL expires. Duplicates arriving while the original is still running wait for
+# it: on the same worker via a shared future, across workers by polling the record. A worker
+# that dies mid-request leaves a claim whose lease runs out, after which a duplicate takes over.
+# Keys are scoped per user and endpoint.
+# Failed requests (exceptions or non-2xx responses) release the key so the client can retry,
+# unless `compute` already called mark_applied(): then the write is durable, so the key is
+# sealed as "applied" and retries get 409 instead of repeating it. The same happens when the
+# response cannot be stored. Responses are kept whole, so endpoints must bound what they return.
+# Content that must be fresh on every delivery (e.g. expiring signed URLs) is left out of the
+# stored body and added by `render_body`, which runs on each 2xx response handed out.
+# Reusing a key with a different payload is rejected with 422.
+
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+IDEMPOTENCY_COLLECTION_NAME = "idempotency_keys" # TTL index on expires_at: app/core/indexes.py
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120")) # > worst-case LLM turn
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "90")) # duplicate waiting for the original
+IDEMPOTENCY_POLL_SECONDS = 0.2
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAY_HEADER = "Idempotent-Replayed"
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+APPLIED = "applied" # side effect committed, but no stored response to replay
+
+# record id -> (payload fingerprint, future resolved with the stored response, or None if the original failed)
+_in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+# Set by mark_applied() inside `compute`; read by run_idempotent when compute fails afterwards.
+_applied: ContextVar[Optional[list]] = ContextVar("idempotency_applied", default=None)
+
+
+def mark_applied() -> None:
+    """Call from `compute` as soon as its write is durable; later failures then seal the key instead of releasing it."""
+    flag = _applied.get()
+    if flag is not None:
+        flag[0] = True
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable hash of the request payload, so a reused key with a different body can be detected."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _record_id(user_id: str, scope: str, key: str) -> str:
+    return f"{user_id}:{scope}:{key}"
+
+
+def _key_reused() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"{IDEMPOTENCY_HEADER} was already used with a different request payload.",
+    )
+
+
+def _already_applied() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"The request with this {IDEMPOTENCY_HEADER} was already applied, but its response is not available. Reload instead of retrying.",
+    )
+
+
+def _replay(stored: Dict[str, Any]) -> Response:
+    return Response(
+        content=bytes(stored["body"]), status_code=stored["status_code"], media_type=stored["media_type"],
+        headers={REPLAY_HEADER: "true"},
+    )
+
+
+async def _claim(db: AsyncIOMotorDatabase, record_id: str, fingerprint: str, owner: str) -> Optional[Dict[str, Any]]:
+    """Inserts the in-progress record; returns None if we own it now, else the existing record."""
+    now = datetime.utcnow()
+    collection = db[IDEMPOTENCY_COLLECTION_NAME]
+    try:
+        await collection.insert_one({
+            "_id": record_id, "state": IN_PROGRESS, "fingerprint": fingerprint, "owner": owner,
+            "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            "created_at": now, "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    existing = await collection.find_one({"_id": record_id})
+    if (existing is not None and existing["fingerprint"] == fingerprint
+            and existing["state"] == IN_PROGRESS and existing["lease_until"] <= now):
+        # The original's worker died without finishing or releasing its claim: take it over.
+        taken = await collection.find_one_and_update(
+            {"_id": record_id, "state": IN_PROGRESS, "owner": existing["owner"]},
+            {"$set": {"owner": owner, "lease_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if taken is not None:
+            logger.warning("Idempotency key '%s': took over an expired in-progress claim.", record_id)
+            return None
+        existing = await collection.find_one({"_id": record_id})
+    return existing or {"state": None} # vanished between insert and read: caller retries the claim
+
+
+async def _wait_for_original(db: AsyncIOMotorDatabase, record_id: str, fingerprint: str, deadline: float) -> Optional[Response]:
+    """Waits until the original completes (its response) or fails/expires (None: try to claim again)."""
+    local = _in_flight.get(record_id)
+    loop = asyncio.get_running_loop()
+    if local is not None:
+        if local[0] != fingerprint:
+            raise _key_reused()
+        try:
+            stored = await asyncio.wait_for(asyncio.shield(local[1]), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            stored = None
+        else:
+            return _replay(stored) if stored is not None else None
+    while loop.time() < deadline:
+        await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+        record = await db[IDEMPOTENCY_COLLECTION_NAME].find_one({"_id": record_id})
+        if record is None:
+            return None
+        if record["state"] == COMPLETED:
+            return _replay(record["response"])
+        if record["state"] == APPLIED:
+            raise _already_applied()
+        if record["lease_until"] <= datetime.utcnow():
+            return None
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT, detail="A request with this Idempotency-Key is still being processed.",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _complete(db: AsyncIOMotorDatabase, record_id: str, owner: str, response: Response) -> Optional[Dict[str, Any]]:
+    collection = db[IDEMPOTENCY_COLLECTION_NAME]
+    if not 200 <= response.status_code < 300:
+        await collection.delete_one({"_id": record_id, "owner": owner})
+        return None
+    stored = {"status_code": response.status_code, "media_type": response.media_type, "body": bytes(response.body)}
+    await collection.update_one(
+        {"_id": record_id, "owner": owner, "state": IN_PROGRESS}, {"$set": {"state": COMPLETED, "response": stored}},
+    )
+    return stored
+
+
+async def _abandon(db: AsyncIOMotorDatabase, record_id: str, owner: str, applied: bool) -> None:
+    """Releases our claim so the client can retry, or seals it as applied when the write already happened."""
+    collection = db[IDEMPOTENCY_COLLECTION_NAME]
+    try:
+        if applied:
+            await collection.update_one({"_id": record_id, "owner": owner, "state": IN_PROGRESS}, {"$set": {"state": APPLIED}})
+        else:
+            await collection.delete_one({"_id": record_id, "owner": owner})
+    except Exception as e: # the lease still expires, so waiters are not stuck forever
+        logger.error("Idempotency key '%s': could not %s claim: %s", record_id, "seal" if applied else "release", e)
+
+
+def _render(response: Response, render_body: Optional[Callable[[bytes], bytes]]) -> Response:
+    if render_body is None or not 200 <= response.status_code < 300:
+        return response
+    response.body = render_body(bytes(response.body))
+    response.headers["content-length"] = str(len(response.body))
+    return response
+
+
+async def run_idempotent(
+    db: AsyncIOMotorDatabase, key: Optional[str], user_id: str, scope: str, fingerprint: str,
+    compute: Callable[[], Awaitable[Response]], render_body: Optional[Callable[[bytes], bytes]] = None,
+) -> Response:
+    """
+    Runs `compute` at most once per (user, scope, key) within the TTL and returns its response,
+    or the stored one for a repeated key. Without a key, just runs `compute`.
+    `compute` must return a Response with a rendered body (e.g. FastJSONResponse). That body is
+    what gets stored; `render_body`, if given, rewrites it on every response returned, fresh or replayed.
+    """
+    return _render(await _run_idempotent(db, key, user_id, scope, fingerprint, compute), render_body)
+
+
+async def _run_idempotent(
+    db: AsyncIOMotorDatabase, key: Optional[str], user_id: str, scope: str, fingerprint: str,
+    compute: Callable[[], Awaitable[Response]],
+) -> Response:
+    if not key:
+        return await compute()
+    record_id = _record_id(user_id, scope, key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    owner = uuid.uuid4().hex
+    while True:
+        if record_id not in _in_flight:
+            existing = await _claim(db, record_id, fingerprint, owner)
+            if existing is None:
+                break
+            if existing["state"] is None:
+                continue
+            if existing["fingerprint"] != fingerprint:
+                raise _key_reused()
+            if existing["state"] == COMPLETED:
+                return _replay(existing["response"])
+            if existing["state"] == APPLIED:
+                raise _already_applied()
+        replayed = await _wait_for_original(db, record_id, fingerprint, deadline)
+        if replayed is not None:
+            return replayed
+        if loop.time() >= deadline:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Could not complete the idempotent request; please retry.")
+
+    future = loop.create_future()
+    _in_flight[record_id] = (fingerprint, future)
+    applied = [False]
+    applied_token = _applied.set(applied)
+    stored = None
+    try:
+        try:
+            response = await compute()
+        except BaseException:
+            await _abandon(db, record_id, owner, applied[0])
+            raise
+        try:
+            stored = await _complete(db, record_id, owner, response)
+        except Exception as e: # the work is done: return it, and never let a retry repeat a 2xx
+            logger.error("Idempotency key '%s': could not store the response: %s", record_id, e)
+            await _abandon(db, record_id, owner, applied[0] or 200 <= response.status_code < 300)
+        return response
+    finally:
+        _applied.reset(applied_token)
+        del _in_flight[record_id]
+        future.set_result(stored) # None wakes local waiters to claim the key themselves (or find it applied)
@@ -0,0 +1,301 @@
+# backend/app/core/indexes.py
+#
+# Declarative index registry + query-plan self-check.
+#
+#   python -m app.core.indexes reconcile [--drop-unknown]   # create missing, rebuild drifted indexes
+#   python -m app.core.indexes check                        # explain() every registered query shape
+#   python -m app.core.indexes check --profile              # also flag scans recorded in system.profile
+#
+# Startup only creates missing indexes (safe to run in every worker at once); rebuilding a
+# drifted index drops it first, so that is left to the CLI.
+# QUERY_SHAPES is maintained by hand; `check --profile` catches queries it does not cover:
+# enable the profiler on a dev/staging database (db.setProfilingLevel(2)), drive traffic
+# (e.g. benchmarks.loadtest), then run it to list every executed operation that scanned or sorted.
+#
+# Run from backend/. Uses MONGODB_URI / DB_NAME from the environment or config/.env.
+
+import os
+import sys
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from app.core.idempotency import IDEMPOTENCY_COLLECTION_NAME
+
+# Collection names as used by main.py and the routers (kept literal where importing them would cycle through main.py).
+USERS = "users"
+CONVERSATIONS = "conversations_collection"
+MEMORIES = "futureself"
+BLOBS = "attachment_blobs"
+IDEMPOTENCY = IDEMPOTENCY_COLLECTION_NAME
+
+IndexKeys = Sequence[Tuple[str, int]]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: IndexKeys
+    name: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+# --- Registry: every index the application relies on ---
+INDEX_REGISTRY: List[IndexSpec] = [
+    IndexSpec(USERS, [("email", 1)], "email_1", {"unique": True}),
+    IndexSpec(USERS, [("username", 1)], "username_1", {"unique": True}),
+    # Newest-first conversation listing + keyset pagination (list_conversations, summaries)
+    IndexSpec(CONVERSATIONS, [("user_id", 1), ("updated_at", -1), ("_id", -1)], "user_id_1_updated_at_-1__id_-1"),
+    # Newest-first memory listing + keyset pagination, per-user memory index build
+    IndexSpec(MEMORIES, [("user_id", 1), ("created_at", -1), ("_id", -1)], "user_id_1_created_at_-1__id_-1"),
+    # Attachment download ownership check (multikey over the attachment URLs)
+    IndexSpec(MEMORIES, [("user_id", 1), ("attachments", 1)], "user_id_1_attachments_1"),
+    # Blob garbage collection: unreferenced blobs idle past the grace period
+    IndexSpec(BLOBS, [("refcount", 1), ("updated_at", 1)], "refcount_1_updated_at_1"),
+    # Idempotency records expire at expires_at (TTL monitor); lookups are by _id
+    IndexSpec(IDEMPOTENCY, [("expires_at", 1)], "expires_at_1", {"expireAfterSeconds": 0}),
+]
+
+# Options compared when deciding whether an existing index matches its spec.
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _normalise_keys(keys) -> List[Tuple[str, Any]]:
+    return [(name, int(direction) if isinstance(direction, (int, float)) else direction) for name, direction in keys]
+
+
+async def reconcile_indexes(db: AsyncIOMotorDatabase, rebuild: bool = False, drop_unknown: bool = False) -> Dict[str, List[str]]:
+    """
+    Makes the database match INDEX_REGISTRY: creates missing indexes and, with `rebuild`,
+    drops and recreates ones whose keys/options drifted (otherwise they are only reported
+    as "drifted"); with `drop_unknown`, drops indexes the registry does not know about.
+    Errors propagate so a broken index setup fails startup instead of being printed and ignored.
+    """
+    report: Dict[str, List[str]] = {"created": [], "rebuilt": [], "drifted": [], "dropped": [], "unchanged": []}
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in INDEX_REGISTRY:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection_name, specs in by_collection.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for spec in specs:
+            label = f"{collection_name}.{spec.name}"
+            current = existing.get(spec.name)
+            if current is not None:
+                same_keys = _normalise_keys(current["key"]) == _normalise_keys(spec.keys)
+                same_options = all(current.get(opt) == spec.options.get(opt) for opt in _COMPARED_OPTIONS)
+                if same_keys and same_options:
+                    report["unchanged"].append(label)
+                    continue
+                if not rebuild:
+                    report["drifted"].append(label)
+                    continue
+                await collection.drop_index(spec.name)
+                await collection.create_index(list(spec.keys), name=spec.name, **spec.options)
+                report["rebuilt"].append(label)
+                continue
+            await collection.create_index(list(spec.keys), name=spec.name, **spec.options)
+            report["created"].append(label)
+        if drop_unknown:
+            known = {spec.name for spec in specs} | {"_id_"}
+            for name in existing:
+                if name not in known:
+                    await collection.drop_index(name)
+                    report["dropped"].append(f"{collection_name}.{name}")
+    return report
+
+
+# --- Query shapes used by the routers (sample values; only the plan matters) ---
+@dataclass(frozen=True)
+class QueryShape:
+    name: str
+    collection: str
+    filter: Dict[str, Any] = field(default_factory=dict)
+    sort: Optional[List[Tuple[str, int]]] = None
+    limit: int = 0
+    pipeline: Optional[List[Dict[str, Any]]] = None # aggregate shapes
+    modify: Optional[Dict[str, Any]] = None # findAndModify shapes: {"update": ...} or {"remove": True}
+
+
+_SAMPLE_USER = "explain-user"
+_SAMPLE_TIME = datetime(2024, 1, 1)
+_SAMPLE_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def _keyset(field_name: str) -> Dict[str, Any]:
+    return {field_name: {"$lte": _SAMPLE_TIME}, "$nor": [{field_name: _SAMPLE_TIME, "_id": {"$gte": _SAMPLE_ID}}]}
+
+
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("main.get_user_from_db", USERS, {"username": "explain"}, limit=1),
+    QueryShape("main.register_user (email check)", USERS, {"email": "explain@example.com"}, limit=1),
+    QueryShape("auth.login_for_access_token", USERS, {"email": "explain@example.com"}, limit=1),
+    QueryShape("conversation.db_get_conversation", CONVERSATIONS, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER}, limit=1),
+    QueryShape("conversation.db_get_conversation_tail", CONVERSATIONS, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER}, limit=1),
+    QueryShape(
+        "conversation.db_append_messages", CONVERSATIONS, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER},
+        modify={"update": {"$push": {"messages": {"$each": []}}, "$set": {"updated_at": _SAMPLE_TIME}}},
+    ),
+    QueryShape("conversation.list_conversations", CONVERSATIONS, {"user_id": _SAMPLE_USER}, [("updated_at", -1)], limit=20),
+    QueryShape(
+        "conversation.list_conversation_summaries", CONVERSATIONS,
+        pipeline=[
+            {"$match": {"user_id": _SAMPLE_USER, **_keyset("updated_at")}},
+            {"$sort": {"updated_at": -1, "_id": -1}},
+            {"$limit": 21},
+            {"$project": {"title": 1, "updated_at": 1, "message_count": {"$size": {"$ifNull": ["$messages", []]}}}},
+        ],
+    ),
+    QueryShape("memories.get_memory", MEMORIES, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER}, limit=1),
+    QueryShape("memories.update_memory_endpoint", MEMORIES, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER},
+               modify={"update": {"$set": {"updated_at": _SAMPLE_TIME}}}),
+    QueryShape("memories.delete_memory_endpoint", MEMORIES, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER},
+               modify={"remove": True}),
+    QueryShape("memories.upload_attachment_to_memory", MEMORIES, {"_id": _SAMPLE_ID, "user_id": _SAMPLE_USER},
+               modify={"update": {"$push": {"attachments": "/api/v1/attachments/explain"}}}),
+    QueryShape("memories.list_memories", MEMORIES, {"user_id": _SAMPLE_USER}, [("created_at", -1)], limit=20),
+    QueryShape(
+        "memories.list_memories_page", MEMORIES,
+        {"user_id": _SAMPLE_USER, **_keyset("created_at")}, [("created_at", -1), ("_id", -1)], limit=21,
+    ),
+    QueryShape("memory_index.build", MEMORIES, {"user_id": _SAMPLE_USER}),
+    QueryShape("attachments.serve_attachment (ownership)", MEMORIES,
+               {"user_id": _SAMPLE_USER, "attachments": {"$in": ["/api/v1/attachments/explain", "/static/uploads/explain"]}}, limit=1),
+    QueryShape("attachment_storage.collect_garbage", BLOBS,
+               {"refcount": {"$lte": 0}, "deleting": {"$ne": True}, "updated_at": {"$lte": _SAMPLE_TIME}}),
+    QueryShape("attachment_storage._acquire_blob", BLOBS, {"_id": _SAMPLE_ID, "deleting": {"$ne": True}},
+               modify={"update": {"$inc": {"refcount": 1}}, "upsert": True}),
+    QueryShape("attachment_storage._reclaim_blob", BLOBS,
+               {"_id": _SAMPLE_ID, "refcount": {"$lte": 0}, "deleting": {"$ne": True}, "updated_at": {"$lte": _SAMPLE_TIME}},
+               modify={"update": {"$set": {"deleting": True}}}),
+    QueryShape("idempotency._claim / _wait_for_original (lookup)", IDEMPOTENCY, {"_id": _SAMPLE_ID}, limit=1),
+    QueryShape("idempotency._claim (lease takeover)", IDEMPOTENCY, {"_id": _SAMPLE_ID, "state": "in_progress", "owner": "explain"},
+               modify={"update": {"$set": {"owner": "explain", "lease_until": _SAMPLE_TIME}}}),
+    QueryShape("idempotency._complete / release", IDEMPOTENCY, {"_id": _SAMPLE_ID, "owner": "explain", "state": "in_progress"}, limit=1),
+]
+
+# COLLSCAN = full scan; SORT = blocking in-memory sort (classic and SBE spellings).
+BAD_PLAN_STAGES = {"COLLSCAN", "SORT", "sort"}
+
+
+def _winning_plans(node: Any):
+    """Yields every winningPlan in an explain document (rejected plans are ignored)."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                yield value
+            elif key != "rejectedPlans":
+                yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _winning_plans(item)
+
+
+def _bad_stages(node: Any, found: List[str]) -> List[str]:
+    if isinstance(node, dict):
+        if node.get("stage") in BAD_PLAN_STAGES:
+            found.append(node["stage"])
+        for value in node.values():
+            _bad_stages(value, found)
+    elif isinstance(node, list):
+        for item in node:
+            _bad_stages(item, found)
+    return found
+
+
+async def explain_shape(db: AsyncIOMotorDatabase, shape: QueryShape) -> Dict[str, Any]:
+    if shape.pipeline is not None:
+        return await db.command({
+            "explain": {"aggregate": shape.collection, "pipeline": shape.pipeline, "cursor": {}},
+            "verbosity": "queryPlanner",
+        })
+    if shape.modify is not None:
+        command = {"findAndModify": shape.collection, "query": shape.filter, **shape.modify}
+        if shape.sort:
+            command["sort"] = dict(shape.sort)
+        return await db.command({"explain": command, "verbosity": "queryPlanner"})
+    cursor = db[shape.collection].find(shape.filter)
+    if shape.sort:
+        cursor = cursor.sort(shape.sort)
+    if shape.limit:
+        cursor = cursor.limit(shape.limit)
+    return await cursor.explain()
+
+
+async def verify_query_plans(db: AsyncIOMotorDatabase) -> List[str]:
+    """Explains every registered query shape; returns one problem line per shape that scans or sorts in memory."""
+    problems = []
+    for shape in QUERY_SHAPES:
+        plan = await explain_shape(db, shape)
+        bad: List[str] = []
+        for winning_plan in _winning_plans(plan):
+            _bad_stages(winning_plan, bad)
+        # Aggregation stages that ran after the query layer; a $sort here was not pushed into the index scan.
+        bad += ["$sort" for stage in plan.get("stages", []) if isinstance(stage, dict) and "$sort" in stage]
+        if bad:
+            problems.append(f"{shape.name} on '{shape.collection}': {', '.join(sorted(set(bad)))}")
+    return problems
+
+
+async def profiled_problems(db: AsyncIOMotorDatabase) -> List[str]:
+    """
+    Operations recorded in system.profile that ran a collection scan or an in-memory sort,
+    one line per (namespace, operation, filter fields). Covers queries missing from QUERY_SHAPES.
+    """
+    seen: Dict[Tuple[str, str, Tuple[str, ...]], str] = {}
+    scans = {"$or": [{"planSummary": {"$regex": "^COLLSCAN"}}, {"hasSortStage": True}], "ns": {"$not": {"$regex": r"\.system\."}}}
+    async for entry in db["system.profile"].find(scans, {"ns": 1, "op": 1, "command": 1, "planSummary": 1, "hasSortStage": 1}):
+        command = entry.get("command") or {}
+        query = command.get("filter") or command.get("query") or command.get("q") or {}
+        key = (entry.get("ns", "?"), entry.get("op", "?"), tuple(sorted(query)))
+        if key not in seen:
+            plan = entry.get("planSummary", "")
+            seen[key] = plan + (" + in-memory sort" if entry.get("hasSortStage") else "")
+    return [f"{ns} {op} on {list(fields)}: {plan}" for (ns, op, fields), plan in sorted(seen.items())]
+
+
+# --- CLI ---
+async def _main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", "..", "config", ".env"))
+
+    parser = argparse.ArgumentParser(prog="python -m app.core.indexes", description="Index registry tools")
+    parser.add_argument("command", choices=["reconcile", "check"])
+    parser.add_argument("--drop-unknown", action="store_true", help="reconcile: drop indexes not in the registry")
+    parser.add_argument("--profile", action="store_true", help="check: also report scans recorded in system.profile")
+    parser.add_argument("--db", default=os.getenv("DB_NAME", "future_self_db"))
+    args = parser.parse_args(argv)
+
+    mongo_uri = os.getenv("MONGODB_URI")
+    if not mongo_uri:
+        print("MONGODB_URI is not set.", file=sys.stderr)
+        return 2
+    client = AsyncIOMotorClient(mongo_uri)
+    try:
+        db = client[args.db]
+        if args.command == "reconcile":
+            report = await reconcile_indexes(db, rebuild=True, drop_unknown=args.drop_unknown)
+            for action, labels in report.items():
+                for label in labels:
+                    print(f"{action:>9}  {label}")
+            return 0
+        problems = await verify_query_plans(db)
+        if args.profile:
+            problems += [f"profiled: {problem}" for problem in await profiled_problems(db)]
+        for problem in problems:
+            print(f"FAIL  {problem}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"OK  {len(QUERY_SHAPES)} query shapes use indexes without in-memory sorts.")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,135 @@
+# backend/app/core/logging_setup.py
+#
+# Process-wide logging: every record goes through a QueueHandler, and a background
+# QueueListener thread formats and writes it, so a slow stderr/pipe never blocks the event loop.
+# Records are queued unformatted (same process, no pickling), so the message string is only
+# built on the listener thread, and only for records that pass the level check and sampling.
+# Log with %-style arguments (logger.info("... %s", value)), not f-strings, so nothing is
+# formatted for records that are filtered out.
+#
+# Environment:
+#   LOG_LEVEL         root level (default INFO)
+#   LOG_FORMAT        "json" (one object per line, default) or "text"
+#   LOG_SAMPLE_RATES  per-logger sampling of records below WARNING, e.g.
+#                     "app.routers.memories=0.1,uvicorn.access=0.05"; warnings and errors are
+#                     never sampled out.
+
+import os
+import sys
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import IO, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# The per-request INFO logs of the feature routers are the noisy ones.
+DEFAULT_SAMPLE_RATES = "app.routers.memories=0.1,app.routers.conversation=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES)
+# uvicorn installs its own (synchronous) handlers; these are rerouted through the queue.
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field.
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, extra fields, exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps roughly `rate` of the records below WARNING; WARNING and above always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = min(max(rate, 0.0), 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message (and traceback) on the calling thread so the
+    # record can be pickled; the queue here is in-process, so that work is left to the listener.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        name, sep, rate = item.strip().partition("=")
+        if not sep or not name:
+            continue
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      sample_rates: Optional[Dict[str, float]] = None, stream: Optional[IO[str]] = None,
+                      ) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a queue to a background writer thread. Idempotent: calling it
+    again replaces the previous listener (e.g. in a reloaded worker).
+    """
+    global _listener
+    shutdown_logging()
+
+    stream_handler = logging.StreamHandler(stream or sys.stderr)
+    if (fmt or LOG_FORMAT) == "text":
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(name)s: %(message)s"))
+    else:
+        stream_handler.setFormatter(StructuredFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(queue.SimpleQueue()))
+    root.setLevel(level or LOG_LEVEL)
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    rates = parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates
+    for name, rate in rates.items():
+        target = logging.getLogger(name)
+        for existing in [f for f in target.filters if isinstance(f, SamplingFilter)]:
+            target.removeFilter(existing)
+        if rate < 1.0:
+            target.addFilter(SamplingFilter(rate))
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the writer thread (application shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
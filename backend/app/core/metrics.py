@@ -0,0 +1,244 @@
+# backend/app/core/metrics.py
+#
+# Prometheus metrics, exposed at GET /metrics (see main.py). Every labelled series touched on a
+# hot path is bound once (.labels() children for routes at startup, Mongo command/collection
+# pairs and anything unforeseen on first use) and kept in plain dicts, so recording a request
+# or a Mongo command is a couple of dict lookups plus an observe(), with no label resolution.
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import iter_route_contexts
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+from app.core import password_pool
+
+# --- Buckets (seconds) ---
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+STATUS_CLASSES = ("2xx", "3xx", "4xx", "5xx") # 1xx never reaches http.response.start
+UNMATCHED_ROUTE = "<unmatched>" # 404s and CORS preflights: keeps raw paths out of the labels
+LLM_MODES = ("complete", "stream")
+LLM_RETRY_REASONS = ("timeout", "connection", "rate_limited", "server_error")
+LLM_QUEUE_REJECTION_REASONS = ("timeout", "user_queue_full")
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route template, method and status class.",
+    ("method", "route", "status"), buckets=HTTP_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+_http_in_flight = 0 # plain int on the event loop thread; the gauge reads it at scrape time
+HTTP_REQUESTS_IN_FLIGHT.set_function(lambda: _http_in_flight)
+
+# --- MongoDB ---
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency (driver-measured) by command and collection.",
+    ("command", "collection"), buckets=MONGO_BUCKETS,
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total", "MongoDB commands that returned an error.", ("command", "collection"),
+)
+
+# --- LLM (any provider, see app/services/llm_providers.py) ---
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "Chat completion latency, until the last token for streams.",
+    ("mode",), buckets=LLM_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Streamed chat completions: time until the first token.", buckets=LLM_BUCKETS,
+)
+LLM_REQUEST_FAILURES = Counter("llm_request_failures_total", "Chat completions that raised.", ("mode",))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported in completion usage.", ("kind",))
+LLM_RETRIES = Counter("llm_retries_total", "LLM attempts retried, by reason.", ("reason",))
+LLM_HEDGES = Counter("llm_hedged_requests_total", "Completions that started a hedged second attempt.")
+LLM_CIRCUIT_REJECTIONS = Counter("llm_circuit_rejections_total", "LLM calls refused while the circuit breaker was open.")
+LLM_CIRCUIT_OPEN = Gauge("llm_circuit_open", "1 while the LLM circuit breaker is open.") # set_function: llm_resilience
+LLM_QUEUE_WAIT = Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for a scheduler slot (0 when admitted directly).",
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+LLM_QUEUE_REJECTIONS = Counter("llm_queue_rejections_total", "LLM calls refused with 429 by the scheduler.", ("reason",))
+# set_function: llm_scheduler
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "LLM calls waiting for a scheduler slot.")
+LLM_SLOTS_IN_USE = Gauge("llm_slots_in_use", "LLM calls holding a scheduler slot.")
+
+# --- Password hashing (bcrypt pool) ---
+# Read from the pool when scraped, so hashing itself records nothing.
+PASSWORD_HASH_QUEUE_DEPTH = Gauge("password_hash_queue_depth", "Password jobs waiting for a worker.")
+PASSWORD_HASH_QUEUE_DEPTH.set_function(password_pool.queue_depth)
+PASSWORD_HASH_IN_FLIGHT = Gauge("password_hash_in_flight", "Password jobs running or queued.")
+PASSWORD_HASH_IN_FLIGHT.set_function(password_pool.in_flight)
+
+# Pre-bound children
+_llm_duration = {mode: LLM_REQUEST_DURATION.labels(mode) for mode in LLM_MODES}
+_llm_failures = {mode: LLM_REQUEST_FAILURES.labels(mode) for mode in LLM_MODES}
+_prompt_tokens = LLM_TOKENS.labels("prompt")
+_completion_tokens = LLM_TOKENS.labels("completion")
+_llm_retries = {reason: LLM_RETRIES.labels(reason) for reason in LLM_RETRY_REASONS}
+_llm_queue_rejections = {reason: LLM_QUEUE_REJECTIONS.labels(reason) for reason in LLM_QUEUE_REJECTION_REASONS}
+
+# route template -> method -> histogram child per status class (index = status // 100 - 2)
+_http_series: Dict[str, Dict[str, List[Any]]] = {}
+# id(matched route) -> [(full path regex, full route template)]. Routes of included routers are
+# router-relative in scope["route"]; a router included under several prefixes gets one entry each.
+_route_templates: Dict[int, List[Tuple[Any, str]]] = {}
+# command name -> collection -> (duration child, failure child)
+_mongo_series: Dict[str, Dict[str, Tuple[Any, Any]]] = {}
+
+
+def _bind_route(route_path: str, methods: Iterable[str]) -> Dict[str, List[Any]]:
+    by_method = _http_series.setdefault(route_path, {})
+    for method in methods:
+        if method not in by_method:
+            by_method[method] = [HTTP_REQUEST_DURATION.labels(method, route_path, status) for status in STATUS_CLASSES]
+    return by_method
+
+
+def bind_routes(routes: Iterable[Any]) -> None:
+    """
+    Creates the label children for every route, including those of nested included routers,
+    and records each route's full template (call at startup, once every router is included).
+    """
+    _route_templates.clear()
+    for context in iter_route_contexts(routes):
+        path = context.path_format
+        if not path:
+            continue
+        _route_templates.setdefault(id(context.original_route), []).append((getattr(context, "path_regex", None), path))
+        if context.methods:
+            _bind_route(path, context.methods)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route") # set by the router on the shared scope once a route matches
+    if route is None:
+        return UNMATCHED_ROUTE
+    templates = _route_templates.get(id(route))
+    if not templates: # added after startup
+        return getattr(route, "path_format", None) or UNMATCHED_ROUTE
+    if len(templates) > 1:
+        for path_regex, path in templates:
+            if path_regex is not None and path_regex.match(scope["path"]):
+                return path
+    return templates[0][1]
+
+
+def _http_child(method: str, route_path: str, status_code: int):
+    by_method = _http_series.get(route_path)
+    children = by_method.get(method) if by_method is not None else None
+    if children is None:
+        children = _bind_route(route_path, (method,))[method]
+    return children[min(max(status_code // 100, 2), 5) - 2]
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status_code = 500 # stays 500 if the app raises before starting a response
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        global _http_in_flight
+        _http_in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _http_in_flight -= 1
+            _http_child(scope["method"], _route_template(scope), status_code).observe(time.perf_counter() - started)
+
+
+# --- MongoDB command listener ---
+def _mongo_children(command_name: str, collection: str) -> Tuple[Any, Any]:
+    by_collection = _mongo_series.get(command_name)
+    if by_collection is None:
+        by_collection = _mongo_series.setdefault(command_name, {})
+    children = by_collection.get(collection)
+    if children is None:
+        children = by_collection.setdefault(collection, (
+            MONGO_COMMAND_DURATION.labels(command_name, collection),
+            MONGO_COMMAND_FAILURES.labels(command_name, collection),
+        ))
+    return children
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    pymongo CommandListener feeding mongodb_command_* (pass it to the Motor client via
+    event_listeners). Callbacks run on driver threads; they only touch dicts and the
+    thread-safe metric children.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[Any, Any]] = {} # request_id -> series of the running command
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        command_name = event.command_name
+        target = event.command.get("collection") if command_name == "getMore" else event.command.get(command_name)
+        collection = target if isinstance(target, str) else "-" # admin/db-level commands
+        self._pending[event.request_id] = _mongo_children(command_name, collection)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        children = self._pending.pop(event.request_id, None)
+        if children is not None:
+            children[0].observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        children = self._pending.pop(event.request_id, None)
+        if children is not None:
+            children[0].observe(event.duration_micros / 1_000_000)
+            children[1].inc()
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+# --- LLM helpers ---
+def record_llm_call(mode: str, started: float, usage: Optional[Any] = None) -> None:
+    """Records a finished chat completion; `usage` is the completion's usage object, if any."""
+    _llm_duration[mode].observe(time.perf_counter() - started)
+    if usage is not None:
+        _prompt_tokens.inc(getattr(usage, "prompt_tokens", 0) or 0)
+        _completion_tokens.inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_llm_first_token(started: float) -> None:
+    LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+
+
+def record_llm_failure(mode: str) -> None:
+    _llm_failures[mode].inc()
+
+
+def record_llm_retry(reason: str) -> None:
+    _llm_retries[reason].inc()
+
+
+def record_llm_hedge() -> None:
+    LLM_HEDGES.inc()
+
+
+def record_llm_circuit_rejection() -> None:
+    LLM_CIRCUIT_REJECTIONS.inc()
+
+
+def record_llm_queue_wait(seconds: float) -> None:
+    LLM_QUEUE_WAIT.observe(seconds)
+
+
+def record_llm_queue_rejection(reason: str) -> None:
+    _llm_queue_rejections[reason].inc()
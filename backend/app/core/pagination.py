@@ -0,0 +1,40 @@
+# backend/app/core/pagination.py
+
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from fastapi import HTTPException, status
+
+# Opaque keyset cursors: base64url(JSON {"t": <sort field ISO timestamp>, "i": <_id>}).
+# Paging with them is an index seek on (user_id, <field> desc, _id desc) instead of a skip.
+
+
+def encode_cursor(sort_value: datetime, doc_id: Any) -> str:
+    payload = json.dumps({"t": sort_value.isoformat(), "i": str(doc_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Returns (sort value, _id); raises 400 for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), str(payload["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {e}")
+
+
+def keyset_after(sort_field: str, cursor: str) -> Dict[str, Any]:
+    """
+    Mongo filter for documents strictly after `cursor` in (sort_field desc, _id desc) order.
+    Written as a single range plus a $nor tie-breaker (not an $or) so the planner keeps one
+    index scan with the index-provided sort.
+    """
+    sort_value, doc_id = decode_cursor(cursor)
+    return {
+        sort_field: {"$lte": sort_value},
+        "$nor": [{sort_field: sort_value, "_id": {"$gte": doc_id}}],
+    }
@@ -0,0 +1,55 @@
+# backend/app/core/password_pool.py
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from fastapi import HTTPException, status
+
+# --- Configuration ---
+# bcrypt releases the GIL while hashing, so a thread pool gives real parallelism
+# without the pickling overhead of a process pool.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a worker before new ones are shed with 503.
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = 1
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_in_flight = 0 # running + queued jobs (only touched from the event loop thread)
+
+
+def queue_depth() -> int:
+    """Number of password jobs waiting for a free worker."""
+    return max(_in_flight - PASSWORD_HASH_WORKERS, 0)
+
+
+def in_flight() -> int:
+    """Number of password jobs running or queued."""
+    return _in_flight
+
+
+async def run_in_password_pool(func: Callable[..., T], *args: Any) -> T:
+    """
+    Runs a CPU-heavy password function (bcrypt hash/verify) on the bounded pool.
+    Raises 503 with Retry-After once the queue is full instead of piling up work.
+    """
+    global _in_flight
+    if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests in progress. Please retry shortly.",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+        )
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def shutdown_password_pool():
+    """Stops the worker threads on application shutdown."""
+    _executor.shutdown(wait=False, cancel_futures=True)
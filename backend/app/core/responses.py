@@ -0,0 +1,90 @@
+# backend/app/core/responses.py
+#
+# Fast JSON path for read-heavy endpoints: documents coming back from MongoDB were validated
+# when they were written, so they are projected straight into the response shape (no
+# per-document model construction, no second validation through response_model) and encoded
+# with orjson. Returning a Response from an endpoint makes FastAPI skip response_model
+# serialization; keep response_model on the route for the OpenAPI schema.
+
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError: # falls back to the stdlib encoder with the same output
+    orjson = None
+
+_MISSING = object()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _model_fields(model: Type[BaseModel]) -> Iterable[Tuple[str, Optional[str], Any, Optional[Callable[[], Any]]]]:
+    """(name, alias, default, default_factory) per field, for pydantic v2 and v1."""
+    if hasattr(model, "model_fields"):
+        for name, info in model.model_fields.items():
+            default = _MISSING if info.is_required() else info.default
+            yield name, info.alias, default, info.default_factory
+    else:
+        for name, field in model.__fields__.items():
+            default = _MISSING if field.required else field.default
+            yield name, (field.alias if field.alias != name else None), default, field.default_factory
+
+
+class DocumentSerializer:
+    """
+    Projects trusted DB documents into the JSON shape FastAPI would emit for `model`
+    (field aliases as output keys, like response_model_by_alias=True), filling defaults for
+    absent fields and dropping extra keys. `sources` maps an output key to a different
+    document key, e.g. {"id": "_id"}; `nested` projects list-of-model fields.
+    """
+
+    def __init__(self, model: Type[BaseModel], sources: Optional[Dict[str, str]] = None,
+                 nested: Optional[Dict[str, "DocumentSerializer"]] = None):
+        sources = sources or {}
+        nested = nested or {}
+        self._fields = []
+        for name, alias, default, default_factory in _model_fields(model):
+            output_key = alias or name
+            self._fields.append((output_key, sources.get(output_key, output_key), default, default_factory, nested.get(name)))
+
+    def one(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for output_key, source_key, default, default_factory, nested in self._fields:
+            value = doc.get(source_key, _MISSING)
+            if value is _MISSING:
+                if default_factory is not None:
+                    value = default_factory()
+                elif default is _MISSING:
+                    continue # required but absent: leave it out rather than invent a value
+                else:
+                    value = default
+            elif nested is not None and value is not None:
+                value = nested.many(value)
+            out[output_key] = value
+        return out
+
+    def many(self, docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        one = self.one
+        return [one(doc) for doc in docs]
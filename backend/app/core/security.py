@@ -11,6 +11,7 @@ from pydantic import ValidationError
 # Import settings from the config module within the same directory
 from app.core.config import settings # Use 'app.' prefix
 from app.models.token import TokenPayload # Use 'app.' prefix
+from app.core.password_pool import run_in_password_pool
 
 # --- Password Hashing Setup ---
 # Configure passlib context: Use bcrypt, mark others as deprecated auto-detected
@@ -44,6 +45,21 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Async variant of verify_password for use inside request handlers.
+    Runs on the bounded password pool; raises 503 when the pool is saturated.
+    """
+    return await run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """
+    Async variant of get_password_hash for use inside request handlers.
+    Runs on the bounded password pool; raises 503 when the pool is saturated.
+    """
+    return await run_in_password_pool(get_password_hash, password)
+
+
 # --- JWT Handling ---
 
 # Load JWT settings from the central configuration
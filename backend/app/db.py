@@ -1,13 +1,16 @@
 # backend/app/db.py
 
 import os
+import logging
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket, AsyncIOMotorDatabase
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Any, AsyncIterator, Optional, Union
 from pathlib import Path
 from bson import ObjectId
 import certifi  # <--- IMPORT certifi
 
+logger = logging.getLogger(__name__)
+
 # Load env vars
 env_path = Path(__file__).parent.parent.parent / "config" / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -32,12 +35,12 @@ async def connect_db():
     # ---> START CHANGE <---
     # Get the path to the CA bundle from certifi
     ca = certifi.where()
-    print(f"DEBUG: Using CA certificate bundle from: {ca}")
+    logger.debug("Using CA certificate bundle from: %s", ca)
     # ---> END CHANGE <---
 
     # Avoid logging credentials in production logs
     log_uri = mongo_uri.split('@')[-1] if '@' in mongo_uri else mongo_uri
-    print(f"DEBUG: Connecting to MongoDB at {log_uri}...")
+    logger.debug("Connecting to MongoDB at %s...", log_uri)
 
     try:
         # ---> MODIFIED LINE: Pass tlsCAFile=ca to the client constructor <---
@@ -50,14 +53,14 @@ async def connect_db():
         # The ismaster command is cheap and does explicit server selection.
         # Good for verifying the connection works immediately.
         await client.admin.command('ismaster')
-        print("DEBUG: Successfully connected to MongoDB and verified connection.")
+        logger.debug("Successfully connected to MongoDB and verified connection.")
 
         mongodb = client[mongo_db_name]
         fs_bucket = AsyncIOMotorGridFSBucket(mongodb)
-        print(f"DEBUG: Initialized database handle '{mongo_db_name}' and GridFS bucket.")
+        logger.debug("Initialized database handle '%s' and GridFS bucket.", mongo_db_name)
 
     except Exception as e:
-        print(f"ERROR: Failed to connect to MongoDB: {e}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         # Re-raise the exception so the application knows connection failed
         raise
 
@@ -67,12 +70,12 @@ async def close_db():
     """
     global client
     if client:
-        print("DEBUG: Closing MongoDB connection...")
+        logger.debug("Closing MongoDB connection...")
         client.close()
         client = None # Ensure client is reset
         mongodb = None # Reset DB handle too
         fs_bucket = None # Reset GridFS bucket
-        print("DEBUG: MongoDB connection closed.")
+        logger.debug("MongoDB connection closed.")
 
 
 # --- Dependency Function ---
@@ -82,7 +85,7 @@ def get_db() -> AsyncIOMotorDatabase:
     """
     if mongodb is None:
         # This might happen if connect_db failed during startup
-        print("ERROR: get_db called but database connection is not initialized.")
+        logger.error("get_db called but database connection is not initialized.")
         raise RuntimeError("Database connection not initialized. Lifespan manager might have failed or connection error occurred.")
     return mongodb
 
@@ -101,11 +104,21 @@ def get_fs_bucket() -> AsyncIOMotorGridFSBucket:
     """
     global fs_bucket
     if fs_bucket is None:
-        print("ERROR: get_fs_bucket called but GridFS bucket is not initialized.")
+        logger.error("get_fs_bucket called but GridFS bucket is not initialized.")
         raise RuntimeError("GridFS bucket not initialized. Check database connection.")
     return fs_bucket
 
 
+def init_fs_bucket(database: AsyncIOMotorDatabase, bucket_name: str = "fs") -> AsyncIOMotorGridFSBucket:
+    """
+    Creates the GridFS bucket on an already-connected database handle (for apps that manage
+    their own client instead of calling connect_db).
+    """
+    global fs_bucket
+    fs_bucket = AsyncIOMotorGridFSBucket(database, bucket_name=bucket_name)
+    return fs_bucket
+
+
 # --- CRUD utility functions ---
 
 async def insert_document(collection_name: str, document: dict) -> str:
@@ -150,15 +163,15 @@ async def delete_document(collection_name: str, filter: dict) -> int:
 
 # --- File upload/download using GridFS ---
 
-async def upload_file(file_bytes: bytes, filename: str, metadata: dict = None) -> str:
+async def upload_file(source: Union[bytes, Any], filename: str, metadata: dict = None) -> str:
     """
-    Upload a file to GridFS. Returns the file ID as string.
+    Upload a file to GridFS. `source` may be bytes or a readable file object; file objects are
+    streamed in chunk_size_bytes pieces, so large uploads never sit in memory whole.
+    Returns the file ID as string.
     """
     fs = get_fs_bucket() # Use helper function
     metadata = metadata or {}
-    # Note: upload_from_stream expects a stream-like object or bytes directly.
-    # If file_bytes is already bytes, this is fine.
-    file_id = await fs.upload_from_stream(filename, file_bytes, metadata=metadata)
+    file_id = await fs.upload_from_stream(filename, source, metadata=metadata)
     return str(file_id)
 
 async def download_file(file_id) -> bytes:
@@ -177,6 +190,47 @@ async def download_file(file_id) -> bytes:
     data = await grid_out.read()
     return data
 
+async def find_file(filename: str) -> Optional[dict]:
+    """
+    Returns the newest GridFS files document stored under `filename`, or None.
+    """
+    fs = get_fs_bucket()
+    cursor = fs.find({"filename": filename}).sort("uploadDate", -1).limit(1)
+    async for grid_out in cursor:
+        return {"_id": grid_out._id, "filename": filename, "length": grid_out.length, "metadata": grid_out.metadata}
+    return None
+
+async def stream_file(filename: str, start: int = 0, end: Optional[int] = None,
+                      chunk_size: int = 256 * 1024) -> AsyncIterator[bytes]:
+    """
+    Yields bytes [start, end] (inclusive; end=None means to the last byte) of the newest GridFS
+    file stored under `filename`, one piece at a time. Prefer this over download_file for
+    anything that can be large: memory use is one chunk, not the whole file.
+    """
+    fs = get_fs_bucket()
+    grid_out = await fs.open_download_stream_by_name(filename)
+    if end is None:
+        end = grid_out.length - 1
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = await grid_out.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+async def delete_files_by_name(filename: str) -> int:
+    """
+    Delete every GridFS revision stored under `filename`. Returns how many were removed.
+    """
+    fs = get_fs_bucket()
+    deleted = 0
+    async for grid_file in fs.find({"filename": filename}):
+        await fs.delete(grid_file._id)
+        deleted += 1
+    return deleted
+
 async def delete_file(file_id) -> None:
     """
     Delete a file from GridFS by its ID (can be ObjectId or string).
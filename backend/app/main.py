@@ -2,30 +2,44 @@
 
 import os
 import uuid
+import secrets
+import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List # Added List for scope use
 
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter # Add APIRouter here
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Response, Header # Add APIRouter here
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware # Added for frontend interaction
 
 from pydantic import BaseModel, Field, EmailStr
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
-
-print("--- Starting main.py ---")
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 # --- 1. Configuration Loading ---
-print("Loading configuration...")
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', 'config', '.env')
 load_dotenv(dotenv_path=dotenv_path)
 
+# Imported after load_dotenv so module-level settings see the .env values
+from app.core.logging_setup import configure_logging, shutdown_logging
+configure_logging() # queue-backed, level-gated logging (LOG_LEVEL / LOG_FORMAT / LOG_SAMPLE_RATES)
+logger = logging.getLogger(__name__)
+
+from app.services import llm_client
+from app.core.password_pool import run_in_password_pool, shutdown_password_pool
+from app.core.cache import TTLCache
+from app.core.indexes import reconcile_indexes, verify_query_plans
+from app.services.attachment_storage import RequestSizeLimitMiddleware, configure_attachment_storage, shutdown_upload_pool
+from app.services.thumbnails import shutdown_thumbnail_pool
+from app.core.metrics import MetricsMiddleware, bind_routes, mongo_command_metrics
+
 # --- Environment Variable Check & Settings ---
 # (Ideally in a core/config.py Pydantic Settings model)
 MONGODB_URI = os.getenv("MONGODB_URI")
-DB_NAME = "future_self_db" # Or load from .env
+DB_NAME = os.getenv("DB_NAME", "future_self_db")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY") # Used by conversation.py's PersonaService
 
 # JWT Settings (Ideally from core/config.py)
@@ -33,21 +47,34 @@ SECRET_KEY = os.getenv("SECRET_KEY") # NEED TO SET THIS IN .env (e.g., openssl r
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 # Or load from .env
 
+# Index management (see app/core/indexes.py). Startup only creates missing indexes; drifted
+# ones are logged and rebuilt with `python -m app.core.indexes reconcile`.
+INDEX_RECONCILE_ON_STARTUP = os.getenv("INDEX_RECONCILE_ON_STARTUP", "true").lower() == "true"
+INDEX_SELF_CHECK_ON_STARTUP = os.getenv("INDEX_SELF_CHECK_ON_STARTUP", "false").lower() == "true"
+
+# Authenticated-user cache (see get_current_active_user). The TTL bounds how long a user changed
+# or removed outside this API (e.g. directly in Mongo) keeps authenticating on a worker.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "15"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Operational endpoints (/metrics, /api/v1/internal/*) require "Authorization: Bearer <token>".
+# Unset: those endpoints answer 404.
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
 # --- Check Essential Config ---
 if not MONGODB_URI:
     raise ValueError("FATAL ERROR: MONGODB_URL environment variable not set.")
-if not GROQ_API_KEY:
-    # Note: conversation.py checks this too, but good to know early
-    print("WARNING: GROQ_API_KEY environment variable not set. Conversation AI will fail.")
+if not GROQ_API_KEY and os.getenv("LLM_PROVIDER", "groq").lower() == "groq":
+    # Note: llm_client.start_llm_client checks this too, but good to know early
+    logger.warning("GROQ_API_KEY environment variable not set. Conversation AI will fail.")
 if not SECRET_KEY:
     raise ValueError("FATAL ERROR: SECRET_KEY environment variable not set. Needed for JWT.")
 
-print("Configuration loaded.")
+logger.debug("Configuration loaded.")
 
 
 # --- 2. Pydantic Models ---
 # (Ideally in separate files like models/user.py, models/token.py)
-print("Defining Pydantic models...")
 
 class UserBase(BaseModel):
     email: EmailStr = Field(..., unique=True)
@@ -81,11 +108,9 @@ class TokenData(BaseModel):
     # Add scopes if using permission scopes
     # scopes: List[str] = []
 
-print("Models defined.")
 
 # --- 3. Security Utilities ---
 # (Ideally in a separate core/security.py)
-print("Setting up security utilities...")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token") # Points to our login route
@@ -98,6 +123,14 @@ def get_password_hash(password: str) -> str:
     """Hashes a plain password."""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bounded password pool (keeps bcrypt off the event loop)."""
+    return await run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash on the bounded password pool (keeps bcrypt off the event loop)."""
+    return await run_in_password_pool(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Creates a JWT access token."""
     to_encode = data.copy()
@@ -121,35 +154,38 @@ def decode_access_token(token: str) -> Optional[str]:
     except JWTError:
         return None # Or raise credential_exception
 
-print("Security utilities set up.")
-
 
 # --- 4. Database Setup ---
-print("Setting up database connection...")
 # Use app.state for sharing client/db across requests and lifespan events
 app_state: Dict[str, Any] = {}
 
 async def startup_db_client():
     """Connects to MongoDB on application startup."""
-    print(f"Connecting to MongoDB at {MONGODB_URI}...")
-    app_state["mongodb_client"] = AsyncIOMotorClient(MONGODB_URI)
+    logger.info("Connecting to MongoDB at %s...", MONGODB_URI.split("@")[-1]) # no credentials in logs
+    app_state["mongodb_client"] = AsyncIOMotorClient(MONGODB_URI, event_listeners=[mongo_command_metrics]) # mongodb_command_* metrics
     app_state["mongodb"] = app_state["mongodb_client"][DB_NAME] # Select DB
-    # Optional: Create indexes (ensure indexes on user email/username for lookups)
-    try:
-        await app_state["mongodb"]["users"].create_index("email", unique=True)
-        await app_state["mongodb"]["users"].create_index("username", unique=True)
-        print(f"Connected to MongoDB! Using database: {DB_NAME}")
-        print("Ensured indexes on 'users' collection (email, username).")
-    except Exception as e:
-         print(f"ERROR setting up indexes: {e}")
+    logger.info("Connected to MongoDB, using database %s", DB_NAME)
+    backend = configure_attachment_storage(app_state["mongodb"]) # local disk or GridFS (ATTACHMENT_STORAGE_BACKEND)
+    logger.info("Attachment storage backend: %s", backend.name)
+    # Indexes are declared in app/core/indexes.py; failures abort startup.
+    if INDEX_RECONCILE_ON_STARTUP:
+        report = await reconcile_indexes(app_state["mongodb"])
+        logger.info("Indexes ensured: created=%s unchanged=%d", report["created"], len(report["unchanged"]))
+        if report["drifted"]:
+            logger.warning("Indexes differ from app/core/indexes.py: %s. Rebuild with: python -m app.core.indexes reconcile", report["drifted"])
+    if INDEX_SELF_CHECK_ON_STARTUP:
+        problems = await verify_query_plans(app_state["mongodb"])
+        if problems:
+            raise RuntimeError("Query plan self-check failed: " + "; ".join(problems))
+        logger.info("Query plan self-check passed.")
 
 
 async def shutdown_db_client():
     """Disconnects from MongoDB on application shutdown."""
     if "mongodb_client" in app_state:
-        print("Disconnecting from MongoDB...")
+        logger.info("Disconnecting from MongoDB...")
         app_state["mongodb_client"].close()
-        print("Disconnected.")
+        logger.info("Disconnected.")
 
 # --- Database Dependency Injector ---
 async def get_db() -> AsyncIOMotorDatabase:
@@ -159,11 +195,8 @@ async def get_db() -> AsyncIOMotorDatabase:
          raise HTTPException(status_code=500, detail="Database connection not available.")
     return app_state["mongodb"]
 
-print("Database setup configured.")
-
 
 # --- 5. Authentication Dependencies & Logic ---
-print("Setting up authentication dependencies...")
 
 async def get_user_from_db(db: AsyncIOMotorDatabase, username: str) -> Optional[UserInDB]:
     """Helper to fetch user from database by username."""
@@ -175,16 +208,30 @@ async def get_user_from_db(db: AsyncIOMotorDatabase, username: str) -> Optional[
         try:
             return UserInDB(**user_doc)
         except Exception as e:
-            print(f"Error parsing user from DB: {e}, Data: {user_doc}")
+            logger.error("Error parsing user %s from DB: %s", username, e) # the document holds the password hash
             return None # Or raise an internal server error
     return None
 
+# --- Authenticated User Cache ---
+# Keyed by token subject (username). Every endpoint that writes a users document must call
+# invalidate_cached_user (register_user does). Changes made outside the API are only picked
+# up once the entry expires, so USER_CACHE_TTL_SECONDS is the revocation bound for those.
+user_cache: TTLCache[UserPublic] = TTLCache(maxsize=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
+def invalidate_cached_user(username: str) -> None:
+    """Call after updating, deactivating or deleting a user so the next request re-reads it."""
+    user_cache.invalidate(username)
+
+def clear_user_cache() -> None:
+    """Drops every cached user (e.g. after bulk user changes)."""
+    user_cache.clear()
+
 async def authenticate_user(db: AsyncIOMotorDatabase, username: str, password: str) -> Optional[UserInDB]:
     """Authenticates a user against the database."""
     user = await get_user_from_db(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
     return user
 
@@ -195,7 +242,7 @@ async def get_current_active_user(
 ) -> UserPublic: # Return the public user model (no hash)
     """
     Dependency to get the current logged-in user.
-    Verifies JWT token and fetches user from DB.
+    Verifies JWT token and fetches user from DB (cached per username, see user_cache).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -206,6 +253,10 @@ async def get_current_active_user(
     if username is None:
         raise credentials_exception
 
+    cached_user = user_cache.get(username)
+    if cached_user is not None:
+        return cached_user
+
     user = await get_user_from_db(db, username=username)
     if user is None:
         raise credentials_exception
@@ -215,19 +266,22 @@ async def get_current_active_user(
     #     raise HTTPException(status_code=400, detail="Inactive user")
 
     # Return the public version of the user model
-    return UserPublic(**user.dict())
-
-print("Authentication dependencies set up.")
+    public_user = UserPublic(**user.dict())
+    user_cache.set(username, public_user)
+    return public_user
 
 
 # --- 6. FastAPI App Instance & Middleware ---
-print("Creating FastAPI app instance...")
+async def bind_route_metrics():
+    """Pre-binds the per-route latency series once every router is included (app/core/metrics.py)."""
+    bind_routes(app.routes)
+
 app = FastAPI(
     title="FutureSelf API",
     description="API for FutureSelf application with integrated auth and DB.",
     version="1.0.0",
-    on_startup=[startup_db_client], # Run DB connection on startup
-    on_shutdown=[shutdown_db_client], # Close DB connection on shutdown
+    on_startup=[startup_db_client, llm_client.start_llm_client, bind_route_metrics], # DB connection + shared LLM client + metric series
+    on_shutdown=[shutdown_db_client, llm_client.close_llm_client, shutdown_password_pool, shutdown_upload_pool, shutdown_thumbnail_pool, shutdown_logging], # Close DB, LLM pool, hash/upload/image workers; flush logs last
 )
 
 # CORS (Cross-Origin Resource Sharing) Middleware
@@ -245,12 +299,16 @@ app.add_middleware(
     allow_methods=["*"], # Allow all methods (GET, POST, etc.)
     allow_headers=["*"], # Allow all headers
 )
-print("CORS middleware added.")
+
+# Caps multipart upload bodies before they are spooled to disk (limits in app/services/attachment_storage.py)
+app.add_middleware(RequestSizeLimitMiddleware)
+
+# Outermost, so latency and in-flight counts include CORS and the size limit (app/core/metrics.py)
+app.add_middleware(MetricsMiddleware)
 
 
 # --- 7. Authentication Router/Endpoints ---
 # (Ideally in routers/auth.py)
-print("Defining authentication routes...")
 auth_router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
 
 @auth_router.post("/token", response_model=Token)
@@ -279,15 +337,7 @@ async def register_user(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Registers a new user."""
-    # Check if user already exists
-    existing_user_email = await db["users"].find_one({"email": user_in.email})
-    if existing_user_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    existing_user_username = await db["users"].find_one({"username": user_in.username})
-    if existing_user_username:
-        raise HTTPException(status_code=400, detail="Username already registered")
-
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     user_id = str(uuid.uuid4()) # Generate a unique ID
 
     user_db_data = user_in.dict()
@@ -296,19 +346,19 @@ async def register_user(
     user_db_data["_id"] = user_id # Set the _id field
     user_db_data["created_at"] = datetime.utcnow()
 
-    # Insert into database
+    # Insert into database; the unique email/username indexes reject duplicates in the same round trip
     try:
         await db["users"].insert_one(user_db_data)
-    except Exception as e: # Catch potential duplicate key errors if index check failed somehow
-        print(f"Error inserting user: {e}")
+    except DuplicateKeyError as e:
+        duplicate_field = next(iter((e.details or {}).get("keyPattern", {})), "email")
+        raise HTTPException(status_code=400, detail=f"{duplicate_field.capitalize()} already registered")
+    except Exception as e:
+        logger.error("Error inserting user: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Could not register user.")
+    invalidate_cached_user(user_in.username) # a same-named user removed out of band may still be cached
 
-    # Return the public representation of the created user
-    created_user = await db["users"].find_one({"_id": user_id})
-    if not created_user:
-         raise HTTPException(status_code=500, detail="Failed to retrieve created user.")
-
-    return UserPublic(**created_user) # Use alias mapping
+    # Return the public representation of the created user (built locally, no re-read)
+    return UserPublic(**user_db_data) # Use alias mapping
 
 
 @auth_router.get("/users/me", response_model=UserPublic)
@@ -319,23 +369,20 @@ async def read_users_me(current_user: UserPublic = Depends(get_current_active_us
 
 # --- Include Auth Router ---
 app.include_router(auth_router)
-print("Authentication routes defined and included.")
 
 
 # --- 8. Feature Routers ---
-print("Importing and including feature routers...")
 try:
     # Ensure these files exist and have routers defined within them
-    from app.routers import conversation, memories
+    from app.routers import conversation, memories, attachments
     app.include_router(conversation.router, prefix="/api/v1")
     app.include_router(memories.router, prefix="/api/v1")
-    print("Included 'conversation' and 'memories' routers.")
+    app.include_router(attachments.router) # full paths: /api/v1/attachments/... and legacy /static/uploads/...
+    logger.debug("Included 'conversation', 'memories' and 'attachments' routers.")
 except ImportError as e:
-    print(f"ERROR: Could not import feature routers: {e}")
-    print("Make sure 'backend/app/routers/conversation.py' and 'memories.py' exist.")
+    logger.error("Could not import feature routers: %s. Make sure 'backend/app/routers/conversation.py' and 'memories.py' exist.", e)
 except AttributeError as e:
-    print(f"ERROR: Could not find '.router' attribute in imported module: {e}")
-    print("Make sure 'conversation.py' and 'memories.py' define an APIRouter named 'router'.")
+    logger.error("Could not find '.router' attribute in imported module: %s. Make sure 'conversation.py' and 'memories.py' define an APIRouter named 'router'.", e)
 
 
 # --- 9. Root Endpoint ---
@@ -344,7 +391,38 @@ async def read_root():
     """API Root Endpoint."""
     return {"message": "Welcome to the FutureSelf API V1"}
 
-print("--- Main.py setup complete. Starting application server... ---")
+# --- 10. Operational Endpoints ---
+async def require_internal_token(authorization: Optional[str] = Header(None)):
+    """Dependency guarding /metrics and /api/v1/internal/* with INTERNAL_API_TOKEN (Prometheus: bearer_token)."""
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode("utf-8"), INTERNAL_API_TOKEN.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid internal API token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_internal_token)])
+async def read_metrics():
+    """Prometheus scrape endpoint (HTTP, MongoDB, LLM and password-pool metrics)."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+internal_router = APIRouter(prefix="/api/v1/internal", tags=["Internal"], dependencies=[Depends(require_internal_token)])
+
+@internal_router.get("/llm-pool")
+async def read_llm_pool_stats():
+    """Connection reuse counters for the shared LLM client."""
+    return llm_client.pool_stats.snapshot()
+
+@internal_router.get("/user-cache")
+async def read_user_cache_stats():
+    """Hit/miss counters for the authenticated-user cache."""
+    return user_cache.stats()
+
+app.include_router(internal_router)
+
+logger.debug("main.py setup complete.")
 
 # Note: When running with uvicorn, it handles the server loop.
 # Example: uvicorn app.main:app --reload --port 8000 --host 0.0.0.0
\ No newline at end of file
@@ -0,0 +1,212 @@
+# backend/app/routers/attachments.py
+
+import os
+import logging
+import mimetypes
+from typing import AsyncIterator, Callable, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from starlette.responses import Response
+
+from app.services.attachment_storage import (
+    LEGACY_UPLOAD_URL_PREFIX, MEMORIES_COLLECTION_NAME, UPLOAD_URL_PREFIX,
+    blob_id_from_url, get_blob_backend, legacy_upload_path, run_in_io_pool, stream_local_file,
+    verify_attachment_signature,
+)
+from app.services.thumbnails import (
+    THUMBNAIL_FORMATS, THUMBNAIL_VARIANTS, derivative_key, is_thumbnailable, preferred_format, schedule_thumbnails,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- REAL Dependency Imports ---
+from ..main import get_db, get_current_active_user
+
+# --- Configuration ---
+# Stored attachment files never change (content-addressed or unique names, atomic rename), so clients may cache them for good.
+ATTACHMENT_CACHE_CONTROL = os.getenv("ATTACHMENT_CACHE_CONTROL", "private, max-age=31536000, immutable")
+# Used while a requested thumbnail is still being generated, so the browser asks again soon.
+ATTACHMENT_FALLBACK_CACHE_CONTROL = "private, max-age=60"
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def _legacy_etag(stat: os.stat_result) -> str:
+    # Strong validator: legacy files are never rewritten in place, so size+mtime identify their bytes.
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+async def _user_owns_attachment(db: AsyncIOMotorDatabase, user_id: str, filename: str, sha256: Optional[str]) -> bool:
+    """
+    Blobs are shared between users, so ownership means one of the user's memories references
+    the URL (covered by the user_id+attachments index). Legacy files carry the owner in their name.
+    """
+    if not sha256:
+        return filename.startswith(f"{user_id}_") and not filename.endswith(".part")
+    match = await db[MEMORIES_COLLECTION_NAME].find_one(
+        {"user_id": user_id, "attachments": {"$in": [f"{UPLOAD_URL_PREFIX}/{filename}", f"{LEGACY_UPLOAD_URL_PREFIX}/{filename}"]}},
+        projection={"_id": 0, "user_id": 1},
+    )
+    return match is not None
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single "bytes=" range into an inclusive (start, end). Returns None when the header
+    should be ignored (other units, multiple ranges, malformed) and raises 416 when unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "": # suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start:
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    if start >= size or size == 0:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+class RangeResponse(Response):
+    """
+    Sends bytes [start, end] of a stored attachment. Files on local disk go out through the ASGI
+    zero-copy extension (sendfile) when the server offers it; everything else (including GridFS
+    blobs) is streamed from `chunks` one piece at a time.
+    """
+
+    def __init__(self, start: int, end: int, status_code: int, headers: dict, media_type: str,
+                 chunks: Callable[[int, int], AsyncIterator[bytes]], file_path: Optional[str] = None,
+                 send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.start = start
+        self.end = end
+        self.chunks = chunks
+        self.file_path = file_path
+        self.send_body = send_body
+        self.headers["content-length"] = str(max(end - start + 1, 0))
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if self.send_body and count > 0:
+            if self.file_path and ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                handle = await run_in_io_pool(open, self.file_path, "rb")
+                try:
+                    await send({"type": ZEROCOPY_EXTENSION, "file": handle, "offset": self.start, "count": count, "more_body": False})
+                finally:
+                    await run_in_io_pool(handle.close)
+                return
+            async for chunk in self.chunks(self.start, self.end):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+router = APIRouter(tags=["Attachments"])
+
+# Browsers load attachments from <img src>/<a href>, which cannot send a Bearer token, so the
+# route also accepts the signed URLs handed out in memory responses (attachment_urls).
+_optional_bearer = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token", auto_error=False)
+
+
+async def attachment_viewer_id(
+    filename: str = Path(..., min_length=1, max_length=255),
+    uid: Optional[str] = Query(None, max_length=64), exp: Optional[int] = Query(None), sig: Optional[str] = Query(None, max_length=128),
+    token: Optional[str] = Depends(_optional_bearer), db: AsyncIOMotorDatabase = Depends(get_db),
+) -> str:
+    """User id from a valid signed URL, else from the Bearer token (401 without either)."""
+    if sig is not None:
+        if uid and exp is not None and verify_attachment_signature(filename, uid, exp, sig):
+            return uid
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Attachment link is invalid or has expired")
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"},
+        )
+    return (await get_current_active_user(token=token, db=db)).id
+
+
+async def serve_attachment(
+    request: Request, filename: str = Path(..., min_length=1, max_length=255),
+    variant: Optional[str] = Query(None, alias="size", description=f"Image thumbnail: one of {sorted(THUMBNAIL_VARIANTS)}."),
+    db: AsyncIOMotorDatabase = Depends(get_db), user_id: str = Depends(attachment_viewer_id),
+):
+    """
+    Serves an attachment referenced by one of the user's memories (Bearer token or signed URL), with Range,
+    ETag/If-None-Match and Cache-Control support. `?size=` returns a resized, EXIF-free
+    WebP/JPEG derivative of an image (negotiated via Accept).
+    """
+    if variant is not None and variant not in THUMBNAIL_VARIANTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown size '{variant}'.")
+    sha256 = blob_id_from_url(filename)
+    if os.path.basename(filename) != filename or not await _user_owns_attachment(db, user_id, filename, sha256):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    cache_control = ATTACHMENT_CACHE_CONTROL
+    extra_headers = {}
+    if sha256:
+        backend = get_blob_backend()
+        key = sha256
+        if variant and is_thumbnailable(filename):
+            fmt = preferred_format(request.headers.get("accept"))
+            extra_headers["Vary"] = "Accept"
+            if await backend.exists(derivative_key(sha256, variant, fmt)):
+                key = derivative_key(sha256, variant, fmt)
+                media_type = THUMBNAIL_FORMATS[fmt][1]
+            else: # not generated yet (or an older upload): serve the original briefly and build it now
+                schedule_thumbnails(sha256) # skipped for blobs that recently failed to render
+                cache_control = ATTACHMENT_FALLBACK_CACHE_CONTROL
+        size = await backend.size(key)
+        etag = f'"{key}"' # content-addressed: the name is a strong validator
+        file_path = backend.local_path(key)
+        chunks = lambda start, end: backend.stream(key, start, end)
+    else:
+        file_path = legacy_upload_path(filename)
+        try:
+            stat = await run_in_io_pool(os.stat, file_path)
+        except FileNotFoundError:
+            stat = None
+        size = stat.st_size if stat else None
+        etag = _legacy_etag(stat) if stat else ""
+        chunks = lambda start, end: stream_local_file(file_path, start, end)
+    if size is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Attachment not found")
+
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", **extra_headers}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    send_body = request.method != "HEAD"
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        return RangeResponse(0, size - 1, status.HTTP_200_OK, headers, media_type, chunks, file_path, send_body)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return RangeResponse(start, end, status.HTTP_206_PARTIAL_CONTENT, headers, media_type, chunks, file_path, send_body)
+
+
+# New uploads are stored as UPLOAD_URL_PREFIX URLs; the legacy prefix keeps older attachment URLs working.
+for _prefix in (UPLOAD_URL_PREFIX, LEGACY_UPLOAD_URL_PREFIX):
+    router.add_api_route(f"{_prefix}/{{filename}}", serve_attachment, methods=["GET", "HEAD"],
+                         summary="Download an attachment", response_class=Response)
@@ -1,11 +1,13 @@
 # backend/app/routers/auth.py
 
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 # Import datetime and timedelta here
 from datetime import datetime, timedelta
 from typing import Annotated, Any
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 # --- App Modules (Using 'app.' absolute imports) ---
 # Use absolute imports starting from the 'app' package
@@ -13,13 +15,15 @@ from bson import ObjectId
 from app.models.user import User, UserCreate, UserInDB, UserPreferences
 from app.core.security import (
     create_access_token,
-    verify_password,
-    get_password_hash
+    verify_password_async,
+    get_password_hash_async
 )
 from app.core.config import settings
 from app.db import get_db, find_document, insert_document
 # --- REMOVED: from ..crud import user as user_crud --- # Keep this removed
 
+logger = logging.getLogger(__name__)
+
 # --- Pydantic Models ---
 from pydantic import BaseModel
 
@@ -42,14 +46,7 @@ async def signup_new_user(
     db: Annotated[Any, Depends(get_db)]
 ):
     """Sign up a new user (Simplified: Uses db functions directly)."""
-    existing_user_dict = await find_document("users", {"email": user_in.email})
-    if existing_user_dict:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="An account with this email already exists.",
-        )
-
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     user_data_for_db = user_in.model_dump(exclude={"password"})
 
     user_to_insert = {
@@ -63,14 +60,17 @@ async def signup_new_user(
         "life_snapshot": None
     }
 
+    # The unique email index rejects duplicates; insert_one fills in _id, so no re-read is needed.
     try:
-        inserted_id_str = await insert_document("users", user_to_insert)
-        new_user_dict = await find_document("users", {"_id": ObjectId(inserted_id_str)})
-        if not new_user_dict:
-             raise HTTPException(status_code=500, detail="Failed to retrieve created user.")
-        created_user = UserInDB(**new_user_dict)
+        await insert_document("users", user_to_insert)
+        created_user = UserInDB(**user_to_insert)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="An account with this email already exists.",
+        )
     except Exception as e:
-        print(f"Error during user creation/retrieval: {e}")
+        logger.error("Error during user creation: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Could not create user account.",
@@ -90,12 +90,12 @@ async def login_for_access_token(
         try:
             user = UserInDB(**user_dict)
         except Exception as model_error:
-             print(f"ERROR converting DB dict to UserInDB: {model_error} - Data: {user_dict}")
+             logger.error("Error converting DB dict to UserInDB for %s: %s", form_data.username, model_error) # no document dump: it holds the password hash
              raise HTTPException(status_code=500, detail="Internal server error processing user data.")
     else:
         user = None
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
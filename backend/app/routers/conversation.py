@@ -1,46 +1,71 @@
-# future-self/backend/app/routers/conversations.py
+# future-self/backend/app/routers/conversation.py
 
 import os
+import json
+import time
 import uuid
+import math
 import asyncio
 import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
 
 # --- CORRECTED IMPORT: Added Query ---
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query
+from fastapi.responses import StreamingResponse
 # --- END CORRECTION ---
 
-from pydantic import BaseModel, Field, VERSION as PYDANTIC_VERSION
-from groq import Groq, AsyncGroq
+from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo import ReturnDocument
+
+from app.core.idempotency import IDEMPOTENCY_HEADER, IDEMPOTENCY_KEY_MAX_LENGTH, mark_applied, request_fingerprint, run_idempotent
+from app.core.metrics import record_llm_call, record_llm_failure, record_llm_first_token
+from app.core.pagination import encode_cursor, keyset_after
+from app.core.responses import DocumentSerializer, FastJSONResponse
+from app.services.llm_client import get_llm_provider
+from app.services.llm_providers import LLMProvider
+from app.services.llm_scheduler import llm_scheduler
+from app.services.memory_index import memory_index
+from app.services.prompt_builder import (
+    COMPLETION_MAX_TOKENS, MEMORY_CONTEXT_PLACEHOLDER, AssembledPrompt, PromptAssembler, prompt_budget_for_model,
+)
 
 # --- Logger ---
 logger = logging.getLogger(__name__)
-# logging.basicConfig(level=logging.INFO) # Configure in main.py
+# Handlers, level and per-logger sampling: app/core/logging_setup.py (configured from main.py)
 
 # --- REAL Dependency Imports ---
 try:
     from ..main import get_db, get_current_active_user, UserPublic
     User = UserPublic
-    logger.info("conversations.py: Successfully imported REAL dependencies from ..main.")
+    logger.info("conversation.py: Successfully imported REAL dependencies from ..main.")
 except ImportError as e:
     logger.critical(
-        f"conversations.py: CRITICAL ERROR - FAILED to import REAL dependencies from ..main: {e}. "
+        f"conversation.py: CRITICAL ERROR - FAILED to import REAL dependencies from ..main: {e}. "
         "This router WILL NOT function with actual DB or Auth. Using placeholders.",
         exc_info=True
     )
     class User(BaseModel): id: str = "placeholder_conv_id"; username: str = "placeholder_conv_user"
     async def get_db() -> AsyncIOMotorDatabase:
-        logger.error("conversations.py: FATAL - Using PLACEHOLDER get_db().")
+        logger.error("conversation.py: FATAL - Using PLACEHOLDER get_db().")
         raise NotImplementedError("Placeholder get_db() called. Real 'get_db' failed to import.")
     async def get_current_active_user() -> User:
-        logger.error("conversations.py: FATAL - Using PLACEHOLDER get_current_active_user().")
+        logger.error("conversation.py: FATAL - Using PLACEHOLDER get_current_active_user().")
         raise NotImplementedError("Placeholder get_current_active_user() called. Real 'get_current_active_user' failed to import.")
 
 # --- Configuration for MongoDB Collections ---
 CONVERSATIONS_COLLECTION_NAME = "conversations_collection"
 MEMORIES_COLLECTION_NAME_FOR_CONTEXT = "futureself"
+# Upper bound on trailing messages loaded from the DB per chat turn; the prompt
+# token budget decides how many of them actually reach the LLM.
+CONVERSATION_HISTORY_WINDOW = int(os.getenv("CONVERSATION_HISTORY_WINDOW", "30"))
+# Characters of the last message included in conversation summaries.
+LAST_MESSAGE_PREVIEW_CHARS = 120
+# Candidate memories retrieved per turn (BM25-ranked); the memory token budget decides how many are used.
+PROMPT_MAX_MEMORIES = int(os.getenv("PROMPT_MAX_MEMORIES", "10"))
+MEMORY_CONTEXT_HEADER = "\nHere are some relevant past memories to consider:\n"
+NO_MEMORIES_TEXT = "User has not recorded specific memories relevant to this discussion yet."
 
 # --- Pydantic Models ---
 class Message(BaseModel):
@@ -65,6 +90,30 @@ class ConversationResponse(ConversationBase):
     messages: List[Message] = []
     class Config: from_attributes = True
 
+class ConversationSummary(BaseModel):
+    id: str
+    title: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    message_count: int = 0
+    last_message_role: Optional[str] = None
+    last_message_preview: Optional[str] = None
+
+class ConversationSummaryPage(BaseModel):
+    items: List[ConversationSummary]
+    next_cursor: Optional[str] = None
+
+# Read paths serialize stored documents directly (app/core/responses.py); output matches response_model.
+# Stored messages already have the Message shape, so they are passed through untouched.
+conversation_serializer = DocumentSerializer(ConversationResponse, sources={"id": "_id"})
+conversation_summary_serializer = DocumentSerializer(ConversationSummary, sources={"id": "_id"})
+
+def conversation_payload(conversation: ConversationInDB) -> dict:
+    """ConversationResponse JSON shape from an in-memory conversation, dumped once without re-validation."""
+    payload = conversation.model_dump(exclude={"id"})
+    payload["id"] = conversation.id
+    return payload
+
 class ConversationCreateRequest(BaseModel):
     initial_message: str
     title: Optional[str] = None
@@ -74,105 +123,131 @@ class SendMessageRequest(BaseModel):
 
 # --- Persona Service with Groq Integration AND MEMORY FETCHING ---
 class PersonaService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(self, db: AsyncIOMotorDatabase, provider: LLMProvider):
         self.db = db
-        
-        # --- !!! HARDCODED API KEY FOR TESTING !!! ---
-        # --- !!! REMOVE THIS AND REVERT AFTER TESTING !!! ---
-        self.groq_api_key = "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" # YOUR HARDCODED KEY
-        logger.warning("!!! conversations.py WARNING: GROQ_API_KEY IS CURRENTLY HARDCODED IN PersonaService FOR TESTING !!!")
-        # --- !!! END OF HARDCODED SECTION !!! ---
-
-        if not self.groq_api_key:
-            logger.critical("GROQ_API_KEY is unexpectedly empty even after hardcoding.")
-            raise ValueError("CRITICAL: GROQ_API_KEY is not configured (hardcoding failed).")
-        
-        logger.info(f"PersonaService: Using hardcoded GROQ_API_KEY: "
-                    f"{self.groq_api_key[:7]}...{self.groq_api_key[-4:]}")
-
-        try:
-            self.groq_client = AsyncGroq(api_key=self.groq_api_key)
-        except Exception as e:
-            logger.error(f"Failed to initialize Groq client with hardcoded key: {e}", exc_info=True)
-            raise RuntimeError(f"Could not initialize Groq client: {e}")
-            
-        self.model_name = os.getenv("GROQ_MODEL_NAME", "llama3-8b-8192") # Still get model from env or default
-        # Or hardcode for test: self.model_name = "llama3-8b-8192"
-        logger.info(f"PersonaService: Using model '{self.model_name}'.")
+        # Configured at startup (LLM_PROVIDER, see app/services/llm_client.py): Groq or the local engine
+        self.provider = provider
+        self.model_name = provider.model_name
+        self.prompt_assembler = PromptAssembler(total_budget=prompt_budget_for_model(self.model_name))
 
 
-    async def _fetch_user_memories_for_context(self, user: User, limit: int = 5) -> str:
-        logger.info(f"Fetching memories for user '{user.id}' from '{MEMORIES_COLLECTION_NAME_FOR_CONTEXT}' collection.")
+    async def _fetch_user_memories_for_context(self, user: User, query: str, limit: int = PROMPT_MAX_MEMORIES) -> List[str]:
+        """Returns formatted memory snippets ranked by relevance to `query` (the prompt budget picks a prefix)."""
+        logger.info("Fetching memories for user '%s' from '%s' collection.", user.id, MEMORIES_COLLECTION_NAME_FOR_CONTEXT)
         if not isinstance(self.db, AsyncIOMotorDatabase): # Check if we have a real DB object
-            logger.warning(f"PersonaService._fetch_user_memories_for_context using non-DB object (type: {type(self.db)}). Likely placeholder. Returning no memory context.")
-            return "No specific memories available for context (using placeholder database)."
+            logger.warning("PersonaService._fetch_user_memories_for_context using non-DB object (type: %s). Likely placeholder. Returning no memory context.", type(self.db))
+            return []
 
         memories_collection: AsyncIOMotorCollection = self.db[MEMORIES_COLLECTION_NAME_FOR_CONTEXT]
         try:
-            cursor = memories_collection.find({"user_id": user.id}).sort("created_at", -1).limit(limit)
-            user_memories_docs = await cursor.to_list(length=limit)
-            if not user_memories_docs:
-                logger.info(f"No memories found for user '{user.id}' in '{MEMORIES_COLLECTION_NAME_FOR_CONTEXT}'.")
-                return "User has not recorded specific memories relevant to this discussion yet."
+            ranked_memories = await memory_index.search(memories_collection, user.id, query, limit)
+            if not ranked_memories:
+                logger.info("No memories found for user '%s' in '%s'.", user.id, MEMORIES_COLLECTION_NAME_FOR_CONTEXT)
+                return []
             formatted_memories = []
-            for i, mem_doc in enumerate(user_memories_docs):
-                title = mem_doc.get("title", "Untitled Memory")
-                description = mem_doc.get("description", "")
-                description_snippet = (description[:100] + '...') if len(description) > 103 else description
-                tags = ", ".join(mem_doc.get("tags", []))
+            for i, memory in enumerate(ranked_memories):
+                tags = ", ".join(memory.tags)
                 formatted_memories.append(
-                    f"  Memory {i+1}: '{title}' (Tags: {tags if tags else 'None'}). Snippet: \"{description_snippet}\""
+                    f"  Memory {i+1}: '{memory.title}' (Tags: {tags if tags else 'None'}). Snippet: \"{memory.description_snippet}\""
                 )
-            memory_summary = "\nHere are some relevant past memories to consider:\n" + "\n".join(formatted_memories)
-            logger.info(f"Formatted memory context for user '{user.id}': {memory_summary[:200]}...")
-            return memory_summary
+            return formatted_memories
         except Exception as e:
-            logger.error(f"Error fetching memories for user '{user.id}': {e}", exc_info=True)
-            return "There was an issue recalling specific memories at this time."
+            logger.error("Error fetching memories for user '%s': %s", user.id, e, exc_info=True)
+            return []
 
-    async def _generate_response(self, user: User, conversation_history: List[Message]) -> str:
-        memory_context = await self._fetch_user_memories_for_context(user)
-        system_prompt = f"""You are an AI simulating the 60-year-old version of the user '{user.username}'.
+    async def _build_prompt(self, user: User, conversation_history: List[Message]) -> AssembledPrompt:
+        latest_user_message = next((msg.content for msg in reversed(conversation_history) if msg.role == "user"), "")
+        memory_snippets = await self._fetch_user_memories_for_context(user, query=latest_user_message)
+        system_template = f"""You are an AI simulating the 60-year-old version of the user '{user.username}'.
 Act as a wise, reflective, and kind future self, offering perspective based on a lifetime of experience.
 Your insights should be informed by the user's actual stored memories and profile, provided below if available.
 Do NOT give medical, legal, or financial advice. Focus on emotional insight, long-term perspective, and gentle guidance.
 Keep your persona consistent. Refer to the user in the second person (you).
 
 User's Past Memories Context:
-{memory_context}
+{MEMORY_CONTEXT_PLACEHOLDER}
 
 VERY IMPORTANT: Do not provide medical diagnoses or treatment recommendations. Acknowledge feelings but redirect to professionals for health concerns.
 """
-        messages_for_api = [{"role": "system", "content": system_prompt}]
-        for msg in conversation_history:
-            role = "assistant" if msg.role == "future_self" else msg.role
-            messages_for_api.append({"role": role, "content": msg.content})
-        
-        logger.debug(f"Calling Groq API for user '{user.id}'. Model: {self.model_name}. System prompt includes memory context.")
-        try:
-            chat_completion = await self.groq_client.chat.completions.create(
-                messages=messages_for_api, model=self.model_name, temperature=0.7, max_tokens=450,
-            )
-            response_content = chat_completion.choices[0].message.content.strip()
-            return response_content
-        except Exception as e:
-            error_message = f"Error with AI service (Groq)."; status_code_to_raise = status.HTTP_503_SERVICE_UNAVAILABLE
-            if hasattr(e, 'status_code'): status_code_to_raise = e.status_code; error_message = f"AI service error (Status {e.status_code})"
-            if hasattr(e, 'message'): error_message += f": {e.message}"
-            elif hasattr(e, 'body') and e.body and 'error' in e.body: error_message += f": {e.body['error'].get('message', str(e.body['error']))}"
-            else: error_message += f": {str(e)}"
-            if hasattr(e, 'status_code') and e.status_code == 401: logger.error(f"CRITICAL GROQ API ERROR: 401. Detail: {error_message}"); error_message = "AI service authentication failed: Invalid API Key."
-            logger.error(f"Groq API call failed: {error_message}", exc_info=True)
-            raise HTTPException(status_code=status_code_to_raise if not (hasattr(e, 'status_code') and e.status_code == 401) else status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_message)
+        conversation = [
+            {"role": "assistant" if msg.role == "future_self" else msg.role, "content": msg.content}
+            for msg in conversation_history
+        ]
+        prompt = self.prompt_assembler.assemble(
+            system_template, memory_snippets, conversation,
+            memory_header=MEMORY_CONTEXT_HEADER, no_memories_text=NO_MEMORIES_TEXT,
+        )
+        logger.debug(
+            "Prompt for user '%s': ~%d tokens (budget %d), %d/%d memories, %d/%d history messages.",
+            user.id, prompt.prompt_tokens, self.prompt_assembler.total_budget, prompt.memories_used,
+            len(memory_snippets), prompt.history_messages_used, len(conversation) - 1,
+        )
+        return prompt
+
+    def _raise_llm_error(self, e: Exception):
+        error_message = f"Error with AI service ({self.provider.name})."; status_code_to_raise = status.HTTP_503_SERVICE_UNAVAILABLE
+        if hasattr(e, 'status_code'): status_code_to_raise = e.status_code; error_message = f"AI service error (Status {e.status_code})"
+        if hasattr(e, 'message'): error_message += f": {e.message}"
+        elif hasattr(e, 'body') and e.body and 'error' in e.body: error_message += f": {e.body['error'].get('message', str(e.body['error']))}"
+        else: error_message += f": {str(e)}"
+        if hasattr(e, 'status_code') and e.status_code == 401: logger.error("CRITICAL GROQ API ERROR: 401. Detail: %s", error_message); error_message = "AI service authentication failed: Invalid API Key."
+        logger.error("LLM call (%s) failed: %s", self.provider.name, error_message, exc_info=True)
+        headers = {"Retry-After": str(math.ceil(e.retry_after))} if getattr(e, 'retry_after', None) else None # circuit open
+        raise HTTPException(status_code=status_code_to_raise if not (hasattr(e, 'status_code') and e.status_code == 401) else status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error_message, headers=headers)
+
+    async def _generate_response(self, user: User, conversation_history: List[Message]) -> str:
+        prompt = await self._build_prompt(user, conversation_history)
+        logger.debug("Calling %s LLM for user '%s'. Model: %s. System prompt includes memory context.", self.provider.name, user.id, self.model_name)
+        # Fair-share slot (app/services/llm_scheduler.py); raises 429 when the user's turn is too far off
+        async with llm_scheduler.slot(user.id, cost=prompt.prompt_tokens + COMPLETION_MAX_TOKENS):
+            started = time.perf_counter()
+            try:
+                chat_completion = await self.provider.complete(prompt.messages, max_tokens=COMPLETION_MAX_TOKENS, temperature=0.7)
+                record_llm_call("complete", started, chat_completion.usage)
+                response_content = chat_completion.content.strip()
+                return response_content
+            except Exception as e:
+                record_llm_failure("complete")
+                self._raise_llm_error(e)
+
+    async def _stream_response(self, user: User, conversation_history: List[Message]) -> AsyncIterator[str]:
+        """Yields completion tokens as the provider produces them."""
+        prompt = await self._build_prompt(user, conversation_history)
+        logger.debug("Streaming %s LLM call for user '%s'. Model: %s.", self.provider.name, user.id, self.model_name)
+        # The slot is held until the last token (or until the client goes away and the generator is closed)
+        async with llm_scheduler.slot(user.id, cost=prompt.prompt_tokens + COMPLETION_MAX_TOKENS):
+            started = time.perf_counter()
+            first_token_seen = False
+            try:
+                stream = await self.provider.stream(prompt.messages, max_tokens=COMPLETION_MAX_TOKENS, temperature=0.7)
+                async for token in stream:
+                    if not first_token_seen:
+                        first_token_seen = True
+                        record_llm_first_token(started)
+                    yield token
+            except Exception as e:
+                record_llm_failure("stream")
+                self._raise_llm_error(e)
+            record_llm_call("stream", started, stream.usage)
 
     async def get_initial_response(self, user: User, first_message_content: str) -> str:
         initial_history = [Message(role="user", content=first_message_content)]
         return await self._generate_response(user, initial_history)
 
     async def get_next_response(self, user: User, conversation_history: List[Message]) -> str:
-        max_history_messages = 10
-        truncated_history = conversation_history[-max_history_messages:] if len(conversation_history) > max_history_messages else conversation_history
-        return await self._generate_response(user, truncated_history)
+        # The prompt assembler trims the history to the token budget.
+        return await self._generate_response(user, conversation_history)
+
+    def stream_initial_response(self, user: User, first_message_content: str) -> AsyncIterator[str]:
+        return self._stream_response(user, [Message(role="user", content=first_message_content)])
+
+    def stream_next_response(self, user: User, conversation_history: List[Message]) -> AsyncIterator[str]:
+        return self._stream_response(user, conversation_history)
+
+def get_persona_service(
+    db: AsyncIOMotorDatabase = Depends(get_db), provider: LLMProvider = Depends(get_llm_provider)
+) -> PersonaService:
+    return PersonaService(db, provider)
 
 # --- FastAPI Router ---
 router = APIRouter(
@@ -183,7 +258,7 @@ router = APIRouter(
 
 # --- Database Interaction Helpers for Conversations ---
 async def db_create_conversation(db: AsyncIOMotorDatabase, conversation: ConversationInDB) -> ConversationInDB:
-    logger.info(f"Creating new conversation '{conversation.id}' for user '{conversation.user_id}' in DB.")
+    logger.info("Creating new conversation '%s' for user '%s' in DB.", conversation.id, conversation.user_id)
     if not isinstance(db, AsyncIOMotorDatabase):
         logger.error("db_create_conversation: `db` is not AsyncIOMotorDatabase. Placeholder active.")
         raise HTTPException(status_code=500, detail="DB service misconfigured for conversation creation.")
@@ -192,32 +267,34 @@ async def db_create_conversation(db: AsyncIOMotorDatabase, conversation: Convers
         doc_to_insert = conversation.model_dump(by_alias=True) if hasattr(conversation, "model_dump") else conversation.dict(by_alias=True)
         insert_result = await conversations_collection.insert_one(doc_to_insert)
         if not insert_result.inserted_id:
-            logger.error(f"Failed to insert conversation '{conversation.id}' into DB.")
+            logger.error("Failed to insert conversation '%s' into DB.", conversation.id)
             raise HTTPException(status_code=500, detail="Could not save new conversation.")
-        created_doc = await conversations_collection.find_one({"_id": insert_result.inserted_id})
-        if not created_doc:
-            logger.error(f"Failed to retrieve conversation '{conversation.id}' after insert.")
-            raise HTTPException(status_code=500, detail="Error retrieving conversation post-creation.")
-        return ConversationInDB(**created_doc)
+        # The stored document is exactly what we inserted, so no re-read is needed.
+        return conversation
+    except HTTPException: raise
     except Exception as e:
-        logger.error(f"DB error creating conversation '{conversation.id}': {e}", exc_info=True)
+        logger.error("DB error creating conversation '%s': %s", conversation.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="DB error during conversation creation.")
 
-async def db_get_conversation(db: AsyncIOMotorDatabase, conversation_id: str, user_id: str) -> Optional[ConversationInDB]:
-    logger.debug(f"Fetching conversation '{conversation_id}' for user '{user_id}'.")
+async def db_get_conversation_document(db: AsyncIOMotorDatabase, conversation_id: str, user_id: str) -> Optional[dict]:
+    """The stored conversation document as-is (no model validation)."""
+    logger.debug("Fetching conversation '%s' for user '%s'.", conversation_id, user_id)
     if not isinstance(db, AsyncIOMotorDatabase):
         logger.error("db_get_conversation: `db` is not AsyncIOMotorDatabase. Placeholder active.")
         return None
     try:
         conversations_collection: AsyncIOMotorCollection = db[CONVERSATIONS_COLLECTION_NAME]
-        conv_doc = await conversations_collection.find_one({"_id": conversation_id, "user_id": user_id})
-        return ConversationInDB(**conv_doc) if conv_doc else None
+        return await conversations_collection.find_one({"_id": conversation_id, "user_id": user_id})
     except Exception as e:
-        logger.error(f"DB error fetching conversation '{conversation_id}': {e}", exc_info=True)
+        logger.error("DB error fetching conversation '%s': %s", conversation_id, e, exc_info=True)
         return None
 
+async def db_get_conversation(db: AsyncIOMotorDatabase, conversation_id: str, user_id: str) -> Optional[ConversationInDB]:
+    conv_doc = await db_get_conversation_document(db, conversation_id, user_id)
+    return ConversationInDB(**conv_doc) if conv_doc else None
+
 async def db_update_conversation(db: AsyncIOMotorDatabase, conversation: ConversationInDB) -> ConversationInDB:
-    logger.info(f"Updating conversation '{conversation.id}' for user '{conversation.user_id}'.")
+    logger.info("Updating conversation '%s' for user '%s'.", conversation.id, conversation.user_id)
     if not isinstance(db, AsyncIOMotorDatabase):
         logger.error("db_update_conversation: `db` is not AsyncIOMotorDatabase. Placeholder active.")
         raise HTTPException(status_code=500, detail="DB service misconfigured for conversation update.")
@@ -229,86 +306,325 @@ async def db_update_conversation(db: AsyncIOMotorDatabase, conversation: Convers
             {"_id": conversation.id, "user_id": conversation.user_id}, doc_to_update
         )
         if update_result.matched_count == 0:
-            logger.warning(f"Conversation '{conversation.id}' not found or user mismatch during update.")
+            logger.warning("Conversation '%s' not found or user mismatch during update.", conversation.id)
             raise HTTPException(status_code=404, detail="Conversation not found or access denied for update.")
-        updated_doc = await conversations_collection.find_one({"_id": conversation.id})
-        if not updated_doc:
-            logger.error(f"Failed to retrieve conversation '{conversation.id}' after update.")
-            raise HTTPException(status_code=500, detail="Error retrieving conversation post-update.")
-        return ConversationInDB(**updated_doc)
+        # The stored document is exactly what we wrote, so no re-read is needed.
+        return conversation
+    except HTTPException: raise
     except Exception as e:
-        logger.error(f"DB error updating conversation '{conversation.id}': {e}", exc_info=True)
+        logger.error("DB error updating conversation '%s': %s", conversation.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="DB error during conversation update.")
 
+async def db_get_conversation_tail(db: AsyncIOMotorDatabase, conversation_id: str, user_id: str, window: int) -> Optional[ConversationInDB]:
+    """Fetches a conversation with only its last `window` messages, sliced server-side."""
+    logger.debug("Fetching last %s messages of conversation '%s' for user '%s'.", window, conversation_id, user_id)
+    if not isinstance(db, AsyncIOMotorDatabase):
+        logger.error("db_get_conversation_tail: `db` is not AsyncIOMotorDatabase. Placeholder active.")
+        return None
+    try:
+        conversations_collection: AsyncIOMotorCollection = db[CONVERSATIONS_COLLECTION_NAME]
+        conv_doc = await conversations_collection.find_one(
+            {"_id": conversation_id, "user_id": user_id}, {"messages": {"$slice": -window}}
+        )
+        return ConversationInDB(**conv_doc) if conv_doc else None
+    except Exception as e:
+        logger.error("DB error fetching tail of conversation '%s': %s", conversation_id, e, exc_info=True)
+        return None
+
+async def db_append_messages(
+    db: AsyncIOMotorDatabase, conversation_id: str, user_id: str, messages: List[Message],
+    message_window: int = CONVERSATION_HISTORY_WINDOW,
+) -> ConversationInDB:
+    """
+    Atomically appends `messages` and bumps `updated_at` in a single round trip.
+    Concurrent turns cannot overwrite each other since nothing is replaced.
+    Only the last `message_window` messages are returned, so the reply does not
+    grow with the conversation.
+    """
+    logger.info("Appending %s message(s) to conversation '%s' for user '%s'.", len(messages), conversation_id, user_id)
+    if not isinstance(db, AsyncIOMotorDatabase):
+        logger.error("db_append_messages: `db` is not AsyncIOMotorDatabase. Placeholder active.")
+        raise HTTPException(status_code=500, detail="DB service misconfigured for conversation update.")
+    try:
+        conversations_collection: AsyncIOMotorCollection = db[CONVERSATIONS_COLLECTION_NAME]
+        updated_doc = await conversations_collection.find_one_and_update(
+            {"_id": conversation_id, "user_id": user_id},
+            {
+                "$push": {"messages": {"$each": [msg.model_dump() for msg in messages]}},
+                "$set": {"updated_at": datetime.utcnow()},
+            },
+            projection={"messages": {"$slice": -message_window}},
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        logger.error("DB error appending to conversation '%s': %s", conversation_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail="DB error during conversation update.")
+    if not updated_doc:
+        logger.warning("Conversation '%s' not found or user mismatch during append.", conversation_id)
+        raise HTTPException(status_code=404, detail="Conversation not found or access denied for update.")
+    return ConversationInDB(**updated_doc)
+
 # --- API Endpoints ---
 @router.post("/conversations", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED, summary="Start a new conversation")
 async def start_new_conversation(
     request_body: ConversationCreateRequest,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user),
+    persona_service: PersonaService = Depends(get_persona_service),
 ):
-    logger.info(f"API: User '{current_user.id}' starting new conversation. Title: '{request_body.title}'.")
-    try:
-        persona_service = PersonaService(db)
-    except ValueError as e: raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
-    except RuntimeError as e: raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    logger.info("API: User '%s' starting new conversation. Title: '%s'.", current_user.id, request_body.title)
+
+    async def create_conversation() -> FastJSONResponse:
+        user_message = Message(role="user", content=request_body.initial_message)
+        conversation_id = str(uuid.uuid4())
+        new_conv_data = ConversationInDB(
+            _id=conversation_id, user_id=current_user.id, messages=[user_message],
+            title=request_body.title or f"Conversation {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
+        )
+        try:
+            ai_response_content = await persona_service.get_initial_response(user=current_user, first_message_content=user_message.content)
+        except HTTPException: raise
+        except Exception as e:
+            logger.error("API: Unhandled error getting initial AI response: %s", e, exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate initial AI response.")
+        ai_message = Message(role="future_self", content=ai_response_content)
+        new_conv_data.messages.append(ai_message)
+        new_conv_data.updated_at = ai_message.timestamp
+        created_conversation_in_db = await db_create_conversation(db, new_conv_data)
+        mark_applied()
+        return FastJSONResponse(conversation_payload(created_conversation_in_db), status_code=status.HTTP_201_CREATED)
+
+    # A retried request with the same Idempotency-Key gets the first reply instead of a second completion
+    return await run_idempotent(
+        db, idempotency_key, current_user.id, "POST /conversations",
+        request_fingerprint(request_body.model_dump()), create_conversation,
+    )
 
-    user_message = Message(role="user", content=request_body.initial_message)
-    conversation_id = str(uuid.uuid4())
-    new_conv_data = ConversationInDB(
-        _id=conversation_id, user_id=current_user.id, messages=[user_message],
-        title=request_body.title or f"Conversation {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
+@router.post("/conversations/{conversation_id}/messages", response_model=ConversationResponse, summary="Send a message")
+async def send_message_to_conversation(
+    conversation_id: str, request_body: SendMessageRequest,
+    message_window: int = Query(
+        CONVERSATION_HISTORY_WINDOW, ge=1, le=CONVERSATION_HISTORY_WINDOW,
+        description="Only return the last N messages; GET /conversations/{conversation_id} returns the full conversation.",
+    ),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
+    db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user),
+    persona_service: PersonaService = Depends(get_persona_service),
+):
+    logger.info("API: User '%s' sending message to conversation '%s'.", current_user.id, conversation_id)
+
+    async def append_turn() -> FastJSONResponse:
+        existing_conversation_in_db = await db_get_conversation_tail(db, conversation_id, current_user.id, CONVERSATION_HISTORY_WINDOW)
+        if not existing_conversation_in_db:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found or access denied.")
+        user_message = Message(role="user", content=request_body.content)
+        conversation_history = existing_conversation_in_db.messages + [user_message]
+        try:
+            ai_response_content = await persona_service.get_next_response(user=current_user, conversation_history=conversation_history)
+        except HTTPException: raise
+        except Exception as e:
+            logger.error("API: Unhandled error getting next AI response for conv '%s': %s", conversation_id, e, exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate AI response.")
+        ai_message = Message(role="future_self", content=ai_response_content)
+        updated_conversation_in_db = await db_append_messages(
+            db, conversation_id, current_user.id, [user_message, ai_message], message_window=message_window
+        )
+        mark_applied()
+        return FastJSONResponse(conversation_payload(updated_conversation_in_db))
+
+    # Keyed per conversation; message_window only shapes the response, so it is not part of the fingerprint
+    return await run_idempotent(
+        db, idempotency_key, current_user.id, f"POST /conversations/{conversation_id}/messages",
+        request_fingerprint(request_body.model_dump()), append_turn,
     )
+
+# --- Streaming (Server-Sent Events) ---
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _open_token_stream(token_stream: AsyncIterator[str]) -> Optional[str]:
+    """
+    Pulls the first token before the response starts, so upstream failures
+    (auth, rate limits, connection errors) still surface as a proper HTTP status.
+    """
     try:
-        ai_response_content = await persona_service.get_initial_response(user=current_user, first_message_content=user_message.content)
+        return await anext(token_stream)
+    except StopAsyncIteration:
+        return None
     except HTTPException: raise
     except Exception as e:
-        logger.error(f"API: Unhandled error getting initial AI response: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate initial AI response.")
-    ai_message = Message(role="future_self", content=ai_response_content)
-    new_conv_data.messages.append(ai_message)
-    new_conv_data.updated_at = ai_message.timestamp
-    created_conversation_in_db = await db_create_conversation(db, new_conv_data)
-    return ConversationResponse(id=created_conversation_in_db.id, **created_conversation_in_db.model_dump(exclude={"id"}))
+        logger.error("API: Unhandled error opening AI response stream: %s", e, exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate AI response.")
 
-@router.post("/conversations/{conversation_id}/messages", response_model=ConversationResponse, summary="Send a message")
-async def send_message_to_conversation(
+async def _finish_interrupted_turn(
+    conversation_id: str, token_stream: AsyncIterator[str],
+    persist: Callable[[Optional[Message]], Awaitable[ConversationInDB]], ai_message: Optional[Message],
+) -> None:
+    try:
+        await token_stream.aclose() # frees the LLM scheduler slot now rather than at garbage collection
+    except Exception as e:
+        logger.warning("API: Closing AI response stream for conv '%s' failed: %s", conversation_id, e)
+    try:
+        await persist(ai_message)
+    except Exception as e:
+        logger.error("API: Could not save interrupted turn for conv '%s': %s", conversation_id, e, exc_info=True)
+
+async def _stream_turn_events(
+    conversation_id: str, token_stream: AsyncIterator[str], first_token: Optional[str],
+    persist: Callable[[Optional[Message]], Awaitable[ConversationInDB]],
+) -> AsyncIterator[str]:
+    """
+    Forwards tokens as SSE, then persists the user message and the reply once the stream ends.
+    If the client disconnects or the provider fails mid-reply, the user message and whatever
+    part of the reply arrived are still saved (shielded, so the cancellation cannot abort it).
+    """
+    yield _sse_event("meta", {"conversation_id": conversation_id})
+    parts: List[str] = []
+    error_event: Optional[str] = None
+    completed = False
+    try:
+        if first_token:
+            parts.append(first_token)
+            yield _sse_event("token", {"content": first_token})
+        async for token in token_stream:
+            parts.append(token)
+            yield _sse_event("token", {"content": token})
+        completed = True
+    except HTTPException as e:
+        error_event = _sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+    except Exception as e:
+        logger.error("API: AI response stream for conv '%s' failed: %s", conversation_id, e, exc_info=True)
+        error_event = _sse_event("error", {"status_code": 500, "detail": "Failed to generate AI response."})
+    finally:
+        if not completed:
+            partial = "".join(parts).strip()
+            partial_message = Message(role="future_self", content=partial) if partial else None
+            try:
+                await asyncio.shield(_finish_interrupted_turn(conversation_id, token_stream, persist, partial_message))
+            except asyncio.CancelledError:
+                pass # the shielded save keeps running; the generator still ends with the original exception
+    if error_event:
+        yield error_event; return
+
+    ai_message = Message(role="future_self", content="".join(parts).strip())
+    try:
+        await persist(ai_message)
+    except HTTPException as e:
+        yield _sse_event("error", {"status_code": e.status_code, "detail": e.detail}); return
+    yield _sse_event("done", {"conversation_id": conversation_id, "message": ai_message.model_dump(mode="json")})
+
+@router.post("/conversations/stream", summary="Start a new conversation, streaming the reply as SSE")
+async def start_new_conversation_stream(
+    request_body: ConversationCreateRequest,
+    db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user),
+    persona_service: PersonaService = Depends(get_persona_service),
+):
+    logger.info("API: User '%s' starting new streamed conversation. Title: '%s'.", current_user.id, request_body.title)
+
+    user_message = Message(role="user", content=request_body.initial_message)
+    conversation_id = str(uuid.uuid4())
+    title = request_body.title or f"Conversation {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}"
+    token_stream = persona_service.stream_initial_response(user=current_user, first_message_content=user_message.content)
+    first_token = await _open_token_stream(token_stream)
+
+    async def persist(ai_message: Optional[Message]) -> ConversationInDB:
+        messages = [user_message, ai_message] if ai_message else [user_message]
+        new_conv_data = ConversationInDB(
+            _id=conversation_id, user_id=current_user.id, messages=messages,
+            title=title, updated_at=messages[-1].timestamp,
+        )
+        return await db_create_conversation(db, new_conv_data)
+
+    return StreamingResponse(
+        _stream_turn_events(conversation_id, token_stream, first_token, persist),
+        media_type="text/event-stream", headers=SSE_HEADERS, status_code=status.HTTP_201_CREATED,
+    )
+
+@router.post("/conversations/{conversation_id}/messages/stream", summary="Send a message, streaming the reply as SSE")
+async def send_message_to_conversation_stream(
     conversation_id: str, request_body: SendMessageRequest,
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user),
+    persona_service: PersonaService = Depends(get_persona_service),
 ):
-    logger.info(f"API: User '{current_user.id}' sending message to conversation '{conversation_id}'.")
-    existing_conversation_in_db = await db_get_conversation(db, conversation_id, current_user.id)
+    logger.info("API: User '%s' streaming message to conversation '%s'.", current_user.id, conversation_id)
+    existing_conversation_in_db = await db_get_conversation_tail(db, conversation_id, current_user.id, CONVERSATION_HISTORY_WINDOW)
     if not existing_conversation_in_db:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found or access denied.")
-    try: persona_service = PersonaService(db)
-    except ValueError as e: raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
-    except RuntimeError as e: raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     user_message = Message(role="user", content=request_body.content)
-    existing_conversation_in_db.messages.append(user_message)
+    token_stream = persona_service.stream_next_response(
+        user=current_user, conversation_history=existing_conversation_in_db.messages + [user_message]
+    )
+    first_token = await _open_token_stream(token_stream)
+
+    async def persist(ai_message: Optional[Message]) -> ConversationInDB:
+        messages = [user_message, ai_message] if ai_message else [user_message]
+        return await db_append_messages(db, conversation_id, current_user.id, messages, message_window=1)
+
+    return StreamingResponse(
+        _stream_turn_events(conversation_id, token_stream, first_token, persist),
+        media_type="text/event-stream", headers=SSE_HEADERS,
+    )
+
+# Declared before /conversations/{conversation_id} so "summaries" is not taken as an id.
+@router.get("/conversations/summaries", response_model=ConversationSummaryPage, summary="List conversation summaries (cursor-paginated)")
+async def list_conversation_summaries(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
+):
+    """
+    Sidebar listing: id, title, timestamps, message count and a last-message preview,
+    newest first. Messages are projected away server-side and pages are keyset seeks.
+    """
+    logger.debug("Listing conversation summaries for user '%s', limit=%s, cursor=%s", current_user.id, limit, 'yes' if cursor else 'no')
+    if not isinstance(db, AsyncIOMotorDatabase):
+        logger.error("list_conversation_summaries: `db` is not AsyncIOMotorDatabase. Placeholder active.")
+        return ConversationSummaryPage(items=[])
+    match = {"user_id": current_user.id}
+    if cursor:
+        match.update(keyset_after("updated_at", cursor))
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"updated_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {
+            "title": 1, "created_at": 1, "updated_at": 1,
+            "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+            "last_message": {"$arrayElemAt": [{"$ifNull": ["$messages", []]}, -1]},
+        }},
+        {"$project": {
+            "title": 1, "created_at": 1, "updated_at": 1, "message_count": 1,
+            "last_message_role": "$last_message.role",
+            "last_message_preview": {"$substrCP": [{"$ifNull": ["$last_message.content", ""]}, 0, LAST_MESSAGE_PREVIEW_CHARS]},
+        }},
+    ]
     try:
-        ai_response_content = await persona_service.get_next_response(user=current_user, conversation_history=existing_conversation_in_db.messages)
-    except HTTPException: raise
+        conversations_collection: AsyncIOMotorCollection = db[CONVERSATIONS_COLLECTION_NAME]
+        docs = await conversations_collection.aggregate(pipeline).to_list(length=limit + 1)
     except Exception as e:
-        logger.error(f"API: Unhandled error getting next AI response for conv '{conversation_id}': {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to generate AI response.")
-    ai_message = Message(role="future_self", content=ai_response_content)
-    existing_conversation_in_db.messages.append(ai_message)
-    updated_conversation_in_db = await db_update_conversation(db, existing_conversation_in_db)
-    return ConversationResponse(id=updated_conversation_in_db.id, **updated_conversation_in_db.model_dump(exclude={"id"}))
+        logger.error("DB error listing conversation summaries for user '%s': %s", current_user.id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Error retrieving conversations.")
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1]["updated_at"], docs[-1]["_id"]) if has_more else None
+    return FastJSONResponse({"items": conversation_summary_serializer.many(docs), "next_cursor": next_cursor})
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse, summary="Get a specific conversation")
 async def get_conversation_details(
     conversation_id: str, db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    conv_in_db = await db_get_conversation(db, conversation_id, current_user.id)
-    if not conv_in_db: raise HTTPException(status_code=404, detail="Conversation not found or access denied.")
-    return ConversationResponse(id=conv_in_db.id, **conv_in_db.model_dump(exclude={"id"}))
+    conv_doc = await db_get_conversation_document(db, conversation_id, current_user.id)
+    if not conv_doc: raise HTTPException(status_code=404, detail="Conversation not found or access denied.")
+    return FastJSONResponse(conversation_serializer.one(conv_doc))
 
 @router.get("/conversations", response_model=List[ConversationResponse], summary="List user's conversations")
 async def list_conversations(
     skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100), # Query was missing import
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    logger.debug(f"Listing conversations for user '{current_user.id}', skip={skip}, limit={limit}")
+    logger.debug("Listing conversations for user '%s', skip=%s, limit=%s", current_user.id, skip, limit)
     if not isinstance(db, AsyncIOMotorDatabase):
         logger.error("list_conversations: `db` is not AsyncIOMotorDatabase. Placeholder active.")
         return []
@@ -316,11 +632,7 @@ async def list_conversations(
         conversations_collection: AsyncIOMotorCollection = db[CONVERSATIONS_COLLECTION_NAME]
         cursor = conversations_collection.find({"user_id": current_user.id}).sort("updated_at", -1).skip(skip).limit(limit)
         db_convs = await cursor.to_list(length=limit)
-        response_list = [
-            ConversationResponse(id=conv_doc["_id"], **{k:v for k,v in conv_doc.items() if k != "_id"}) 
-            for conv_doc in db_convs
-        ]
-        return response_list
+        return FastJSONResponse(conversation_serializer.many(db_convs))
     except Exception as e:
-        logger.error(f"DB error listing conversations for user '{current_user.id}': {e}", exc_info=True)
+        logger.error("DB error listing conversations for user '%s': %s", current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Error retrieving conversations.")
\ No newline at end of file
@@ -7,13 +7,21 @@ import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Path, Query, Body, Header
 from fastapi import Form, File, UploadFile
 from pydantic import BaseModel, Field, EmailStr
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo import ReturnDocument
+
+from app.core.idempotency import IDEMPOTENCY_HEADER, IDEMPOTENCY_KEY_MAX_LENGTH, mark_applied, request_fingerprint, run_idempotent
+from app.core.pagination import encode_cursor, keyset_after
+from app.core.responses import DocumentSerializer, FastJSONResponse, dumps
+from app.services.memory_index import memory_index
+from app.services.attachment_storage import save_upload, save_uploads, release_attachments, collect_garbage, sign_attachment_url
+from app.services.thumbnails import is_thumbnailable, schedule_thumbnails
 
 logger = logging.getLogger(__name__)
-# Ensure logging is configured in main.py, e.g., logging.basicConfig(level=logging.DEBUG)
+# Handlers, level and per-logger sampling: app/core/logging_setup.py (configured from main.py)
 
 # --- REAL Dependency Imports (CRITICAL - Ensure this works) ---
 User = None
@@ -72,8 +80,27 @@ class Memory(MemoryBase):
     created_at: datetime = Field(...)
     updated_at: datetime = Field(...)
     attachments: List[str] = Field(default_factory=list)
+    # Signed, expiring download URLs for `attachments` (same order), usable from <img>/<a> without a token.
+    attachment_urls: List[str] = Field(default_factory=list)
     class Config: from_attributes = True; populate_by_name = True
 
+class MemoryPage(BaseModel):
+    items: List[Memory]
+    next_cursor: Optional[str] = None
+
+# Read endpoints serialize stored documents directly (app/core/responses.py); output matches response_model.
+memory_serializer = DocumentSerializer(Memory)
+
+def _with_attachment_urls(doc: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Adds attachment_urls (not stored: signatures expire) to a memory document for a response."""
+    return {**doc, "attachment_urls": [sign_attachment_url(path, user_id) for path in doc.get("attachments") or []]}
+
+def _sign_rendered_memory(body: bytes, user_id: str) -> bytes:
+    """Fills attachment_urls in an already rendered memory (stored unsigned for Idempotency-Key replays)."""
+    memory = json.loads(body)
+    memory["attachment_urls"] = [sign_attachment_url(path, user_id) for path in memory.get("attachments") or []]
+    return dumps(memory)
+
 # --- FastAPI Router ---
 router_dependencies_list = []
 if _dependencies_loaded_successfully and callable(get_current_active_user):
@@ -87,29 +114,15 @@ router = APIRouter(
     dependencies=router_dependencies_list
 )
 
-# --- File Saving Helper ---
-UPLOAD_DIR = "uploads"; os.makedirs(UPLOAD_DIR, exist_ok=True)
-async def save_upload_file(upload_file: UploadFile, user_id: str) -> str:
-    original_filename, original_ext = os.path.splitext(upload_file.filename)
-    safe_filename_base = "".join(c if c.isalnum() else "_" for c in original_filename[:50])
-    unique_filename = f"{user_id}_{uuid.uuid4().hex[:8]}_{safe_filename_base}{original_ext}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    try:
-        with open(file_path, "wb") as buffer: content = await upload_file.read(); buffer.write(content)
-        logger.info(f"Successfully saved file: {file_path} for user {user_id}")
-        return f"/static/uploads/{unique_filename}" # Ensure your static files are served from this path
-    except Exception as e:
-        logger.error(f"Error saving file {upload_file.filename} for user {user_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Could not save file: {upload_file.filename}")
-
 # --- API Endpoints ---
 @router.post("/memories", response_model=Memory, status_code=status.HTTP_201_CREATED, summary="Create new memory")
 async def create_new_memory(
     title: str = Form(...), description: str = Form(...), significance: int = Form(default=3, ge=1, le=5),
     tags_json: str = Form("[]"), files: Optional[List[UploadFile]] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=IDEMPOTENCY_KEY_MAX_LENGTH),
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"CREATE_MEMORY User '{current_user.id}' attempting to create memory. Title: '{title}'. DB type: {type(db)}")
+    logger.info("CREATE_MEMORY User '%s' attempting to create memory. Title: '%s'", current_user.id, title)
     if not _dependencies_loaded_successfully:
         logger.error("CREATE_MEMORY: ABORTING due to failed real dependency import.")
         raise HTTPException(status_code=500, detail="Server configuration error preventing memory creation.")
@@ -118,49 +131,67 @@ async def create_new_memory(
         if not isinstance(tags_list, list) or not all(isinstance(tag, str) for tag in tags_list):
             raise ValueError("Tags must be a list of strings.")
     except (json.JSONDecodeError, ValueError) as e:
-        logger.warning(f"CREATE_MEMORY: Invalid tags_json format from user '{current_user.id}': {tags_json}. Error: {e}")
+        logger.warning("CREATE_MEMORY: Invalid tags_json format from user '%s': %s. Error: %s", current_user.id, tags_json, e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid 'tags' format: {e}")
 
-    attachment_paths: List[str] = []
-    if files:
-        for file_upload in files:
-            if file_upload and file_upload.filename:
-                try: saved_path = await save_upload_file(file_upload, current_user.id); attachment_paths.append(saved_path)
-                except HTTPException as eHttp: raise eHttp
-                except Exception as eFile: logger.error(f"CREATE_MEMORY: File save failed for user '{current_user.id}', file '{file_upload.filename}': {eFile}", exc_info=True); raise HTTPException(status_code=500, detail=f"Error processing file: {file_upload.filename}")
+    async def create_memory() -> FastJSONResponse:
+        attachment_paths: List[str] = []
+        stored_uploads = []
+        if files:
+            # Stored concurrently in the deduplicated blob store under a shared per-request size budget (all-or-nothing).
+            stored_uploads = await save_uploads(db, files, current_user.id)
+            attachment_paths = [stored.url_path for stored in stored_uploads]
 
-    now = datetime.utcnow(); memory_id_str = str(uuid.uuid4())
-    memory_doc = {
-        "_id": memory_id_str, "user_id": current_user.id, "title": title, "description": description,
-        "significance": significance, "tags": tags_list, "attachments": attachment_paths,
-        "created_at": now, "updated_at": now,
-    }
-    logger.debug(f"CREATE_MEMORY: Document to insert into MongoDB: {memory_doc}")
-    try:
-        memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
-        insert_result = await memories_collection.insert_one(memory_doc)
-        if not insert_result.inserted_id:
-            logger.error(f"CREATE_MEMORY: MongoDB insert_one FAILED for user '{current_user.id}'. No inserted_id.")
-            raise HTTPException(status_code=500, detail="Failed to save memory to DB.")
-        logger.info(f"CREATE_MEMORY: MongoDB insert_one successful. Inserted ID: {insert_result.inserted_id}")
+        now = datetime.utcnow(); memory_id_str = str(uuid.uuid4())
+        memory_doc = {
+            "_id": memory_id_str, "user_id": current_user.id, "title": title, "description": description,
+            "significance": significance, "tags": tags_list, "attachments": attachment_paths,
+            "created_at": now, "updated_at": now,
+        }
+        logger.debug("CREATE_MEMORY: Document to insert into MongoDB: %s", memory_doc)
+        # Only a failed insert releases the blob references; once it succeeds the memory owns them.
+        try:
+            memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
+            await memories_collection.insert_one(memory_doc)
+        except Exception as eDB:
+            logger.error("CREATE_MEMORY: DB EXCEPTION creating memory for user '%s': %s", current_user.id, eDB, exc_info=True)
+            await release_attachments(db, attachment_paths)
+            raise HTTPException(status_code=500, detail="Could not save memory due to DB error.")
+        mark_applied()
 
-        created_memory_doc_from_db = await memories_collection.find_one({"_id": memory_doc["_id"]})
-        if not created_memory_doc_from_db:
-            logger.error(f"CREATE_MEMORY: MongoDB find_one FAILED after insert for memory_id '{memory_doc['_id']}', user '{current_user.id}'.")
-            raise HTTPException(status_code=500, detail="Failed to retrieve memory after creation.")
+        # The inserted document is exactly memory_doc, so no re-read is needed.
+        logger.info("CREATE_MEMORY: Memory '%s' created for user '%s'.", memory_doc['_id'], current_user.id)
+        try:
+            memory_index.on_memory_upserted(memory_doc)
+        except Exception as e:
+            logger.error("CREATE_MEMORY: Memory index update failed for '%s': %s", memory_doc['_id'], e, exc_info=True)
+            memory_index.invalidate(current_user.id)
+        for stored in stored_uploads:
+            if is_thumbnailable(stored.url_path):
+                try:
+                    schedule_thumbnails(stored.sha256) # resized, EXIF-free ?size= variants, built off the request path
+                except Exception as e: # the download route schedules them again on the first ?size= request
+                    logger.warning("CREATE_MEMORY: Could not schedule thumbnails for blob %s: %s", stored.sha256[:12], e)
+        # Rendered here (not via response_model) so an Idempotency-Key replay returns the same bytes; stored
+        # without attachment_urls, which are signed per delivery (a replay may come long after they expire)
+        return FastJSONResponse(memory_serializer.one(memory_doc), status_code=status.HTTP_201_CREATED)
 
-        logger.info(f"CREATE_MEMORY: Memory '{created_memory_doc_from_db['_id']}' created for user '{current_user.id}'.")
-        return Memory(**created_memory_doc_from_db)
-    except Exception as eDB:
-        logger.error(f"CREATE_MEMORY: DB EXCEPTION creating memory for user '{current_user.id}': {eDB}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Could not save memory due to DB error.")
+    # Uploads are fingerprinted by name and size; their content is only read by save_uploads
+    fingerprint = request_fingerprint(
+        title, description, significance, tags_list, [(f.filename, f.size) for f in files or []],
+    )
+    return await run_idempotent(
+        db, idempotency_key, current_user.id, "POST /memories", fingerprint, create_memory,
+        render_body=lambda body: _sign_rendered_memory(body, current_user.id),
+    )
 
-@router.get("/memories", response_model=List[Memory], summary="List user memories")
+@router.get("/memories", response_model=List[Memory], summary="List user memories (deprecated: use /memories/page)", deprecated=True)
 async def list_memories(
-    skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging scans every skipped document; use /memories/page."),
+    limit: int = Query(20, ge=1, le=100),
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"LIST_MEMORIES User '{current_user.id}' listing memories. Skip: {skip}, Limit: {limit}. DB type: {type(db)}")
+    logger.info("LIST_MEMORIES User '%s' listing memories. Skip: %s, Limit: %s", current_user.id, skip, limit)
     if not _dependencies_loaded_successfully:
         logger.error("LIST_MEMORIES: ABORTING due to failed real dependency import.")
         return [] # Return empty list, FastAPI will handle serialization
@@ -168,57 +199,59 @@ async def list_memories(
         memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
         cursor = memories_collection.find({"user_id": current_user.id}).sort("created_at", -1).skip(skip).limit(limit)
         db_memories_raw = await cursor.to_list(length=limit)
-        logger.debug(f"LIST_MEMORIES: Raw documents from DB for user '{current_user.id}': {json.dumps(db_memories_raw, default=str)}")
-
-        # Create Pydantic instances. 'id' field should be populated from '_id' here.
-        pydantic_memory_instances = [Memory(**mem_doc) for mem_doc in db_memories_raw]
-
-        if pydantic_memory_instances:
-            # Optional: Log the structure of the first Pydantic instance before FastAPI serializes it.
-            # This helps confirm that 'id' is present on the model instance itself.
-            try:
-                # For Pydantic V2:
-                first_instance_dict_check = pydantic_memory_instances[0].model_dump(by_alias=False)
-            except AttributeError:
-                # For Pydantic V1:
-                first_instance_dict_check = pydantic_memory_instances[0].dict(by_alias=False) # Use by_alias=False to check field names
-
-            logger.info(f"LIST_MEMORIES: First Pydantic instance (internal check, will be serialized by FastAPI): {json.dumps(first_instance_dict_check, default=str, indent=2)}")
-            if "id" not in first_instance_dict_check:
-                 logger.error(f"LIST_MEMORIES: CRITICAL - First Pydantic instance check (by_alias=False) is MISSING 'id' field! Object: {first_instance_dict_check}")
-            elif first_instance_dict_check.get("id") is None:
-                 logger.error(f"LIST_MEMORIES: CRITICAL - First Pydantic instance check (by_alias=False) has 'id' field as None! Object: {first_instance_dict_check}")
-        else:
-            logger.info(f"LIST_MEMORIES: No memories found for user '{current_user.id}'. Returning empty list of Pydantic instances.")
+        logger.debug("LIST_MEMORIES: %s documents for user '%s'.", len(db_memories_raw), current_user.id)
+        return FastJSONResponse(memory_serializer.many(_with_attachment_urls(doc, current_user.id) for doc in db_memories_raw))
+    except Exception as e:
+        logger.error("LIST_MEMORIES: DB error listing memories for user '%s': %s", current_user.id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not retrieve memories.")
 
-        # Return the list of Pydantic model instances.
-        # FastAPI will serialize them according to the Memory model's field names (e.g., 'id'),
-        # because `response_model=List[Memory]` is set and `response_model_by_alias=True` is not.
-        return pydantic_memory_instances
+# Declared before /memories/{memory_id} so "page" is not taken as an id.
+@router.get("/memories/page", response_model=MemoryPage, summary="List user memories (cursor-paginated)")
+async def list_memories_page(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page."),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
+):
+    """Newest-first memories using a (created_at, _id) keyset cursor; every page is an index seek."""
+    logger.info("LIST_MEMORIES_PAGE User '%s' listing memories. Limit: %s, cursor: %s.", current_user.id, limit, 'yes' if cursor else 'no')
+    if not _dependencies_loaded_successfully:
+        logger.error("LIST_MEMORIES_PAGE: ABORTING due to failed real dependency import.")
+        return MemoryPage(items=[])
+    query: Dict[str, Any] = {"user_id": current_user.id}
+    if cursor:
+        query.update(keyset_after("created_at", cursor))
+    try:
+        memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
+        cursor_db = memories_collection.find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+        docs = await cursor_db.to_list(length=limit + 1)
     except Exception as e:
-        logger.error(f"LIST_MEMORIES: DB error listing memories for user '{current_user.id}': {e}", exc_info=True)
+        logger.error("LIST_MEMORIES_PAGE: DB error listing memories for user '%s': %s", current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Could not retrieve memories.")
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"]) if has_more else None
+    return FastJSONResponse({"items": memory_serializer.many(_with_attachment_urls(doc, current_user.id) for doc in docs), "next_cursor": next_cursor})
 
 @router.get("/memories/{memory_id}", response_model=Memory, summary="Get a specific memory")
 async def get_memory(
     memory_id: str = Path(...), db: AsyncIOMotorDatabase = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"GET_MEMORY User '{current_user.id}' getting memory_id '{memory_id}'. DB type: {type(db)}")
+    logger.info("GET_MEMORY User '%s' getting memory_id '%s'", current_user.id, memory_id)
     if not _dependencies_loaded_successfully:
-        logger.error(f"GET_MEMORY: ABORTING for memory '{memory_id}' due to failed real dependency import.")
+        logger.error("GET_MEMORY: ABORTING for memory '%s' due to failed real dependency import.", memory_id)
         raise HTTPException(status_code=500, detail="Server configuration error.")
     try:
         memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
         memory_doc = await memories_collection.find_one({"_id": memory_id, "user_id": current_user.id})
         if not memory_doc:
-            logger.warning(f"GET_MEMORY: Memory_id '{memory_id}' not found for user '{current_user.id}'.")
+            logger.warning("GET_MEMORY: Memory_id '%s' not found for user '%s'.", memory_id, current_user.id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Memory not found or access denied")
-        logger.info(f"GET_MEMORY: Memory '{memory_id}' (raw _id: {memory_doc.get('_id')}) retrieved for user '{current_user.id}'.")
-        return Memory(**memory_doc) # Pydantic handles _id -> id for response
+        logger.info("GET_MEMORY: Memory '%s' retrieved for user '%s'.", memory_id, current_user.id)
+        return FastJSONResponse(memory_serializer.one(_with_attachment_urls(memory_doc, current_user.id)))
     except HTTPException: raise
     except Exception as e:
-        logger.error(f"GET_MEMORY: DB error getting memory '{memory_id}' for user '{current_user.id}': {e}", exc_info=True)
+        logger.error("GET_MEMORY: DB error getting memory '%s' for user '%s': %s", memory_id, current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not retrieve memory '{memory_id}'.")
 
 @router.patch("/memories/{memory_id}", response_model=Memory, summary="Update a memory")
@@ -226,57 +259,61 @@ async def update_memory_endpoint(
     memory_id: str = Path(...), memory_update: MemoryUpdate = Body(...),
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"UPDATE_MEMORY User '{current_user.id}' updating memory_id '{memory_id}'. DB type: {type(db)}")
+    logger.info("UPDATE_MEMORY User '%s' updating memory_id '%s'", current_user.id, memory_id)
     if not _dependencies_loaded_successfully:
-        logger.error(f"UPDATE_MEMORY: ABORTING for memory '{memory_id}' due to failed real dependency import.")
+        logger.error("UPDATE_MEMORY: ABORTING for memory '%s' due to failed real dependency import.", memory_id)
         raise HTTPException(status_code=500, detail="Server configuration error.")
     update_data = memory_update.model_dump(exclude_unset=True, by_alias=False) if hasattr(memory_update,"model_dump") else memory_update.dict(exclude_unset=True, by_alias=False)
     if not update_data: raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No update data provided.")
     update_data["updated_at"] = datetime.utcnow()
-    logger.debug(f"UPDATE_MEMORY: Update data for '{memory_id}': {update_data}")
+    logger.debug("UPDATE_MEMORY: Update data for '%s': %s", memory_id, update_data)
     try:
         memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
-        result = await memories_collection.update_one(
-            {"_id": memory_id, "user_id": current_user.id}, {"$set": update_data}
+        updated_doc = await memories_collection.find_one_and_update(
+            {"_id": memory_id, "user_id": current_user.id}, {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
         )
-        logger.info(f"UPDATE_MEMORY: MongoDB update_one result for '{memory_id}': matched_count={result.matched_count}, modified_count={result.modified_count}")
-        if result.matched_count == 0:
-            logger.warning(f"UPDATE_MEMORY: Update failed: Memory_id '{memory_id}' not found/denied for user '{current_user.id}'.")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Memory not found or access denied for update")
-
-        updated_doc = await memories_collection.find_one({"_id": memory_id, "user_id": current_user.id})
         if not updated_doc:
-            logger.error(f"UPDATE_MEMORY: Failed to retrieve memory '{memory_id}' after update for user '{current_user.id}'. THIS SHOULD NOT HAPPEN if matched_count was 1.")
-            raise HTTPException(status_code=404, detail="Memory not found after update attempt.")
-        logger.info(f"UPDATE_MEMORY: Memory '{memory_id}' updated for user '{current_user.id}'.")
-        return Memory(**updated_doc) # Pydantic handles _id -> id for response
+            logger.warning("UPDATE_MEMORY: Update failed: Memory_id '%s' not found/denied for user '%s'.", memory_id, current_user.id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Memory not found or access denied for update")
+        logger.info("UPDATE_MEMORY: Memory '%s' updated for user '%s'.", memory_id, current_user.id)
+        memory_index.on_memory_upserted(updated_doc)
+        return Memory(**_with_attachment_urls(updated_doc, current_user.id)) # Pydantic handles _id -> id for response
     except HTTPException: raise
     except Exception as e:
-        logger.error(f"UPDATE_MEMORY: DB error updating memory '{memory_id}' for user '{current_user.id}': {e}", exc_info=True)
+        logger.error("UPDATE_MEMORY: DB error updating memory '%s' for user '%s': %s", memory_id, current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not update memory '{memory_id}'.")
 
 @router.delete("/memories/{memory_id}", status_code=status.HTTP_204_NO_CONTENT, summary="Delete a memory")
 async def delete_memory_endpoint(
-    memory_id: str = Path(...), db: AsyncIOMotorDatabase = Depends(get_db),
+    background_tasks: BackgroundTasks, memory_id: str = Path(...), db: AsyncIOMotorDatabase = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"DELETE_MEMORY User '{current_user.id}' deleting memory_id '{memory_id}'. DB type: {type(db)}")
+    logger.info("DELETE_MEMORY User '%s' deleting memory_id '%s'", current_user.id, memory_id)
     if not _dependencies_loaded_successfully:
-        logger.error(f"DELETE_MEMORY: ABORTING for memory '{memory_id}' due to failed real dependency import.")
+        logger.error("DELETE_MEMORY: ABORTING for memory '%s' due to failed real dependency import.", memory_id)
         raise HTTPException(status_code=500, detail="Server configuration error.")
     try:
         memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
-        logger.debug(f"DELETE_MEMORY: Attempting to delete from collection '{MEMORIES_COLLECTION_NAME}' with query: {{'_id': '{memory_id}', 'user_id': '{current_user.id}'}}")
-        result = await memories_collection.delete_one({"_id": memory_id, "user_id": current_user.id})
-        logger.info(f"DELETE_MEMORY: MongoDB delete_one result for '{memory_id}': deleted_count={result.deleted_count}")
-        if result.deleted_count == 0:
-            logger.warning(f"DELETE_MEMORY: Delete failed: Memory_id '{memory_id}' not found/denied for user '{current_user.id}'.")
+        logger.debug("DELETE_MEMORY: Attempting to delete from collection '%s' with query: {'_id': '%s', 'user_id': '%s'}", MEMORIES_COLLECTION_NAME, memory_id, current_user.id)
+        # find_one_and_delete hands back the attachment list so their blob references can be released.
+        deleted_doc = await memories_collection.find_one_and_delete(
+            {"_id": memory_id, "user_id": current_user.id}, projection={"attachments": 1},
+        )
+        logger.debug("DELETE_MEMORY: MongoDB find_one_and_delete for '%s': deleted=%s", memory_id, deleted_doc is not None)
+        if not deleted_doc:
+            logger.warning("DELETE_MEMORY: Delete failed: Memory_id '%s' not found/denied for user '%s'.", memory_id, current_user.id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Memory not found or access denied")
-        logger.info(f"DELETE_MEMORY: Memory '{memory_id}' deleted for user '{current_user.id}'.")
+        logger.info("DELETE_MEMORY: Memory '%s' deleted for user '%s'.", memory_id, current_user.id)
+        memory_index.on_memory_deleted(current_user.id, memory_id)
+        released_blobs = await release_attachments(db, deleted_doc.get("attachments") or [])
+        if released_blobs:
+            # Reclaim blobs that just lost their last reference, after the 204 is sent.
+            background_tasks.add_task(collect_garbage, db, released_blobs, 0)
         # No content to return, FastAPI handles the 204 status.
     except HTTPException: raise
     except Exception as e:
-        logger.error(f"DELETE_MEMORY: DB error deleting memory '{memory_id}' for user '{current_user.id}': {e}", exc_info=True)
+        logger.error("DELETE_MEMORY: DB error deleting memory '%s' for user '%s': %s", memory_id, current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not delete memory '{memory_id}'.")
 
 @router.post("/memories/{memory_id}/upload-attachment", response_model=Memory, summary="Upload attachment")
@@ -284,37 +321,38 @@ async def upload_attachment_to_memory(
     memory_id: str = Path(...), file: UploadFile = File(...),
     db: AsyncIOMotorDatabase = Depends(get_db), current_user: User = Depends(get_current_active_user)
 ):
-    logger.info(f"UPLOAD_ATTACHMENT User '{current_user.id}' uploading attachment for memory_id '{memory_id}'. DB type: {type(db)}")
+    logger.info("UPLOAD_ATTACHMENT User '%s' uploading attachment for memory_id '%s'", current_user.id, memory_id)
     if not _dependencies_loaded_successfully:
-        logger.error(f"UPLOAD_ATTACHMENT: ABORTING for memory '{memory_id}' due to failed real dependency import.")
+        logger.error("UPLOAD_ATTACHMENT: ABORTING for memory '%s' due to failed real dependency import.", memory_id)
         raise HTTPException(status_code=500, detail="Server configuration error.")
     try:
         memories_collection: AsyncIOMotorCollection = db[MEMORIES_COLLECTION_NAME]
-        memory_doc = await memories_collection.find_one({"_id": memory_id, "user_id": current_user.id})
-        if not memory_doc:
-            logger.warning(f"UPLOAD_ATTACHMENT: Memory_id '{memory_id}' not found/denied for user '{current_user.id}'.")
-            raise HTTPException(status_code=404, detail="Memory not found or access denied")
+        stored = await save_upload(db, file, current_user.id)
+        saved_path = stored.url_path
 
-        saved_path = await save_upload_file(file, current_user.id)
-
-        result = await memories_collection.update_one(
-            {"_id": memory_id, "user_id": current_user.id},
-            {"$push": {"attachments": saved_path}, "$set": {"updated_at": datetime.utcnow()}}
-        )
-        logger.info(f"UPLOAD_ATTACHMENT: MongoDB update_one result for '{memory_id}' after $push: matched_count={result.matched_count}, modified_count={result.modified_count}")
-        if result.modified_count == 0 and result.matched_count > 0 :
-             logger.warning(f"UPLOAD_ATTACHMENT: Attachment upload for memory '{memory_id}' (user '{current_user.id}') resulted in modified_count=0. Path might have already existed or other issue.")
-        elif result.matched_count == 0:
-            logger.error(f"UPLOAD_ATTACHMENT: Memory '{memory_id}' not found for update for user '{current_user.id}'.") # Should have been caught by find_one
-            raise HTTPException(status_code=404, detail="Memory not found during attachment update.")
-
-        updated_doc = await memories_collection.find_one({"_id": memory_id, "user_id": current_user.id})
-        if not updated_doc or saved_path not in updated_doc.get("attachments", []):
-            logger.error(f"UPLOAD_ATTACHMENT: Failed to confirm attachment '{saved_path}' in memory '{memory_id}' after update for user '{current_user.id}'. Doc: {updated_doc}")
-            raise HTTPException(status_code=500, detail="Failed to update memory with attachment path.")
-        logger.info(f"UPLOAD_ATTACHMENT: Attachment added to memory '{memory_id}' for user '{current_user.id}'.")
-        return Memory(**updated_doc) # Pydantic handles _id -> id for response
+        # Ownership check and $push in one round trip; the blob reference is released again if the memory
+        # is not ours or the write fails.
+        try:
+            updated_doc = await memories_collection.find_one_and_update(
+                {"_id": memory_id, "user_id": current_user.id},
+                {"$push": {"attachments": saved_path}, "$set": {"updated_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER,
+            )
+        except BaseException:
+            await release_attachments(db, [saved_path])
+            raise
+        if not updated_doc:
+            logger.warning("UPLOAD_ATTACHMENT: Memory_id '%s' not found/denied for user '%s'.", memory_id, current_user.id)
+            await release_attachments(db, [saved_path])
+            raise HTTPException(status_code=404, detail="Memory not found or access denied")
+        logger.info("UPLOAD_ATTACHMENT: Attachment added to memory '%s' for user '%s'.", memory_id, current_user.id)
+        if is_thumbnailable(saved_path):
+            try:
+                schedule_thumbnails(stored.sha256)
+            except Exception as e: # the attachment is stored either way; ?size= requests schedule them again
+                logger.warning("UPLOAD_ATTACHMENT: Could not schedule thumbnails for blob %s: %s", stored.sha256[:12], e)
+        return Memory(**_with_attachment_urls(updated_doc, current_user.id)) # Pydantic handles _id -> id for response
     except HTTPException: raise
     except Exception as e:
-        logger.error(f"UPLOAD_ATTACHMENT: Error uploading attachment for memory '{memory_id}', user '{current_user.id}': {e}", exc_info=True)
+        logger.error("UPLOAD_ATTACHMENT: Error uploading attachment for memory '%s', user '%s': %s", memory_id, current_user.id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to process attachment.")
\ No newline at end of file
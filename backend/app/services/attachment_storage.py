@@ -0,0 +1,615 @@
+# backend/app/services/attachment_storage.py
+#
+# Attachment uploads and the content-addressed blob store behind them. Blob bytes live on local
+# disk or in GridFS (ATTACHMENT_STORAGE_BACKEND); refcounts live in Mongo for both.
+#
+#   python -m app.services.attachment_storage gc [--recount]   # reclaim unreferenced blobs
+#
+# Run from backend/. Uses MONGODB_URI / DB_NAME from the environment or config/.env.
+
+import os
+import re
+import sys
+import hmac
+import math
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, TypeVar
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, UploadFile, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app import db as db_helpers
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_URL_PREFIX = "/api/v1/attachments" # served by app/routers/attachments.py
+LEGACY_UPLOAD_URL_PREFIX = "/static/uploads" # attachments saved before the serving route existed
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+# Disk reads/writes (and the hashing done alongside them) run here so the event loop never blocks on I/O.
+UPLOAD_IO_WORKERS = int(os.getenv("UPLOAD_IO_WORKERS", "8"))
+
+# Blobs live at uploads/blobs/<sha[:2]>/<sha>; one Mongo doc per blob holds its reference count.
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+BLOB_TMP_DIR = os.path.join(BLOB_DIR, "tmp")
+BLOBS_COLLECTION_NAME = "attachment_blobs"
+MEMORIES_COLLECTION_NAME = "futureself" # referencing side: Memory.attachments
+# Unreferenced blobs younger than this are left alone by the periodic GC pass (covers in-flight uploads).
+BLOB_GC_GRACE_SECONDS = float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+BLOB_ACQUIRE_ATTEMPTS = 5
+# "local" needs a filesystem shared by every node; "gridfs" keeps blob bytes in MongoDB.
+ATTACHMENT_STORAGE_BACKEND = os.getenv("ATTACHMENT_STORAGE_BACKEND", "local").lower()
+ATTACHMENT_GRIDFS_BUCKET = os.getenv("ATTACHMENT_GRIDFS_BUCKET", "attachments")
+# Signed download URLs (for <img src>/<a href>, which cannot send a Bearer token). Expiry is
+# rounded up to whole TTL windows so a URL stays the same (and browser-cacheable) within one.
+ATTACHMENT_URL_SECRET = os.getenv("ATTACHMENT_URL_SECRET") or os.getenv("SECRET_KEY") or ""
+ATTACHMENT_URL_TTL_SECONDS = int(os.getenv("ATTACHMENT_URL_TTL_SECONDS", "3600"))
+
+T = TypeVar("T")
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_IO_WORKERS, thread_name_prefix="upload-io")
+_BLOB_NAME = re.compile(r"^(?P<sha>[0-9a-f]{64})(?P<ext>\.[A-Za-z0-9]{1,15})?$")
+
+
+async def run_in_io_pool(func: Callable[..., T], *args: Any) -> T:
+    """Runs a blocking file operation on the attachment I/O pool."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+@dataclass
+class StoredUpload:
+    url_path: str # what gets stored in memory["attachments"]
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+    deduplicated: bool # True when the blob already existed and nothing was written
+
+
+class UploadBudget:
+    """Byte allowance shared by all files of one request (only touched from the event loop thread)."""
+
+    def __init__(self, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, nbytes: int) -> None:
+        self.used += nbytes
+        if self.used > self.max_bytes:
+            raise _too_large(f"Upload exceeds the {self.max_bytes} byte limit per request.")
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=detail)
+
+
+def _safe_extension(original: str) -> str:
+    ext = os.path.splitext(original)[1][:16]
+    ext = "".join(c for c in ext if c.isalnum())
+    return f".{ext.lower()}" if ext else ""
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove upload file %s: %s", path, e)
+
+
+# --- Blob store ---
+def blob_path(key: str) -> str:
+    """Local path for a blob (or one of its companions, whose keys start with the blob's sha256)."""
+    return os.path.join(BLOB_DIR, key[:2], key)
+
+
+def blob_id_from_url(url_path: str) -> Optional[str]:
+    """sha256 of a content-addressed attachment URL, or None for legacy per-user files."""
+    match = _BLOB_NAME.match(os.path.basename(url_path))
+    return match.group("sha") if match else None
+
+
+def _attachment_signature(filename: str, user_id: str, expires: int) -> str:
+    if not ATTACHMENT_URL_SECRET:
+        raise RuntimeError("ATTACHMENT_URL_SECRET (or SECRET_KEY) must be set to sign attachment URLs.")
+    message = f"{user_id}\n{filename}\n{expires}".encode("utf-8")
+    digest = hmac.new(ATTACHMENT_URL_SECRET.encode("utf-8"), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def sign_attachment_url(url_path: str, user_id: str, now: Optional[float] = None) -> str:
+    """`url_path` plus uid/exp/sig query parameters; valid for one to two TTL windows."""
+    window = max(ATTACHMENT_URL_TTL_SECONDS, 1)
+    expires = (math.floor((now or time.time()) / window) + 2) * window
+    filename = os.path.basename(url_path)
+    query = urlencode({"uid": user_id, "exp": expires, "sig": _attachment_signature(filename, user_id, expires)})
+    return f"{url_path}?{query}"
+
+
+def verify_attachment_signature(filename: str, user_id: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_attachment_signature(filename, user_id, expires), signature)
+
+
+def _store_blob_file(temp_path: str, final_path: str) -> None:
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+
+
+class BlobBackend(ABC):
+    """
+    Where blob bytes are kept, by key: a blob's sha256, or a derivative name starting with it
+    (see register_companion_keys). Objects are immutable: written once, then only read or deleted.
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, key: str) -> Optional[int]:
+        """Blob length in bytes, or None if it is not stored."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def store_file(self, key: str, file_path: str, content_type: Optional[str] = None) -> None:
+        """Moves a finished local file (a hashed upload or a generated derivative) into the store."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yields bytes [start, end] (inclusive) one chunk at a time."""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path when the bytes are on local disk (enables sendfile), else None."""
+        return None
+
+
+class LocalBlobBackend(BlobBackend):
+    name = "local"
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_io_pool(os.path.exists, blob_path(key))
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return (await run_in_io_pool(os.stat, blob_path(key))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def store_file(self, key: str, file_path: str, content_type: Optional[str] = None) -> None:
+        # A rename within the upload dir, so readers never see a partial blob.
+        await run_in_io_pool(_store_blob_file, file_path, blob_path(key))
+
+    async def delete(self, key: str) -> None:
+        await run_in_io_pool(_remove_quietly, blob_path(key))
+
+    async def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        async for chunk in stream_local_file(blob_path(key), start, end):
+            yield chunk
+
+    def local_path(self, key: str) -> Optional[str]:
+        return blob_path(key)
+
+
+class GridFSBlobBackend(BlobBackend):
+    """Blob bytes in a GridFS bucket, stored under filename=<key> via the app/db.py helpers."""
+
+    name = "gridfs"
+
+    async def exists(self, key: str) -> bool:
+        return await db_helpers.find_file(key) is not None
+
+    async def size(self, key: str) -> Optional[int]:
+        grid_file = await db_helpers.find_file(key)
+        return grid_file["length"] if grid_file else None
+
+    async def store_file(self, key: str, file_path: str, content_type: Optional[str] = None) -> None:
+        # upload_from_stream reads the file in chunk_size_bytes pieces. Two concurrent first
+        # uploads of the same content create two revisions; reads take the newest and delete
+        # removes all of them.
+        handle = await run_in_io_pool(open, file_path, "rb")
+        try:
+            await db_helpers.upload_file(handle, key, metadata={"content_type": content_type} if content_type else None)
+        finally:
+            await run_in_io_pool(handle.close)
+        await run_in_io_pool(_remove_quietly, file_path)
+
+    async def delete(self, key: str) -> None:
+        await db_helpers.delete_files_by_name(key)
+
+    async def stream(self, key: str, start: int, end: int) -> AsyncIterator[bytes]:
+        async for chunk in db_helpers.stream_file(key, start, end, chunk_size=UPLOAD_CHUNK_BYTES):
+            yield chunk
+
+
+_backend: BlobBackend = LocalBlobBackend()
+
+
+def configure_attachment_storage(database: AsyncIOMotorDatabase) -> BlobBackend:
+    """Selects the blob backend from ATTACHMENT_STORAGE_BACKEND; call once the database is connected."""
+    global _backend
+    # Uploads are copied to temp files here before they are stored, with either backend.
+    os.makedirs(BLOB_TMP_DIR, exist_ok=True)
+    if ATTACHMENT_STORAGE_BACKEND == "gridfs":
+        db_helpers.init_fs_bucket(database, ATTACHMENT_GRIDFS_BUCKET)
+        _backend = GridFSBlobBackend()
+    elif ATTACHMENT_STORAGE_BACKEND == "local":
+        _backend = LocalBlobBackend()
+    else:
+        raise ValueError(f"Unknown ATTACHMENT_STORAGE_BACKEND '{ATTACHMENT_STORAGE_BACKEND}' (expected 'local' or 'gridfs').")
+    logger.info("Attachment blobs stored with the '%s' backend.", _backend.name)
+    return _backend
+
+
+def get_blob_backend() -> BlobBackend:
+    return _backend
+
+
+async def stream_local_file(file_path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    """Positional reads of bytes [start, end] on the I/O pool, one chunk at a time."""
+    handle = await run_in_io_pool(open, file_path, "rb")
+    try:
+        offset, remaining = start, end - start + 1
+        while remaining > 0:
+            chunk = await run_in_io_pool(os.pread, handle.fileno(), min(UPLOAD_CHUNK_BYTES, remaining), offset)
+            if not chunk: # file shrank underneath us; end the body rather than hang
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_in_io_pool(handle.close)
+
+
+async def copy_blob_to_file(key: str, file_path: str) -> None:
+    """Streams a stored object into a local file (for tools that need a real path, e.g. image workers)."""
+    size = await _backend.size(key)
+    if size is None:
+        raise FileNotFoundError(key)
+    handle = await run_in_io_pool(open, file_path, "wb")
+    try:
+        async for chunk in _backend.stream(key, 0, size - 1):
+            await run_in_io_pool(handle.write, chunk)
+    finally:
+        await run_in_io_pool(handle.close)
+
+
+# Derived objects stored next to a blob (e.g. thumbnails); GC removes them together with it.
+_companion_key_providers: List[Callable[[str], List[str]]] = []
+
+
+def register_companion_keys(provider: Callable[[str], List[str]]) -> None:
+    """`provider(sha256)` returns the keys of objects derived from that blob."""
+    _companion_key_providers.append(provider)
+
+
+async def _acquire_blob(db: AsyncIOMotorDatabase, sha256: str, size: int, content_type: Optional[str]) -> None:
+    """
+    Adds one reference to a blob, creating its record on first use. References are taken
+    *before* the memory document points at the blob, so GC never sees a live blob at zero.
+    """
+    now = datetime.utcnow()
+    for attempt in range(BLOB_ACQUIRE_ATTEMPTS):
+        try:
+            await db[BLOBS_COLLECTION_NAME].update_one(
+                {"_id": sha256, "deleting": {"$ne": True}},
+                {"$inc": {"refcount": 1}, "$set": {"updated_at": now},
+                 "$setOnInsert": {"size": size, "content_type": content_type, "created_at": now}},
+                upsert=True,
+            )
+            return
+        except DuplicateKeyError:
+            # The blob is being collected right now (or another first upload won the insert); retry shortly.
+            await asyncio.sleep(0.05 * (attempt + 1))
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Attachment store busy, please retry.")
+
+
+async def release_attachments(db: AsyncIOMotorDatabase, url_paths: Iterable[str]) -> List[str]:
+    """Drops one reference per content-addressed URL; returns the affected blob ids (GC candidates)."""
+    counts = Counter(sha for sha in map(blob_id_from_url, url_paths) if sha)
+    if not counts:
+        return []
+    now = datetime.utcnow()
+    await db[BLOBS_COLLECTION_NAME].bulk_write(
+        [UpdateOne({"_id": sha}, {"$inc": {"refcount": -n}, "$set": {"updated_at": now}}) for sha, n in counts.items()],
+        ordered=False,
+    )
+    return list(counts)
+
+
+async def _reclaim_blob(db: AsyncIOMotorDatabase, claim_filter: Dict[str, Any]) -> bool:
+    """Marks one unreferenced blob as deleting, removes its file, then its record."""
+    claimed = await db[BLOBS_COLLECTION_NAME].find_one_and_update(
+        claim_filter, {"$set": {"deleting": True}}, projection={"_id": 1},
+    )
+    if not claimed:
+        return False
+    await _delete_blob_objects(claimed["_id"])
+    await db[BLOBS_COLLECTION_NAME].delete_one({"_id": claimed["_id"], "deleting": True})
+    return True
+
+
+async def _delete_blob_objects(sha256: str) -> None:
+    # Companions first: if this is interrupted, the blob record still exists and the next pass retries.
+    for provider in _companion_key_providers:
+        for key in provider(sha256):
+            await _backend.delete(key)
+    await _backend.delete(sha256)
+
+
+def _sweep_stale_temp_files(cutoff_timestamp: float) -> None:
+    """Removes temp files left behind by uploads that died mid-write."""
+    for entry in os.scandir(BLOB_TMP_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff_timestamp:
+            _remove_quietly(entry.path)
+
+
+async def collect_garbage(
+    db: AsyncIOMotorDatabase, blob_ids: Optional[Iterable[str]] = None,
+    grace_seconds: float = BLOB_GC_GRACE_SECONDS,
+) -> int:
+    """
+    Reclaims blobs with no references. With `blob_ids` (e.g. right after a memory delete) only
+    those are checked; otherwise every unreferenced blob idle for `grace_seconds`. Returns the count.
+    A blob is marked "deleting" before its file goes, and _acquire_blob refuses such records,
+    so a concurrent re-upload waits instead of pointing at a file that is about to disappear.
+    """
+    unreferenced = {
+        "refcount": {"$lte": 0}, "deleting": {"$ne": True},
+        "updated_at": {"$lte": datetime.utcnow() - timedelta(seconds=grace_seconds)},
+    }
+    reclaimed = 0
+    if blob_ids is not None:
+        for sha in blob_ids:
+            reclaimed += await _reclaim_blob(db, {**unreferenced, "_id": sha})
+        return reclaimed
+    await run_in_io_pool(_sweep_stale_temp_files, time.time() - grace_seconds)
+    # Finish deletions interrupted by a crash, then sweep everything unreferenced.
+    async for doc in db[BLOBS_COLLECTION_NAME].find({"deleting": True}, {"_id": 1}):
+        await _delete_blob_objects(doc["_id"])
+        await db[BLOBS_COLLECTION_NAME].delete_one({"_id": doc["_id"], "deleting": True})
+        reclaimed += 1
+    candidates = [doc["_id"] async for doc in db[BLOBS_COLLECTION_NAME].find(unreferenced, {"_id": 1})]
+    for sha in candidates:
+        reclaimed += await _reclaim_blob(db, {**unreferenced, "_id": sha})
+    return reclaimed
+
+
+async def recount_references(db: AsyncIOMotorDatabase, grace_seconds: float = BLOB_GC_GRACE_SECONDS) -> int:
+    """
+    Recomputes every idle blob's refcount from Memory.attachments (repairs counts leaked by
+    crashes between a reference change and the memory write). Returns the number corrected.
+    """
+    actual: Counter = Counter()
+    pipeline = [{"$unwind": "$attachments"}, {"$group": {"_id": "$attachments", "n": {"$sum": 1}}}]
+    async for row in db[MEMORIES_COLLECTION_NAME].aggregate(pipeline):
+        sha = blob_id_from_url(row["_id"])
+        if sha:
+            actual[sha] += row["n"]
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    corrected = 0
+    async for doc in db[BLOBS_COLLECTION_NAME].find({"updated_at": {"$lte": cutoff}, "deleting": {"$ne": True}}):
+        expected = actual.get(doc["_id"], 0)
+        if doc.get("refcount") != expected:
+            # Conditional on updated_at so a reference taken meanwhile is not overwritten.
+            result = await db[BLOBS_COLLECTION_NAME].update_one(
+                {"_id": doc["_id"], "updated_at": doc["updated_at"]}, {"$set": {"refcount": expected}},
+            )
+            corrected += result.modified_count
+    return corrected
+
+
+# --- Uploads ---
+def _write_and_hash(handle, digest, chunk: bytes) -> None:
+    handle.write(chunk)
+    digest.update(chunk)
+
+
+async def _spool_upload(upload_file: UploadFile, temp_path: str, budget: UploadBudget, max_file_bytes: int):
+    """Copies the upload to temp_path chunk by chunk, hashing as it goes; returns (sha256, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    handle = await run_in_io_pool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_file_bytes:
+                raise _too_large(f"'{upload_file.filename}' exceeds the {max_file_bytes} byte limit per file.")
+            budget.consume(len(chunk))
+            # hashlib releases the GIL for large buffers, so hashing here runs in parallel with other uploads.
+            await run_in_io_pool(_write_and_hash, handle, digest, chunk)
+    finally:
+        await run_in_io_pool(handle.close)
+    return digest.hexdigest(), size
+
+
+async def save_upload(
+    db: AsyncIOMotorDatabase, upload_file: UploadFile, user_id: str,
+    budget: Optional[UploadBudget] = None, max_file_bytes: int = UPLOAD_MAX_FILE_BYTES,
+) -> StoredUpload:
+    """
+    Stores one upload in the blob store and takes a reference on it. The upload is read once:
+    each chunk is written to a temp file and hashed, and the file is then renamed to its sha256
+    (or handed to the GridFS backend). Content that is already stored is dropped after the
+    copy and costs one refcount update. Memory use is one chunk per upload regardless of size.
+
+    Starlette has already spooled the part to its own temp file by the time this runs, so the
+    per-file limit caps what is copied out of that spool; RequestSizeLimitMiddleware is what
+    bounds the spool itself.
+    """
+    budget = budget or UploadBudget()
+    temp_path = os.path.join(BLOB_TMP_DIR, f"{uuid.uuid4().hex}.part")
+    try:
+        sha256, size = await _spool_upload(upload_file, temp_path, budget, max_file_bytes)
+    except BaseException as e:
+        await run_in_io_pool(_remove_quietly, temp_path)
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        logger.error("Error reading upload %s for user %s: %s", upload_file.filename, user_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Could not save file: {upload_file.filename}")
+
+    try:
+        await _acquire_blob(db, sha256, size, upload_file.content_type)
+    except BaseException:
+        await run_in_io_pool(_remove_quietly, temp_path)
+        raise
+    backend = _backend
+    deduplicated = True
+    try:
+        if not await backend.exists(sha256):
+            deduplicated = False
+            await backend.store_file(sha256, temp_path, upload_file.content_type)
+    except BaseException as e: # includes cancellation when a sibling upload fails
+        await release_attachments(db, [sha256])
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        logger.error("Error saving file %s for user %s: %s", upload_file.filename, user_id, e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Could not save file: {upload_file.filename}")
+    finally:
+        await run_in_io_pool(_remove_quietly, temp_path) # no-op once the local backend renamed it
+
+    logger.info("Stored upload %s as %s blob %s (%d bytes, %s) for user %s", upload_file.filename, backend.name,
+                sha256[:12], size, "deduplicated" if deduplicated else "new", user_id)
+    return StoredUpload(
+        url_path=f"{UPLOAD_URL_PREFIX}/{sha256}{_safe_extension(upload_file.filename or '')}",
+        filename=upload_file.filename or sha256, content_type=upload_file.content_type,
+        size=size, sha256=sha256, deduplicated=deduplicated,
+    )
+
+
+async def save_uploads(db: AsyncIOMotorDatabase, upload_files: Sequence[UploadFile], user_id: str) -> List[StoredUpload]:
+    """
+    Saves several uploads concurrently under one shared per-request budget.
+    All-or-nothing: if any file fails, the others are cancelled and their references released.
+    """
+    budget = UploadBudget()
+    tasks = [asyncio.ensure_future(save_upload(db, f, user_id, budget)) for f in upload_files if f and f.filename]
+    if not tasks:
+        return []
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        await release_attachments(db, [outcome.url_path for outcome in outcomes if isinstance(outcome, StoredUpload)])
+        raise
+
+
+def legacy_upload_path(filename: str) -> str:
+    """Disk path of a pre-blob-store per-user upload (always on local disk)."""
+    return os.path.join(UPLOAD_DIR, os.path.basename(filename))
+
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware that caps multipart request bodies at UPLOAD_MAX_REQUEST_BYTES.
+    Rejects on Content-Length up front, and otherwise counts bytes as they are received so a
+    chunked upload is cut off mid-stream instead of being spooled to disk in full first.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413 response.
+                    raise _too_large(f"Request body exceeds {self.max_bytes} bytes.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Request body exceeds %d bytes."}' % self.max_bytes
+        await send({
+            "type": "http.response.start", "status": status.HTTP_413_CONTENT_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def shutdown_upload_pool():
+    """Stops the upload I/O threads on application shutdown."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- CLI ---
+async def _main(argv: List[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", "..", "config", ".env"))
+
+    parser = argparse.ArgumentParser(prog="python -m app.services.attachment_storage", description="Attachment blob store tools")
+    parser.add_argument("command", choices=["gc"])
+    parser.add_argument("--recount", action="store_true", help="recompute refcounts from memories before collecting")
+    parser.add_argument("--grace-seconds", type=float, default=BLOB_GC_GRACE_SECONDS)
+    parser.add_argument("--db", default=os.getenv("DB_NAME", "future_self_db"))
+    args = parser.parse_args(argv)
+
+    mongo_uri = os.getenv("MONGODB_URI")
+    if not mongo_uri:
+        print("MONGODB_URI is not set.", file=sys.stderr)
+        return 2
+    client = AsyncIOMotorClient(mongo_uri)
+    try:
+        db = client[args.db]
+        configure_attachment_storage(db)
+        if args.recount:
+            print(f"corrected  {await recount_references(db, args.grace_seconds)} refcounts")
+        print(f"reclaimed  {await collect_garbage(db, grace_seconds=args.grace_seconds)} blobs")
+        return 0
+    finally:
+        client.close()
+        _executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,54 @@
+# backend/app/services/image_worker.py
+#
+# Runs inside the thumbnail process pool (see thumbnails.py). Keep imports to Pillow only, so
+# spawned workers start quickly and never pull in FastAPI/Motor state.
+
+import os
+from typing import List, Tuple
+
+from PIL import Image, ImageOps
+
+# Refuse decompression bombs instead of letting one upload exhaust a worker's memory.
+Image.MAX_IMAGE_PIXELS = int(os.getenv("THUMBNAIL_MAX_SOURCE_PIXELS", str(80_000_000)))
+
+SAVE_OPTIONS = {
+    "WEBP": {"quality": 80, "method": 4},
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+
+def _for_format(image: Image.Image, pil_format: str) -> Image.Image:
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if pil_format == "JPEG":
+        if has_alpha: # JPEG has no alpha channel: flatten onto white
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            return flattened
+        return image if image.mode in ("RGB", "L") else image.convert("RGB")
+    if has_alpha:
+        return image if image.mode == "RGBA" else image.convert("RGBA")
+    return image if image.mode in ("RGB", "L") else image.convert("RGB")
+
+
+def render_derivatives(source_path: str, targets: List[Tuple[int, str, str]]) -> List[str]:
+    """
+    Writes one resized copy per (max_edge, PIL format, output path) target and returns the paths.
+    EXIF orientation is applied to the pixels first; no EXIF/XMP (camera, GPS) is written out.
+    """
+    largest_edge = max(edge for edge, _, _ in targets)
+    written = []
+    with Image.open(source_path) as original:
+        original.draft("RGB", (largest_edge, largest_edge)) # JPEG: decode at a reduced scale when possible
+        image = ImageOps.exif_transpose(original)
+        icc_profile = original.info.get("icc_profile")
+        for max_edge, pil_format, output_path in sorted(targets, reverse=True):
+            derived = image.copy()
+            derived.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            derived = _for_format(derived, pil_format)
+            options = dict(SAVE_OPTIONS[pil_format])
+            if icc_profile:
+                options["icc_profile"] = icc_profile # colour profile is kept; it carries no personal data
+            derived.save(output_path, pil_format, **options)
+            written.append(output_path)
+    return written
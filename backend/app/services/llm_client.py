@@ -0,0 +1,147 @@
+# backend/app/services/llm_client.py
+
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException, status
+from groq import AsyncGroq
+
+from app.services.llm_providers import GroqProvider, LLMProvider, LocalProvider
+from app.services.llm_resilience import ResilientProvider
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (override via environment / config/.env) ---
+# "groq" (hosted API) or "local" (deterministic in-process engine, see llm_providers.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+GROQ_MODEL_NAME = os.getenv("GROQ_MODEL_NAME", "llama3-8b-8192")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") # None -> SDK default (https://api.groq.com)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "0")) # SDK-level; retries/deadlines live in llm_resilience.py
+LLM_RESILIENCE_ENABLED = os.getenv("LLM_RESILIENCE_ENABLED", "true").lower() == "true"
+
+
+# --- Connection Reuse Metrics ---
+class ConnectionPoolStats:
+    """Counts LLM requests vs. newly opened connections using httpcore trace events."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.handshake_seconds = 0.0
+
+    def tracer(self):
+        """Returns a per-request trace callback (httpcore `trace` extension)."""
+        started: Dict[str, float] = {}
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name.endswith(".started"):
+                started[event_name[:-len(".started")]] = time.perf_counter()
+                return
+            if not event_name.endswith(".complete"):
+                return
+            step = event_name[:-len(".complete")]
+            if step == "connection.connect_tcp":
+                self.connections_opened += 1
+            elif step == "connection.start_tls":
+                self.tls_handshakes += 1
+            else:
+                return
+            if step in started:
+                self.handshake_seconds += time.perf_counter() - started.pop(step)
+
+        return trace
+
+    def snapshot(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "connection_reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            "handshake_ms_total": round(self.handshake_seconds * 1000, 2),
+        }
+
+
+pool_stats = ConnectionPoolStats()
+
+# --- Global Client (created/closed by the app's startup/shutdown hooks) ---
+http_client: Optional[httpx.AsyncClient] = None
+llm_client: Optional[AsyncGroq] = None
+llm_provider: Optional[LLMProvider] = None
+
+
+async def _attach_trace(request: httpx.Request) -> None:
+    pool_stats.requests += 1
+    request.extensions["trace"] = pool_stats.tracer()
+
+
+def _resilient(provider: LLMProvider) -> LLMProvider:
+    return ResilientProvider(provider) if LLM_RESILIENCE_ENABLED else provider
+
+
+async def start_llm_client():
+    """Creates the configured LLM provider; for Groq, the process-wide client and its pooled httpx transport."""
+    global http_client, llm_client, llm_provider
+    if LLM_PROVIDER == "local":
+        llm_provider = _resilient(LocalProvider())
+        logger.info("LLM provider: local deterministic engine (model=%s).", llm_provider.model_name)
+        return
+    if LLM_PROVIDER != "groq":
+        raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}' (expected 'groq' or 'local').")
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        logger.warning("GROQ_API_KEY not set; LLM client not started. Conversation endpoints will return 503.")
+        return
+    timeout = httpx.Timeout(LLM_READ_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=timeout,
+        event_hooks={"request": [_attach_trace]},
+    )
+    llm_client = AsyncGroq(
+        api_key=api_key, base_url=GROQ_BASE_URL, http_client=http_client,
+        timeout=timeout, max_retries=LLM_MAX_RETRIES,
+    )
+    llm_provider = _resilient(GroqProvider(llm_client, GROQ_MODEL_NAME))
+    logger.info(
+        "LLM client started (max_connections=%s, keepalive=%s/%ss).",
+        LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+async def close_llm_client():
+    """Closes the shared Groq client and its connection pool."""
+    global http_client, llm_client, llm_provider
+    if http_client is not None:
+        await http_client.aclose()
+    http_client = None
+    llm_client = None
+    llm_provider = None
+
+
+# --- Dependency Function ---
+def get_llm_client() -> AsyncGroq:
+    """FastAPI dependency returning the shared Groq client."""
+    if llm_client is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI service is not configured.")
+    return llm_client
+
+
+def get_llm_provider() -> LLMProvider:
+    """FastAPI dependency returning the configured LLM provider."""
+    if llm_provider is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="AI service is not configured.")
+    return llm_provider
@@ -0,0 +1,169 @@
+# backend/app/services/llm_providers.py
+#
+# Chat-completion providers behind one interface, so PersonaService does not depend on a vendor
+# SDK. LLM_PROVIDER picks the implementation (see llm_client.start_llm_client):
+#   groq   the Groq API through the shared pooled AsyncGroq client (default)
+#   local  a deterministic in-process engine: same prompt -> same text, with configurable length,
+#          first-token delay and token rate. Runs the chat path offline, in CI and in load tests.
+
+import os
+import time
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from groq import AsyncGroq
+
+from app.services.prompt_builder import MESSAGE_OVERHEAD_TOKENS, count_tokens
+
+# --- Local engine configuration ---
+LOCAL_LLM_MODEL_NAME = os.getenv("LOCAL_LLM_MODEL_NAME", "local-deterministic")
+LOCAL_LLM_COMPLETION_TOKENS = int(os.getenv("LOCAL_LLM_COMPLETION_TOKENS", "120"))
+LOCAL_LLM_FIRST_TOKEN_MS = float(os.getenv("LOCAL_LLM_FIRST_TOKEN_MS", "0"))
+LOCAL_LLM_TOKENS_PER_SEC = float(os.getenv("LOCAL_LLM_TOKENS_PER_SEC", "0")) # 0: no pacing
+
+_LOCAL_VOCABULARY = (
+    "you", "will", "look", "back", "on", "this", "time", "with", "kindness", "and", "patience", "the",
+    "small", "steps", "matter", "more", "than", "you", "think", "trust", "yourself", "keep", "going",
+    "rest", "when", "needed", "people", "who", "love", "you", "remember", "what", "brought", "joy",
+)
+
+
+@dataclass
+class CompletionUsage:
+    prompt_tokens: int
+    completion_tokens: int
+
+
+@dataclass
+class ChatCompletion:
+    content: str
+    usage: Optional[CompletionUsage] = None
+
+
+class CompletionStream:
+    """Async iterator over completion text pieces; `usage` is filled in once the stream ends, if reported."""
+
+    def __init__(self):
+        self.usage: Optional[CompletionUsage] = None
+        self._tokens: Optional[AsyncIterator[str]] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._tokens
+
+
+class LLMProvider(ABC):
+    """Interface: a completed reply, or a stream opened up front so connection/auth errors surface before any output."""
+
+    name = "base"
+    model_name = ""
+
+    @abstractmethod
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> ChatCompletion:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stream(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> CompletionStream:
+        raise NotImplementedError
+
+
+class GroqProvider(LLMProvider):
+    name = "groq"
+
+    def __init__(self, client: AsyncGroq, model_name: str):
+        self.client = client
+        self.model_name = model_name
+
+    @staticmethod
+    def _usage(usage) -> Optional[CompletionUsage]:
+        if usage is None:
+            return None
+        return CompletionUsage(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+
+    async def complete(self, messages, max_tokens, temperature) -> ChatCompletion:
+        completion = await self.client.chat.completions.create(
+            messages=messages, model=self.model_name, temperature=temperature, max_tokens=max_tokens,
+        )
+        return ChatCompletion(content=completion.choices[0].message.content or "", usage=self._usage(completion.usage))
+
+    async def stream(self, messages, max_tokens, temperature) -> CompletionStream:
+        upstream = await self.client.chat.completions.create(
+            messages=messages, model=self.model_name, temperature=temperature, max_tokens=max_tokens, stream=True,
+        )
+        result = CompletionStream()
+
+        async def tokens():
+            try:
+                async for chunk in upstream:
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                        result.usage = self._usage(x_groq.usage) # Groq reports usage on the final chunk
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        yield token
+            finally:
+                await upstream.close() # releases the connection if the reader stops early
+
+        result._tokens = tokens()
+        return result
+
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic stand-in for a hosted model. The reply is derived from a hash of the prompt, so
+    repeated runs produce the same text; length is min(max_tokens, completion_tokens) words, each
+    counted as one token. Pacing follows first_token_ms and tokens_per_sec on an absolute
+    schedule, so timer overhead does not add up over long replies.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: str = LOCAL_LLM_MODEL_NAME, completion_tokens: int = LOCAL_LLM_COMPLETION_TOKENS,
+                 first_token_ms: float = LOCAL_LLM_FIRST_TOKEN_MS, tokens_per_sec: float = LOCAL_LLM_TOKENS_PER_SEC):
+        self.model_name = model_name
+        self.completion_tokens = completion_tokens
+        self.first_token_ms = first_token_ms
+        self.tokens_per_sec = tokens_per_sec
+
+    def _words(self, messages: List[Dict[str, str]], max_tokens: int) -> List[str]:
+        digest = hashlib.sha256("\x00".join(f"{m['role']}:{m['content']}" for m in messages).encode("utf-8")).digest()
+        count = max(min(max_tokens, self.completion_tokens), 0)
+        size = len(_LOCAL_VOCABULARY)
+        return [_LOCAL_VOCABULARY[(digest[i % len(digest)] + i) % size] for i in range(count)]
+
+    @staticmethod
+    def _usage(messages: List[Dict[str, str]], completion_tokens: int) -> CompletionUsage:
+        prompt_tokens = sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+        return CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def _token_offset(self, index: int) -> float:
+        """Seconds after the request at which token `index` is ready."""
+        interval = 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+        return self.first_token_ms / 1000 + index * interval
+
+    async def complete(self, messages, max_tokens, temperature) -> ChatCompletion:
+        words = self._words(messages, max_tokens)
+        delay = self._token_offset(len(words) - 1) if words else self.first_token_ms / 1000
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return ChatCompletion(content=" ".join(words), usage=self._usage(messages, len(words)))
+
+    async def stream(self, messages, max_tokens, temperature) -> CompletionStream:
+        words = self._words(messages, max_tokens)
+        result = CompletionStream()
+        started = time.monotonic()
+
+        async def tokens():
+            for i, word in enumerate(words):
+                wait = started + self._token_offset(i) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                yield word if i == 0 else f" {word}"
+            result.usage = self._usage(messages, len(words))
+
+        result._tokens = tokens()
+        return result
@@ -0,0 +1,320 @@
+# backend/app/services/llm_resilience.py
+#
+# Resilience layer around an LLMProvider (wired in llm_client.start_llm_client):
+#   - per-attempt deadline, plus an overall deadline across retries
+#   - bounded retries with full jitter on timeouts, connection errors, 429 and 5xx, honouring
+#     retry-after / retry-after-ms when the provider sends them
+#   - circuit breaker: after LLM_BREAKER_FAILURE_THRESHOLD consecutive upstream failures calls
+#     fail fast with 503 + Retry-After until a single probe call succeeds
+#   - optional hedging of non-streamed completions: a second attempt is started when the first
+#     is slower than the recent p95, and whichever succeeds first wins
+# Streams are retried only until the first token arrives; after that the reply cannot be
+# replayed, so later gaps longer than LLM_STREAM_IDLE_TIMEOUT_SECONDS end the stream with an error.
+#
+# The SDK's own retries are disabled (LLM_MAX_RETRIES=0) so attempts are not multiplied.
+# benchmarks/bench_llm_resilience.py exercises all of this against benchmarks/fake_llm_server.py
+# with injected faults.
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import httpx
+import groq
+
+from app.core.metrics import (
+    LLM_CIRCUIT_OPEN, record_llm_circuit_rejection, record_llm_hedge, record_llm_retry,
+)
+from app.services.llm_providers import ChatCompletion, CompletionStream, LLMProvider
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration (override via environment / config/.env) ---
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "30")) # streams: until the first token
+LLM_TOTAL_TIMEOUT_SECONDS = float(os.getenv("LLM_TOTAL_TIMEOUT_SECONDS", "60"))
+LLM_STREAM_IDLE_TIMEOUT_SECONDS = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT_SECONDS", "20"))
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "0.25"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "4"))
+LLM_RETRY_AFTER_MAX_SECONDS = float(os.getenv("LLM_RETRY_AFTER_MAX_SECONDS", "10")) # longer waits are not retried
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMUnavailableError(Exception):
+    """Raised instead of calling the provider; carries the HTTP status (and Retry-After) to return."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def _retry_reason(exc: BaseException) -> Optional[str]:
+    """Why `exc` is worth another attempt, or None if it is not (bad request, auth, ...)."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, (groq.APIConnectionError, httpx.TransportError)):
+        return "connection"
+    code = _status_code(exc)
+    if code == 429:
+        return "rate_limited"
+    if code in RETRYABLE_STATUS_CODES:
+        return "server_error"
+    return None
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Delay requested by the provider (retry-after-ms, retry-after seconds or HTTP date), if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. Closed: everything passes. Open: calls are rejected for
+    reset_seconds. Then one probe call is let through; its success closes the breaker, its
+    failure re-opens it. A probe that never reports back (cancelled request) is replaced after
+    another reset_seconds.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_BREAKER_RESET_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = self.clock()
+        if now - self.opened_at < self.reset_seconds:
+            return False
+        if self.probe_started_at is not None and now - self.probe_started_at < self.reset_seconds:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_seconds - (self.clock() - self.opened_at), 1.0)
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("LLM circuit breaker closed.")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.probe_started_at = None
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("LLM circuit breaker opened after %s consecutive failures.", self.consecutive_failures)
+            self.opened_at = self.clock()
+
+
+class LatencyWindow:
+    """Recent successful attempt durations; the hedge delay is their quantile (re-sorted every 16 samples)."""
+
+    def __init__(self, size: int = LLM_HEDGE_WINDOW, quantile: float = LLM_HEDGE_QUANTILE,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES, min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS):
+        self.samples = deque(maxlen=size)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._cached: Optional[float] = None
+        self._since_update = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._since_update += 1
+        if self._since_update >= 16:
+            self._cached = None
+
+    def hedge_delay(self) -> Optional[float]:
+        """None until enough samples have been seen."""
+        if len(self.samples) < self.min_samples:
+            return None
+        if self._cached is None:
+            ordered = sorted(self.samples)
+            self._cached = max(ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)], self.min_delay)
+            self._since_update = 0
+        return self._cached
+
+
+class ResilientProvider(LLMProvider):
+    """Wraps another provider with deadlines, retries, a circuit breaker and optional hedging."""
+
+    def __init__(self, inner: LLMProvider, attempt_timeout: float = LLM_ATTEMPT_TIMEOUT_SECONDS,
+                 total_timeout: float = LLM_TOTAL_TIMEOUT_SECONDS, stream_idle_timeout: float = LLM_STREAM_IDLE_TIMEOUT_SECONDS,
+                 max_attempts: int = LLM_RETRY_MAX_ATTEMPTS, base_delay: float = LLM_RETRY_BASE_DELAY_SECONDS,
+                 max_delay: float = LLM_RETRY_MAX_DELAY_SECONDS, retry_after_max: float = LLM_RETRY_AFTER_MAX_SECONDS,
+                 hedge: bool = LLM_HEDGE_ENABLED, breaker: Optional[CircuitBreaker] = None,
+                 latencies: Optional[LatencyWindow] = None):
+        self.inner = inner
+        self.name = inner.name
+        self.model_name = inner.model_name
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.stream_idle_timeout = stream_idle_timeout
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_after_max = retry_after_max
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = latencies or LatencyWindow()
+        LLM_CIRCUIT_OPEN.set_function(lambda: 1 if self.breaker.is_open() else 0)
+
+    def _backoff(self, attempt: int, exc: BaseException) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the provider asked for longer than we accept."""
+        requested = retry_after_seconds(exc)
+        if requested is not None:
+            if requested > self.retry_after_max:
+                return None
+            return requested + random.uniform(0, self.base_delay) # spread clients released together
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))) # full jitter
+
+    async def _with_retries(self, attempt_call: Callable[[float], Awaitable]):
+        deadline = time.monotonic() + self.total_timeout
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                record_llm_circuit_rejection()
+                raise LLMUnavailableError("AI service is temporarily unavailable (circuit open).", 503, self.breaker.retry_after())
+            timeout = min(self.attempt_timeout, deadline - time.monotonic())
+            try:
+                result = await attempt_call(timeout)
+            except Exception as exc:
+                reason = _retry_reason(exc)
+                if reason is None:
+                    self.breaker.record_success() # the provider answered; the request itself was bad
+                    raise
+                if reason != "rate_limited":
+                    self.breaker.record_failure()
+                delay = self._backoff(attempt, exc)
+                out_of_time = delay is None or time.monotonic() + delay >= deadline
+                if attempt + 1 >= self.max_attempts or out_of_time or self.breaker.is_open():
+                    if isinstance(exc, asyncio.TimeoutError):
+                        raise LLMUnavailableError(f"AI service did not respond within {timeout:.1f}s.", 504) from exc
+                    raise
+                record_llm_retry(reason)
+                logger.warning("LLM attempt %s failed (%s); retrying in %.2fs.", attempt + 1, reason, delay)
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    # --- complete ---
+    async def _timed_complete(self, messages, max_tokens, temperature) -> ChatCompletion:
+        started = time.monotonic()
+        completion = await self.inner.complete(messages, max_tokens, temperature)
+        self.latencies.add(time.monotonic() - started)
+        return completion
+
+    async def _hedged_complete(self, messages, max_tokens, temperature) -> ChatCompletion:
+        delay = self.latencies.hedge_delay() if self.hedge else None
+        if delay is None:
+            return await self._timed_complete(messages, max_tokens, temperature)
+        tasks = {asyncio.ensure_future(self._timed_complete(messages, max_tokens, temperature))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                record_llm_hedge()
+                tasks.add(asyncio.ensure_future(self._timed_complete(messages, max_tokens, temperature)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def complete(self, messages, max_tokens, temperature) -> ChatCompletion:
+        async def attempt(timeout: float) -> ChatCompletion:
+            return await asyncio.wait_for(self._hedged_complete(messages, max_tokens, temperature), timeout)
+        return await self._with_retries(attempt)
+
+    # --- stream ---
+    async def stream(self, messages, max_tokens, temperature) -> CompletionStream:
+        async def attempt(timeout: float):
+            async def open_until_first_token():
+                upstream = await self.inner.stream(messages, max_tokens, temperature)
+                tokens = upstream.__aiter__()
+                try:
+                    first = await tokens.__anext__()
+                except StopAsyncIteration:
+                    first = None
+                except BaseException: # timed out or cancelled before the first token: release the connection
+                    await tokens.aclose()
+                    raise
+                return upstream, tokens, first
+            return await asyncio.wait_for(open_until_first_token(), timeout)
+
+        upstream, tokens, first = await self._with_retries(attempt)
+        result = CompletionStream()
+
+        async def relay():
+            try:
+                if first is None:
+                    return
+                yield first
+                while True:
+                    try:
+                        token = await asyncio.wait_for(tokens.__anext__(), self.stream_idle_timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError as exc:
+                        raise LLMUnavailableError(
+                            f"AI service stalled for {self.stream_idle_timeout:.1f}s mid-reply.", 504,
+                        ) from exc
+                    yield token
+            finally:
+                result.usage = upstream.usage
+                await tokens.aclose()
+
+        result._tokens = relay()
+        return result
@@ -0,0 +1,160 @@
+# backend/app/services/llm_scheduler.py
+#
+# Fair-share admission for LLM calls (per worker process). At most LLM_MAX_CONCURRENCY calls run
+# at once; the rest wait in per-user queues served by deficit round robin, weighted by each
+# call's estimated token cost (prompt + max completion). A user with many queued turns therefore
+# gets the same token share as a user with one, instead of starving everyone behind them.
+# Calls that would wait longer than LLM_QUEUE_MAX_WAIT_SECONDS, or arrive when the user already
+# has LLM_QUEUE_MAX_PER_USER waiting, are rejected with 429 and a Retry-After estimate.
+
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+
+from fastapi import HTTPException, status
+
+from app.core.metrics import (
+    LLM_QUEUE_DEPTH, LLM_SLOTS_IN_USE, record_llm_queue_rejection, record_llm_queue_wait,
+)
+
+# --- Configuration ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_QUANTUM_TOKENS = int(os.getenv("LLM_QUEUE_QUANTUM_TOKENS", "4096"))
+LLM_QUEUE_MAX_WAIT_SECONDS = float(os.getenv("LLM_QUEUE_MAX_WAIT_SECONDS", "10"))
+LLM_QUEUE_MAX_PER_USER = int(os.getenv("LLM_QUEUE_MAX_PER_USER", "8"))
+LLM_QUEUE_RETRY_AFTER_MAX_SECONDS = 60
+
+
+class _Waiter:
+    __slots__ = ("cost", "future")
+
+    def __init__(self, cost: int, future: asyncio.Future):
+        self.cost = cost
+        self.future = future
+
+
+class FairScheduler:
+    """
+    Concurrency cap plus per-user DRR queues. Only touched from the event loop thread.
+    Each time a user reaches the head of the round it earns `quantum` tokens of credit and
+    is served while its next call fits in that credit; otherwise it goes to the back.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, quantum: int = LLM_QUEUE_QUANTUM_TOKENS,
+                 max_wait: float = LLM_QUEUE_MAX_WAIT_SECONDS, max_per_user: int = LLM_QUEUE_MAX_PER_USER):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.quantum = max(quantum, 1)
+        self.max_wait = max_wait
+        self.max_per_user = max_per_user
+        self.in_use = 0
+        self.queued = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._deficits: Dict[str, int] = {}
+        self._round: Deque[str] = deque() # users with waiters, in service order
+        self._turn_open = False # the head of _round has already been credited this turn
+        self._mean_hold = 1.0 # EWMA of slot hold time (seconds), for Retry-After
+        LLM_SLOTS_IN_USE.set_function(lambda: self.in_use)
+        LLM_QUEUE_DEPTH.set_function(lambda: self.queued)
+
+    def retry_after(self) -> int:
+        """Rough time until a newly queued call would start."""
+        estimate = self._mean_hold * (self.queued + 1) / self.max_concurrency
+        return min(max(math.ceil(estimate), 1), LLM_QUEUE_RETRY_AFTER_MAX_SECONDS)
+
+    def _reject(self, reason: str, detail: str) -> HTTPException:
+        record_llm_queue_rejection(reason)
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail,
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    def _dispatch(self) -> None:
+        while self.in_use < self.max_concurrency and self._round:
+            user_id = self._round[0]
+            queue = self._queues[user_id]
+            if not self._turn_open:
+                self._deficits[user_id] = self._deficits.get(user_id, 0) + self.quantum
+                self._turn_open = True
+            waiter = queue[0]
+            if waiter.cost > self._deficits[user_id]:
+                self._round.rotate(-1)
+                self._turn_open = False
+                continue
+            queue.popleft()
+            self._deficits[user_id] -= waiter.cost
+            self.queued -= 1
+            self.in_use += 1
+            waiter.future.set_result(None)
+            if not queue: # DRR: an emptied queue leaves the round and forfeits its credit
+                self._round.popleft()
+                del self._queues[user_id]
+                self._deficits.pop(user_id, None)
+                self._turn_open = False
+
+    def _forget(self, user_id: str, waiter: _Waiter) -> None:
+        """Removes a waiter that gave up, so it no longer counts toward max_per_user or the queue depth."""
+        self.queued -= 1
+        queue = self._queues.get(user_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue: # DRR: an emptied queue leaves the round and forfeits its credit
+            if self._round and self._round[0] == user_id:
+                self._turn_open = False
+            self._round.remove(user_id)
+            del self._queues[user_id]
+            self._deficits.pop(user_id, None)
+
+    def _release(self, held_since: float) -> None:
+        self.in_use -= 1
+        self._mean_hold += 0.1 * ((time.monotonic() - held_since) - self._mean_hold)
+        self._dispatch()
+
+    async def _acquire(self, user_id: str, cost: int) -> None:
+        started = time.monotonic()
+        if self.in_use < self.max_concurrency and not self._round:
+            self.in_use += 1
+            record_llm_queue_wait(0.0)
+            return
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_per_user:
+            raise self._reject("user_queue_full", "Too many AI requests in progress for this account. Please retry shortly.")
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._round.append(user_id)
+        waiter = _Waiter(cost, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done(): # granted just as we gave up: hand the slot back
+                self._release(time.monotonic())
+            else:
+                waiter.future.cancel()
+                self._forget(user_id, waiter)
+                self._dispatch() # the head of the round may have changed
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject("timeout", "The AI service is busy. Please retry shortly.") from exc
+            raise
+        record_llm_queue_wait(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, cost: int = 1) -> AsyncIterator[None]:
+        """Holds one of the concurrency slots for the duration of the block (a whole stream, for SSE)."""
+        await self._acquire(user_id, cost)
+        held_since = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(held_since)
+
+
+llm_scheduler = FairScheduler()
@@ -0,0 +1,209 @@
+# backend/app/services/memory_index.py
+
+import os
+import re
+import math
+import time
+import heapq
+import asyncio
+import logging
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+MEMORY_INDEX_MAX_USERS = int(os.getenv("MEMORY_INDEX_MAX_USERS", "2000")) # per-process LRU of loaded user indexes
+# Indexes are rebuilt from Mongo after this long, so writes handled by other workers are picked up.
+MEMORY_INDEX_TTL_SECONDS = float(os.getenv("MEMORY_INDEX_TTL_SECONDS", "300"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Term-frequency weight per field.
+FIELD_WEIGHTS = {"title": 2.0, "tags": 2.0, "description": 1.0}
+DESCRIPTION_SNIPPET_CHARS = 100
+INDEX_PROJECTION = {"title": 1, "description": 1, "tags": 1, "significance": 1, "created_at": 1}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have i if in into is it its me my of on or our "
+    "so that the their them then there these they this to was we were what when where which who "
+    "will with would you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def significance_weight(significance: int) -> float:
+    """Multiplier applied to BM25 scores: 0.8 for significance 1 up to 1.2 for 5."""
+    return 0.7 + 0.1 * max(1, min(5, significance))
+
+
+@dataclass
+class IndexedMemory:
+    """What the prompt needs from a memory, kept in the index to avoid re-reading Mongo."""
+    memory_id: str
+    title: str
+    description_snippet: str
+    tags: List[str]
+    significance: int
+    created_at: datetime
+    length: float
+
+
+class UserMemoryIndex:
+    """BM25 index over one user's memories (title, description, tags)."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.docs: Dict[str, IndexedMemory] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.total_length = 0.0
+        self.built_at = time.monotonic()
+
+    def upsert(self, doc: Dict[str, Any]) -> None:
+        memory_id = str(doc["_id"])
+        self.remove(memory_id)
+        weighted_tf: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = doc.get(field) or ""
+            text = " ".join(value) if isinstance(value, list) else str(value)
+            for term in tokenize(text):
+                weighted_tf[term] += weight
+        for term, tf in weighted_tf.items():
+            self.postings.setdefault(term, {})[memory_id] = tf
+        self.doc_terms[memory_id] = list(weighted_tf)
+        length = sum(weighted_tf.values())
+        description = doc.get("description", "") or ""
+        self.docs[memory_id] = IndexedMemory(
+            memory_id=memory_id,
+            title=doc.get("title", "Untitled Memory"),
+            description_snippet=(description[:DESCRIPTION_SNIPPET_CHARS] + '...') if len(description) > DESCRIPTION_SNIPPET_CHARS + 3 else description,
+            tags=list(doc.get("tags", [])),
+            significance=int(doc.get("significance", 3) or 3),
+            created_at=doc.get("created_at") or datetime.min,
+            length=length,
+        )
+        self.total_length += length
+
+    def remove(self, memory_id: str) -> None:
+        existing = self.docs.pop(memory_id, None)
+        if existing is None:
+            return
+        self.total_length -= existing.length
+        for term in self.doc_terms.pop(memory_id, []):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(memory_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str, limit: int) -> List[IndexedMemory]:
+        """Top `limit` memories by BM25 x significance; padded with the newest memories if few match."""
+        n_docs = len(self.docs)
+        if n_docs == 0 or limit <= 0:
+            return []
+        avg_length = (self.total_length / n_docs) or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for memory_id, tf in posting.items():
+                doc_length = self.docs[memory_id].length
+                norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_length / avg_length))
+                scores[memory_id] = scores.get(memory_id, 0.0) + idf * norm
+        ranked = heapq.nlargest(
+            limit, scores.items(),
+            key=lambda item: item[1] * significance_weight(self.docs[item[0]].significance),
+        )
+        results = [self.docs[memory_id] for memory_id, _ in ranked]
+        if len(results) < limit:
+            seen = set(scores)
+            newest = heapq.nlargest(
+                limit - len(results),
+                (doc for memory_id, doc in self.docs.items() if memory_id not in seen),
+                key=lambda doc: doc.created_at,
+            )
+            results.extend(newest)
+        return results
+
+
+class MemoryIndexRegistry:
+    """
+    Per-process cache of UserMemoryIndex objects.
+    Indexes are built lazily from Mongo on first query and then kept current by the
+    memories router through on_memory_upserted / on_memory_deleted.
+    """
+
+    def __init__(self, max_users: int = MEMORY_INDEX_MAX_USERS, ttl_seconds: float = MEMORY_INDEX_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._indexes: "OrderedDict[str, UserMemoryIndex]" = OrderedDict()
+        self._build_locks: Dict[str, asyncio.Lock] = {}
+        # Writes that arrive while a user's index is being built, replayed once it is ready.
+        self._pending: Dict[str, List[Tuple[str, Any]]] = {}
+
+    async def _get_index(self, collection: AsyncIOMotorCollection, user_id: str) -> UserMemoryIndex:
+        index = self._indexes.get(user_id)
+        if index is not None and time.monotonic() - index.built_at < self.ttl_seconds:
+            self._indexes.move_to_end(user_id)
+            return index
+        lock = self._build_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(user_id)
+            if index is not None and time.monotonic() - index.built_at < self.ttl_seconds:
+                return index
+            self._pending[user_id] = []
+            try:
+                index = UserMemoryIndex()
+                async for doc in collection.find({"user_id": user_id}, INDEX_PROJECTION):
+                    index.upsert(doc)
+                for op, payload in self._pending[user_id]:
+                    if op == "upsert":
+                        index.upsert(payload)
+                    else:
+                        index.remove(payload)
+            finally:
+                self._pending.pop(user_id, None)
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                evicted_user_id, _ = self._indexes.popitem(last=False)
+                self._build_locks.pop(evicted_user_id, None)
+            logger.debug("Built memory index for user '%s' (%s memories).", user_id, len(index.docs))
+            return index
+
+    async def search(self, collection: AsyncIOMotorCollection, user_id: str, query: str, limit: int) -> List[IndexedMemory]:
+        index = await self._get_index(collection, user_id)
+        return index.search(query, limit)
+
+    def on_memory_upserted(self, doc: Dict[str, Any]) -> None:
+        """Call after a memory is created or modified (pass the full stored document)."""
+        user_id = doc.get("user_id")
+        if user_id in self._pending:
+            self._pending[user_id].append(("upsert", doc))
+        index: Optional[UserMemoryIndex] = self._indexes.get(user_id)
+        if index is not None:
+            index.upsert(doc)
+
+    def on_memory_deleted(self, user_id: str, memory_id: str) -> None:
+        """Call after a memory is deleted."""
+        if user_id in self._pending:
+            self._pending[user_id].append(("remove", memory_id))
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove(memory_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drops the user's index so the next query rebuilds it from Mongo (e.g. after a failed update hook)."""
+        self._indexes.pop(user_id, None)
+
+
+memory_index = MemoryIndexRegistry()
@@ -0,0 +1,122 @@
+# backend/app/services/prompt_builder.py
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List
+
+# --- Configuration ---
+# Context window sizes (tokens) for the Groq models we use; unknown models fall back to the default.
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+COMPLETION_MAX_TOKENS = 450 # max_tokens requested from the LLM; reserved out of the window
+# Hard cap on prompt size regardless of the model window (keeps latency/cost predictable).
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+# Upper bound for the memory block inside the system prompt.
+PROMPT_MEMORY_TOKEN_BUDGET = int(os.getenv("PROMPT_MEMORY_TOKEN_BUDGET", "600"))
+# The approximate tokenizer can under-count; keep this share of the window unused.
+TOKENIZER_SAFETY_MARGIN = 0.1
+MESSAGE_OVERHEAD_TOKENS = 4 # role/formatting tokens the chat template adds per message
+MEMORY_CONTEXT_PLACEHOLDER = "{memory_context}"
+TRUNCATION_MARKER = " ..."
+
+# --- Approximate Tokenizer ---
+# Words and single punctuation marks, with long words split every 4 characters,
+# which tracks BPE tokenizers (Llama 3, GPT) closely enough for budgeting.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of LLM tokens in `text`."""
+    return sum(1 + (len(tok) - 1) // 4 for tok in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keeps the beginning of `text` up to roughly `max_tokens` tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(TRUNCATION_MARKER)
+    if keep <= 0:
+        return ""
+    used = 0
+    for match in _TOKEN_RE.finditer(text):
+        used += 1 + (len(match.group()) - 1) // 4
+        if used > keep:
+            return text[:match.start()].rstrip() + TRUNCATION_MARKER
+    return text
+
+
+def prompt_budget_for_model(model_name: str) -> int:
+    """Tokens available for the prompt: the model window minus the completion and safety margin, capped by PROMPT_TOKEN_BUDGET."""
+    window = MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+    usable = int(window * (1 - TOKENIZER_SAFETY_MARGIN)) - COMPLETION_MAX_TOKENS
+    return max(min(usable, PROMPT_TOKEN_BUDGET), 0)
+
+
+@dataclass
+class AssembledPrompt:
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    memories_used: int
+    history_messages_used: int
+
+
+class PromptAssembler:
+    """
+    Fills a token budget in priority order:
+    system prompt > latest user message > memories > conversation history (newest first).
+    """
+
+    def __init__(self, total_budget: int, memory_budget: int = PROMPT_MEMORY_TOKEN_BUDGET):
+        self.total_budget = total_budget
+        self.memory_budget = memory_budget
+
+    def assemble(
+        self, system_template: str, memory_snippets: List[str], conversation: List[Dict[str, str]],
+        memory_header: str, no_memories_text: str,
+    ) -> AssembledPrompt:
+        """
+        `system_template` must contain MEMORY_CONTEXT_PLACEHOLDER; `conversation` is oldest-first
+        role/content dicts whose last entry is the latest user message.
+        """
+        base_system = system_template.replace(MEMORY_CONTEXT_PLACEHOLDER, "")
+        used = count_tokens(base_system) + MESSAGE_OVERHEAD_TOKENS
+
+        latest = conversation[-1] if conversation else None
+        if latest is not None:
+            room = self.total_budget - used - MESSAGE_OVERHEAD_TOKENS - count_tokens(no_memories_text)
+            latest = {"role": latest["role"], "content": truncate_to_tokens(latest["content"], room)}
+            used += count_tokens(latest["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+        chosen_memories: List[str] = []
+        memory_room = min(self.memory_budget, self.total_budget - used) - count_tokens(memory_header)
+        for snippet in memory_snippets:
+            cost = count_tokens(snippet) + 1 # joining newline
+            if cost > memory_room:
+                break
+            chosen_memories.append(snippet)
+            memory_room -= cost
+        memory_context = memory_header + "\n".join(chosen_memories) if chosen_memories else no_memories_text
+        system_prompt = system_template.replace(MEMORY_CONTEXT_PLACEHOLDER, memory_context)
+        used += count_tokens(system_prompt) - count_tokens(base_system)
+
+        history: List[Dict[str, str]] = []
+        for message in reversed(conversation[:-1]):
+            cost = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if used + cost > self.total_budget:
+                break
+            history.append(message)
+            used += cost
+        history.reverse()
+
+        messages = [{"role": "system", "content": system_prompt}] + history + ([latest] if latest else [])
+        return AssembledPrompt(
+            messages=messages, prompt_tokens=used,
+            memories_used=len(chosen_memories), history_messages_used=len(history),
+        )
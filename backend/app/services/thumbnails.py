@@ -0,0 +1,146 @@
+# backend/app/services/thumbnails.py
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from app.services.attachment_storage import (
+    BLOB_TMP_DIR, copy_blob_to_file, get_blob_backend, register_companion_keys, run_in_io_pool,
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from app.services.image_worker import render_derivatives
+    THUMBNAILS_AVAILABLE = True
+except ImportError: # Pillow not installed: ?size= falls back to the original
+    render_derivatives = None
+    THUMBNAILS_AVAILABLE = False
+
+# --- Configuration ---
+# Longest edge in pixels per ?size= variant.
+THUMBNAIL_VARIANTS: Dict[str, int] = {"small": 320, "medium": 1024}
+# URL format name -> (Pillow format, media type). WebP is served when the client accepts it.
+THUMBNAIL_FORMATS: Dict[str, Tuple[str, str]] = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+THUMBNAIL_SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+# Resizing is CPU-bound, so it runs in separate processes rather than threads.
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Blobs whose generation failed (corrupt or unsupported images) are not retried for this long;
+# at most THUMBNAIL_FAILURE_CACHE_SIZE of them are remembered, least recently failed dropped first.
+THUMBNAIL_RETRY_AFTER_SECONDS = float(os.getenv("THUMBNAIL_RETRY_AFTER_SECONDS", "3600"))
+THUMBNAIL_FAILURE_CACHE_SIZE = int(os.getenv("THUMBNAIL_FAILURE_CACHE_SIZE", "4096"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_in_flight: Dict[str, "asyncio.Task[bool]"] = {} # sha256 -> running generation (dedupes concurrent requests)
+_failed: "OrderedDict[str, float]" = OrderedDict() # sha256 -> monotonic time of the last failed generation
+
+
+def derivative_key(sha256: str, variant: str, fmt: str) -> str:
+    return f"{sha256}.{variant}.{fmt}"
+
+
+def derivative_keys(sha256: str) -> List[str]:
+    return [derivative_key(sha256, variant, fmt) for variant in THUMBNAIL_VARIANTS for fmt in THUMBNAIL_FORMATS]
+
+
+register_companion_keys(derivative_keys) # blob GC removes thumbnails with their original
+
+
+def is_thumbnailable(filename: str) -> bool:
+    return THUMBNAILS_AVAILABLE and os.path.splitext(filename)[1].lower() in THUMBNAIL_SOURCE_EXTENSIONS
+
+
+def preferred_format(accept_header: Optional[str]) -> str:
+    return "webp" if accept_header and "image/webp" in accept_header else "jpeg"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # "spawn": forking a process that already runs Motor/executor threads is unsafe.
+        _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def _generate(sha256: str) -> bool:
+    backend = get_blob_backend()
+    keys = derivative_keys(sha256)
+    if await backend.exists(keys[-1]): # derivatives are stored in order, so the last one marks completion
+        return True
+    source_path = backend.local_path(sha256)
+    temp_source = None
+    outputs = [(key, os.path.join(BLOB_TMP_DIR, f"{uuid.uuid4().hex}.part")) for key in keys]
+    try:
+        if source_path is None: # e.g. GridFS: the worker needs a real file
+            temp_source = os.path.join(BLOB_TMP_DIR, f"{uuid.uuid4().hex}.part")
+            await copy_blob_to_file(sha256, temp_source)
+            source_path = temp_source
+        targets = []
+        for (key, output_path) in outputs:
+            _, variant, fmt = key.split(".")
+            targets.append((THUMBNAIL_VARIANTS[variant], THUMBNAIL_FORMATS[fmt][0], output_path))
+        await asyncio.get_running_loop().run_in_executor(_get_pool(), render_derivatives, source_path, targets)
+        for key, output_path in outputs:
+            await backend.store_file(key, output_path)
+        logger.info("Thumbnails generated for blob %s", sha256[:12])
+        return True
+    except Exception as e:
+        logger.warning("Thumbnail generation failed for blob %s: %s", sha256[:12], e)
+        _record_failure(sha256)
+        return False
+    finally:
+        for path in [temp_source] + [output_path for _, output_path in outputs]:
+            if path:
+                await run_in_io_pool(_remove_if_present, path)
+
+
+def _remove_if_present(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _record_failure(sha256: str) -> None:
+    _failed[sha256] = time.monotonic()
+    _failed.move_to_end(sha256)
+    while len(_failed) > THUMBNAIL_FAILURE_CACHE_SIZE:
+        _failed.popitem(last=False)
+
+
+def _recently_failed(sha256: str) -> bool:
+    failed_at = _failed.get(sha256)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at >= THUMBNAIL_RETRY_AFTER_SECONDS:
+        del _failed[sha256]
+        return False
+    return True
+
+
+def schedule_thumbnails(sha256: str) -> Optional["asyncio.Task[bool]"]:
+    """
+    Starts producing every variant/format for a blob in the background (no-op if they exist).
+    Concurrent calls for the same blob share one generation; the task is kept alive by _in_flight.
+    Returns None when Pillow is not installed or the blob failed within THUMBNAIL_RETRY_AFTER_SECONDS.
+    """
+    if not THUMBNAILS_AVAILABLE or _recently_failed(sha256):
+        return None
+    task = _in_flight.get(sha256)
+    if task is None:
+        task = asyncio.ensure_future(_generate(sha256))
+        _in_flight[sha256] = task
+        task.add_done_callback(lambda _: _in_flight.pop(sha256, None))
+    return task
+
+
+async def shutdown_thumbnail_pool():
+    """Stops the image worker processes on application shutdown."""
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,82 @@
+# backend/benchmarks/bench_attachment_download.py
+#
+# Concurrent attachment download throughput: full downloads, 1 MiB range requests (media seeking)
+# and conditional revalidation (If-None-Match -> 304). Needs the API running.
+#
+# Run from backend/:  python -m benchmarks.bench_attachment_download --file-mb 64 --concurrency 32 --seconds 10
+
+import os
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import percentile, register_and_login
+
+RANGE_BYTES = 1024 * 1024
+
+
+async def create_attachment(client: httpx.AsyncClient, headers: dict, file_mb: int) -> str:
+    response = await client.post(
+        "/api/v1/memories", data={"title": "Download bench", "description": "Large attachment"},
+        files={"files": ("bench.bin", os.urandom(file_mb * 1024 * 1024), "application/octet-stream")},
+        headers=headers,
+    )
+    response.raise_for_status()
+    return response.json()["attachments"][0]
+
+
+async def run_mode(client: httpx.AsyncClient, headers: dict, url: str, size: int, mode: str,
+                   concurrency: int, seconds: float, etag: str) -> None:
+    latencies, transferred = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        nonlocal transferred
+        while time.perf_counter() < deadline:
+            request_headers = dict(headers)
+            if mode == "range":
+                start = random.randrange(0, max(size - RANGE_BYTES, 1))
+                request_headers["Range"] = f"bytes={start}-{start + RANGE_BYTES - 1}"
+            elif mode == "revalidate":
+                request_headers["If-None-Match"] = etag
+            started = time.perf_counter()
+            async with client.stream("GET", url, headers=request_headers) as response:
+                async for chunk in response.aiter_raw():
+                    transferred += len(chunk)
+            expected = {"full": 200, "range": 206, "revalidate": 304}[mode]
+            if response.status_code != expected:
+                raise RuntimeError(f"{mode}: expected {expected}, got {response.status_code}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"{mode:<11} req/s={len(latencies) / elapsed:8.1f} MB/s={transferred / elapsed / 1e6:8.1f} "
+          f"p50={percentile(latencies, 50):7.1f}ms p99={percentile(latencies, 99):7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Attachment download throughput")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--file-mb", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+        headers = {"Authorization": f"Bearer {await register_and_login(client, prefix='download')}"}
+        url = await create_attachment(client, headers, args.file_mb)
+        head = await client.head(url, headers=headers)
+        head.raise_for_status()
+        size, etag = int(head.headers["content-length"]), head.headers["etag"]
+        print(f"{url} size={size} etag={etag} concurrency={args.concurrency}")
+        for mode in ("full", "range", "revalidate"):
+            await run_mode(client, headers, url, size, mode, args.concurrency, args.seconds, etag)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
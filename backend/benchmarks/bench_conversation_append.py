@@ -0,0 +1,80 @@
+# backend/benchmarks/bench_conversation_append.py
+#
+# Compares the old read-modify-replace chat-turn write against the atomic $push path
+# as a conversation grows. Needs a local mongod (MONGODB_URI, default localhost).
+#
+# Run from backend/:  python -m benchmarks.bench_conversation_append
+
+import os
+import time
+import uuid
+import asyncio
+import statistics
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.routers.conversation import (
+    CONVERSATIONS_COLLECTION_NAME, ConversationInDB, Message,
+    db_get_conversation, db_update_conversation, db_append_messages,
+)
+
+SIZES = [10, 100, 1000, 5000]
+TURNS_PER_SIZE = 50
+BENCH_DB_NAME = "future_self_bench"
+USER_ID = "bench-user"
+
+
+async def seed_conversation(db, size: int) -> str:
+    conversation_id = str(uuid.uuid4())
+    messages = [Message(role="user" if i % 2 == 0 else "future_self", content=f"message {i} " + "x" * 200) for i in range(size)]
+    conv = ConversationInDB(_id=conversation_id, user_id=USER_ID, messages=messages, title=f"bench {size}")
+    await db[CONVERSATIONS_COLLECTION_NAME].insert_one(conv.model_dump(by_alias=True))
+    return conversation_id
+
+
+async def turn_replace(db, conversation_id: str):
+    conv = await db_get_conversation(db, conversation_id, USER_ID)
+    conv.messages.append(Message(role="user", content="hello"))
+    conv.messages.append(Message(role="future_self", content="hi there"))
+    await db_update_conversation(db, conv)
+
+
+async def turn_append(db, conversation_id: str):
+    await db_append_messages(
+        db, conversation_id, USER_ID,
+        [Message(role="user", content="hello"), Message(role="future_self", content="hi there")],
+        message_window=10,
+    )
+
+
+async def time_turns(turn, db, conversation_id: str) -> float:
+    samples = []
+    for _ in range(TURNS_PER_SIZE):
+        start = time.perf_counter()
+        await turn(db, conversation_id)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ["MONGODB_URI"])
+    db = client[BENCH_DB_NAME]
+    await db[CONVERSATIONS_COLLECTION_NAME].drop()
+    print(f"{'messages':>10} {'replace p50 (ms)':>18} {'append p50 (ms)':>18}")
+    try:
+        for size in SIZES:
+            replace_id = await seed_conversation(db, size)
+            append_id = await seed_conversation(db, size)
+            replace_ms = await time_turns(turn_replace, db, replace_id)
+            append_ms = await time_turns(turn_append, db, append_id)
+            print(f"{size:>10} {replace_ms:>18.2f} {append_ms:>18.2f}")
+    finally:
+        await db[CONVERSATIONS_COLLECTION_NAME].drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
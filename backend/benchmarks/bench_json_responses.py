@@ -0,0 +1,112 @@
+# backend/benchmarks/bench_json_responses.py
+#
+# Requests/sec for the response_model path vs the fast JSON path (app/core/responses.py):
+# listing 100 memories and fetching a 1,000-message conversation. Runs the real models and
+# serializers in-process behind FastAPI (httpx ASGI transport) with synthetic documents, so
+# MongoDB and the network are out of the picture. Also checks both paths emit the same JSON.
+#
+# Run from backend/:  python -m benchmarks.bench_json_responses --seconds 5
+
+import os
+import json
+import time
+import logging
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "json-benchmark")
+
+import httpx
+from fastapi import FastAPI
+
+import app.main # noqa: F401  (routers import their dependencies from main; load it first, as the server does)
+from app.core.responses import FastJSONResponse, orjson
+from app.routers.memories import Memory, memory_serializer
+from app.routers.conversation import ConversationInDB, ConversationResponse, conversation_serializer
+
+
+def synthetic_memories(count: int) -> List[dict]:
+    base = datetime(2024, 1, 1)
+    return [{
+        "_id": str(uuid.uuid4()), "user_id": "bench-user", "title": f"Memory {i}",
+        "description": "A day worth remembering. " * 12, "significance": i % 5 + 1,
+        "tags": ["family", "travel"], "attachments": [f"/api/v1/attachments/{'a' * 64}.jpg"],
+        "created_at": base + timedelta(minutes=i), "updated_at": base + timedelta(minutes=i, seconds=30),
+    } for i in range(count)]
+
+
+def synthetic_conversation(messages: int) -> dict:
+    base = datetime(2024, 1, 1)
+    return {
+        "_id": str(uuid.uuid4()), "user_id": "bench-user", "title": "Long conversation",
+        "created_at": base, "updated_at": base + timedelta(minutes=messages),
+        "messages": [{
+            "id": str(uuid.uuid4()), "role": "user" if i % 2 == 0 else "future_self",
+            "content": "Tell me more about how things turned out. " * 4, "timestamp": base + timedelta(minutes=i),
+        } for i in range(messages)],
+    }
+
+
+def build_app(memories: List[dict], conversation: dict) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model/memories", response_model=List[Memory])
+    async def model_memories():
+        return [Memory(**doc) for doc in memories]
+
+    @app.get("/fast/memories", response_model=List[Memory])
+    async def fast_memories():
+        return FastJSONResponse(memory_serializer.many(memories))
+
+    @app.get("/model/conversation", response_model=ConversationResponse)
+    async def model_conversation():
+        conv_in_db = ConversationInDB(**conversation)
+        return ConversationResponse(id=conv_in_db.id, **conv_in_db.model_dump(exclude={"id"}))
+
+    @app.get("/fast/conversation", response_model=ConversationResponse)
+    async def fast_conversation():
+        return FastJSONResponse(conversation_serializer.one(conversation))
+
+    return app
+
+
+async def requests_per_second(client: httpx.AsyncClient, path: str, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        response = await client.get(path)
+        response.raise_for_status()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="response_model vs fast JSON path")
+    parser.add_argument("--memories", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING) # one INFO line per request otherwise
+
+    app = build_app(synthetic_memories(args.memories), synthetic_conversation(args.messages))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        print(f"encoder: {'orjson' if orjson is not None else 'stdlib json (orjson not installed)'}")
+        for name in ("memories", "conversation"):
+            model_body = (await client.get(f"/model/{name}")).json()
+            fast_body = (await client.get(f"/fast/{name}")).json()
+            if model_body != fast_body:
+                print(f"WARNING: /{name} output differs between paths")
+                print(json.dumps(model_body, default=str)[:300])
+                print(json.dumps(fast_body, default=str)[:300])
+            model_rps = await requests_per_second(client, f"/model/{name}", args.seconds)
+            fast_rps = await requests_per_second(client, f"/fast/{name}", args.seconds)
+            print(f"{name:<13} response_model={model_rps:8.1f} req/s  fast={fast_rps:8.1f} req/s  speedup={fast_rps / model_rps:5.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
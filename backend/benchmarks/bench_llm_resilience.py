@@ -0,0 +1,133 @@
+# backend/benchmarks/bench_llm_resilience.py
+#
+# Runs the fake LLM server in-process with injected faults and drives GroqProvider directly
+# ("bare") and wrapped in ResilientProvider (app/services/llm_resilience.py) through:
+#
+#   flaky      --error-rate 5xx answers and --rate-limit-rate 429s (retry-after 0.2s)
+#   slow-tail  --slow-rate requests stall for --slow-ms; resilient runs hedge after the p95
+#   outage     every request fails; the breaker should open and then reject in microseconds,
+#              and close again via one probe call once the server recovers
+#
+# Run from backend/:  python -m benchmarks.bench_llm_resilience --requests 400 --concurrency 20
+
+import time
+import random
+import socket
+import asyncio
+import argparse
+import logging
+from collections import Counter
+from typing import List, Tuple
+
+import uvicorn
+from groq import AsyncGroq
+
+from app.services.llm_providers import GroqProvider
+from app.services.llm_resilience import CircuitBreaker, ResilientProvider
+from benchmarks import fake_llm_server
+from benchmarks.common import percentile
+
+MESSAGES = [{"role": "user", "content": "What would you tell me about patience?"}]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def set_faults(**faults):
+    fake_llm_server.app.state.faults.update(
+        {"error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after_s": 0.2, "slow_rate": 0.0, "slow_ms": 0.0}, **faults,
+    )
+
+
+async def drive(provider, requests: int, concurrency: int) -> Tuple[List[float], Counter]:
+    """Latencies (ms) of successful calls and outcome counts."""
+    latencies, outcomes = [], Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await provider.complete(MESSAGES, max_tokens=40, temperature=0.7)
+            except Exception as exc:
+                outcomes[f"{type(exc).__name__} {getattr(exc, 'status_code', '')}".strip()] += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+            outcomes["ok"] += 1
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, outcomes
+
+
+def report(label: str, latencies: List[float], outcomes: Counter, requests: int):
+    print(f"  {label:<10} success={outcomes['ok'] / requests:6.1%}  p50={percentile(latencies, 50):7.1f}ms  "
+          f"p99={percentile(latencies, 99):7.1f}ms  {dict(outcomes)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="LLM retries / hedging / circuit breaker against injected faults")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=3000.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    fake_llm_server.app.state.first_token_ms = args.first_token_ms
+    fake_llm_server.app.state.tokens_per_sec = 0.0
+    fake_llm_server.app.state.completion_tokens = 40
+    fake_llm_server.app.state.rng = random.Random(args.seed)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(fake_llm_server.app, host="127.0.0.1", port=port, log_level="error"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    client = AsyncGroq(api_key="bench", base_url=f"http://127.0.0.1:{port}", max_retries=0, timeout=60)
+    bare = GroqProvider(client, "fake-model")
+
+    def resilient(**kwargs):
+        return ResilientProvider(bare, attempt_timeout=10, total_timeout=20, base_delay=0.05, **kwargs)
+
+    try:
+        print(f"flaky: {args.error_rate:.0%} 5xx, {args.rate_limit_rate:.0%} 429")
+        set_faults(error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+        for label, provider in (("bare", bare), ("resilient", resilient())):
+            report(label, *await drive(provider, args.requests, args.concurrency), args.requests)
+
+        print(f"slow-tail: {args.slow_rate:.0%} of requests +{args.slow_ms:.0f}ms")
+        set_faults(slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+        hedged = resilient(hedge=True)
+        set_faults()
+        await drive(hedged, 50, args.concurrency) # fills the latency window used for the hedge delay
+        set_faults(slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+        for label, provider in (("bare", bare), ("hedged", hedged)):
+            report(label, *await drive(provider, args.requests, args.concurrency), args.requests)
+
+        print("outage: every request fails, then the server recovers")
+        breaker = CircuitBreaker(failure_threshold=5, reset_seconds=1.0)
+        guarded = resilient(breaker=breaker, max_attempts=1)
+        set_faults(error_rate=1.0)
+        report("down", *await drive(guarded, args.requests, args.concurrency), args.requests)
+        started = time.perf_counter()
+        await drive(guarded, 1000, args.concurrency)
+        print(f"  rejection cost while open: {(time.perf_counter() - started) / 1000 * 1e6:.1f}us/call")
+        set_faults()
+        await asyncio.sleep(breaker.reset_seconds)
+        report("probe", *await drive(guarded, 1, 1), 1) # half-open: a single call decides
+        report("recovered", *await drive(guarded, args.requests, args.concurrency), args.requests)
+    finally:
+        await client.close()
+        server.should_exit = True
+        await serve_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
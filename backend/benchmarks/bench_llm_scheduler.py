@@ -0,0 +1,83 @@
+# backend/benchmarks/bench_llm_scheduler.py
+#
+# One heavy user floods the LLM path with --heavy-requests concurrent turns while --light-users
+# users each send one turn at a time. Every call holds its slot for --call-ms (a stand-in for the
+# provider). Compares a plain FIFO semaphore of the same size with FairScheduler
+# (app/services/llm_scheduler.py): light users' end-to-end latency should stay near --call-ms
+# under DRR, while the heavy user's excess is queued or shed with 429.
+#
+# Run from backend/:  python -m benchmarks.bench_llm_scheduler --concurrency 8 --heavy-requests 400
+
+import time
+import asyncio
+import argparse
+from collections import Counter
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from app.services.llm_scheduler import FairScheduler
+from benchmarks.common import percentile
+
+
+class FifoSlots:
+    """Baseline: one global queue, first come first served."""
+
+    def __init__(self, size: int):
+        self.semaphore = asyncio.Semaphore(size)
+
+    def slot(self, user_id: str, cost: int = 1):
+        return self.semaphore
+
+
+async def run(slots, args) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {"heavy": [], "light": []}
+    outcomes: Counter = Counter()
+    stop = asyncio.Event()
+
+    async def call(kind: str, user_id: str):
+        started = time.perf_counter()
+        try:
+            async with slots.slot(user_id, cost=args.cost):
+                await asyncio.sleep(args.call_ms / 1000)
+        except HTTPException as exc:
+            outcomes[f"{kind} {exc.status_code}"] += 1
+            return
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+        outcomes[f"{kind} ok"] += 1
+
+    async def light_user(index: int):
+        while not stop.is_set():
+            await call("light", f"light-{index}")
+
+    lights = [asyncio.create_task(light_user(i)) for i in range(args.light_users)]
+    await asyncio.gather(*(call("heavy", "heavy") for _ in range(args.heavy_requests)))
+    stop.set()
+    await asyncio.gather(*lights)
+    return latencies, outcomes
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="FIFO vs fair-share LLM admission under one noisy user")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--heavy-requests", type=int, default=400)
+    parser.add_argument("--light-users", type=int, default=4)
+    parser.add_argument("--call-ms", type=float, default=50.0)
+    parser.add_argument("--cost", type=int, default=600, help="tokens per call (prompt + max completion)")
+    parser.add_argument("--max-wait", type=float, default=2.0)
+    parser.add_argument("--max-per-user", type=int, default=1000)
+    args = parser.parse_args()
+
+    setups = (
+        ("fifo", FifoSlots(args.concurrency)),
+        ("fair", FairScheduler(max_concurrency=args.concurrency, max_wait=args.max_wait, max_per_user=args.max_per_user)),
+    )
+    for label, slots in setups:
+        latencies, outcomes = await run(slots, args)
+        light, heavy = latencies["light"], latencies["heavy"]
+        print(f"{label:<5} light p50={percentile(light, 50):7.1f}ms p99={percentile(light, 99):7.1f}ms  "
+              f"heavy p50={percentile(heavy, 50):7.1f}ms p99={percentile(heavy, 99):7.1f}ms  {dict(outcomes)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
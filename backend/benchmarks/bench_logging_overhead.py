@@ -0,0 +1,109 @@
+# backend/benchmarks/bench_logging_overhead.py
+#
+# Logging cost per request, as seen by the event loop. Each simulated request makes the log
+# calls of GET /api/v1/memories/{id} (two INFO lines plus a DEBUG line) in one of these setups:
+#
+#   sync-fstring   the previous setup: f-strings built eagerly, StreamHandler writing on the loop
+#   queue          app/core/logging_setup.py: %-style args, QueueHandler, writer thread
+#   queue-sampled  as above with the router logger sampled at --sample-rate
+#   level-gated    LOG_LEVEL=WARNING: INFO/DEBUG calls return before building a record
+#
+# Output goes to --sink (default /dev/null). --sink-latency-ms adds a delay per write to mimic
+# a slow or blocked stderr pipe, which the sync setup pays on the request path.
+#
+# Run from backend/:  python -m benchmarks.bench_logging_overhead --requests 20000
+
+import time
+import logging
+import argparse
+from statistics import mean
+from typing import List, Tuple
+
+from app.core import logging_setup
+from benchmarks.common import percentile
+
+ROUTER_LOGGER = "bench.routers.memories"
+
+
+class SlowStream:
+    """File wrapper whose writes take `latency` seconds, like a backed-up pipe."""
+
+    def __init__(self, stream, latency: float):
+        self.stream, self.latency = stream, latency
+
+    def write(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def request_fstring(logger, user_id, memory_id, doc):
+    logger.info(f"GET_MEMORY User '{user_id}' getting memory_id '{memory_id}'. DB type: {type(doc)}")
+    logger.debug(f"GET_MEMORY: document {doc}")
+    logger.info(f"GET_MEMORY: Memory '{memory_id}' retrieved for user '{user_id}'.")
+
+
+def request_lazy(logger, user_id, memory_id, doc):
+    logger.info("GET_MEMORY User '%s' getting memory_id '%s'", user_id, memory_id)
+    logger.debug("GET_MEMORY: document %s", doc)
+    logger.info("GET_MEMORY: Memory '%s' retrieved for user '%s'.", memory_id, user_id)
+
+
+def reset_logging():
+    logging_setup.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    router_logger = logging.getLogger(ROUTER_LOGGER)
+    for existing in list(router_logger.filters):
+        router_logger.removeFilter(existing)
+
+
+def run(setup: str, args, stream) -> Tuple[List[float], float]:
+    reset_logging()
+    request = request_lazy
+    if setup == "sync-fstring":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging_setup.StructuredFormatter())
+        logging.getLogger().addHandler(handler)
+        logging.getLogger().setLevel(logging.INFO)
+        request = request_fstring
+    else:
+        level = "WARNING" if setup == "level-gated" else "INFO"
+        rates = {ROUTER_LOGGER: args.sample_rate} if setup == "queue-sampled" else {}
+        logging_setup.configure_logging(level=level, fmt="json", sample_rates=rates, stream=stream)
+
+    logger = logging.getLogger(ROUTER_LOGGER)
+    doc = {"_id": "m-1", "title": "Memory", "description": "x" * 400, "tags": ["a", "b"], "attachments": []}
+    timings = []
+    for i in range(args.requests):
+        started = time.perf_counter()
+        request(logger, "user-1", f"memory-{i}", doc)
+        timings.append((time.perf_counter() - started) * 1e6)
+    drain_started = time.perf_counter()
+    reset_logging() # flushes the queue
+    return timings, (time.perf_counter() - drain_started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request logging overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--sink", default="/dev/null")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.sink, "w") as sink:
+        stream = SlowStream(sink, args.sink_latency_ms / 1000)
+        print(f"{args.requests} requests, sink={args.sink}, sink latency={args.sink_latency_ms}ms")
+        for setup in ("sync-fstring", "queue", "queue-sampled", "level-gated"):
+            timings, drain_ms = run(setup, args, stream)
+            print(f"{setup:<14} mean={mean(timings):7.2f}us  p50={percentile(timings, 50):7.2f}us  "
+                  f"p99={percentile(timings, 99):7.2f}us  (writer drain after run: {drain_ms:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
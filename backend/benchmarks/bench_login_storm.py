@@ -0,0 +1,86 @@
+# backend/benchmarks/bench_login_storm.py
+#
+# Checks that memory/conversation reads keep their latency while a burst of logins
+# (bcrypt verification) hits the same worker. Needs the API running (single worker).
+#
+# Run from backend/:  python -m benchmarks.bench_login_storm --logins 400 --login-concurrency 50
+
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import percentile, register_and_login
+
+
+async def probe(client: httpx.AsyncClient, headers: dict, duration: float) -> dict:
+    """Sequentially hits the read endpoints for `duration` seconds, returning latencies per path."""
+    samples = {"/api/v1/memories": [], "/api/v1/conversations": []}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for path, bucket in samples.items():
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+            bucket.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def login_storm(client: httpx.AsyncClient, username: str, password: str, total: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = {"ok": 0, "shed_503": 0, "other": 0}
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/api/v1/auth/token", data={"username": username, "password": password})
+            if response.status_code == 200:
+                outcomes["ok"] += 1
+            elif response.status_code == 503:
+                outcomes["shed_503"] += 1
+            else:
+                outcomes["other"] += 1
+
+    await asyncio.gather(*(login() for _ in range(total)))
+    return outcomes
+
+
+def report(label: str, samples: dict):
+    for path, values in samples.items():
+        print(f"{label:>10} {path:<24} n={len(values):<5} p50={percentile(values, 50):7.1f}ms p95={percentile(values, 95):7.1f}ms p99={percentile(values, 99):7.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Read latency during a login storm")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        token = await register_and_login(client, prefix="storm")
+        headers = {"Authorization": f"Bearer {token}"}
+        me = (await client.get("/api/v1/auth/users/me", headers=headers)).json()
+
+        report("baseline", await probe(client, headers, args.baseline_seconds))
+
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60,
+                                     limits=httpx.Limits(max_connections=args.login_concurrency)) as storm_client:
+            storm = asyncio.create_task(login_storm(
+                storm_client, me["username"], "benchmark-password", args.logins, args.login_concurrency
+            ))
+            started = time.perf_counter()
+            samples = {"/api/v1/memories": [], "/api/v1/conversations": []}
+            while not storm.done():
+                for path, values in (await probe(client, headers, 0.5)).items():
+                    samples[path].extend(values)
+            outcomes = await storm
+            elapsed = time.perf_counter() - started
+
+        report("storm", samples)
+        print(f"logins: {outcomes} in {elapsed:.1f}s ({args.logins / elapsed:.0f}/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
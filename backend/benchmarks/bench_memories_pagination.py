@@ -0,0 +1,110 @@
+# backend/benchmarks/bench_memories_pagination.py
+#
+# Page 1 vs page 500 latency for memory listing over 1M synthetic memories:
+#   skip/limit without an index, skip/limit with the compound index, keyset cursor with the index.
+# Needs a local mongod (MONGODB_URI, default localhost). Seeding 1M docs takes a minute or two.
+#
+# Run from backend/:  python -m benchmarks.bench_memories_pagination --memories 1000000 --users 50
+
+import os
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.pagination import encode_cursor, keyset_after
+
+BENCH_DB_NAME = "future_self_bench"
+COLLECTION = "futureself"
+PAGE_SIZE = 20
+INDEX_KEYS = [("user_id", 1), ("created_at", -1), ("_id", -1)]
+
+
+async def seed(collection, total: int, users: int):
+    await collection.drop()
+    base = datetime(2020, 1, 1)
+    batch = []
+    for i in range(total):
+        batch.append({
+            "_id": str(uuid.uuid4()), "user_id": f"user-{i % users}",
+            "title": f"Memory {i}", "description": "lorem ipsum " * 20,
+            "significance": random.randint(1, 5), "tags": ["bench"], "attachments": [],
+            "created_at": base + timedelta(seconds=i), "updated_at": base + timedelta(seconds=i),
+        })
+        if len(batch) == 10000:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def timed(fn, repeats: int = 20) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def skip_page(collection, user_id: str, page: int):
+    cursor = collection.find({"user_id": user_id}).sort("created_at", -1).skip((page - 1) * PAGE_SIZE).limit(PAGE_SIZE)
+    return await cursor.to_list(length=PAGE_SIZE)
+
+
+async def keyset_page(collection, user_id: str, cursor: str = None):
+    query = {"user_id": user_id}
+    if cursor:
+        query.update(keyset_after("created_at", cursor))
+    db_cursor = collection.find(query).sort([("created_at", -1), ("_id", -1)]).limit(PAGE_SIZE)
+    return await db_cursor.to_list(length=PAGE_SIZE)
+
+
+async def cursor_for_page(collection, user_id: str, page: int) -> str:
+    """Walks the keyset pages to get the cursor that starts `page` (setup, not timed)."""
+    cursor = None
+    for _ in range(page - 1):
+        docs = await keyset_page(collection, user_id, cursor)
+        cursor = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    return cursor
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Memory pagination benchmark")
+    parser.add_argument("--memories", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--deep-page", type=int, default=500)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse previously seeded data.")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    collection = client[BENCH_DB_NAME][COLLECTION]
+    if not args.skip_seed:
+        print(f"Seeding {args.memories} memories across {args.users} users...")
+        await seed(collection, args.memories, args.users)
+    user_id = "user-0"
+
+    await collection.drop_indexes()
+    no_index = [await timed(lambda: skip_page(collection, user_id, 1), 5),
+                await timed(lambda: skip_page(collection, user_id, args.deep_page), 5)]
+
+    await collection.create_index(INDEX_KEYS)
+    with_index = [await timed(lambda: skip_page(collection, user_id, 1)),
+                  await timed(lambda: skip_page(collection, user_id, args.deep_page))]
+    deep_cursor = await cursor_for_page(collection, user_id, args.deep_page)
+    keyset = [await timed(lambda: keyset_page(collection, user_id)),
+              await timed(lambda: keyset_page(collection, user_id, deep_cursor))]
+
+    print(f"{'strategy':<24} {'page 1 p50 (ms)':>16} {f'page {args.deep_page} p50 (ms)':>18}")
+    for name, (first, deep) in (("skip, no index", no_index), ("skip, compound index", with_index), ("keyset, compound index", keyset)):
+        print(f"{name:<24} {first:>16.2f} {deep:>18.2f}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+# backend/benchmarks/bench_memory_index.py
+#
+# In-process latency of the per-user BM25 memory index (no Mongo needed).
+#
+# Run from backend/:  python -m benchmarks.bench_memory_index --memories 10000
+
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from app.services.memory_index import UserMemoryIndex
+from benchmarks.common import percentile
+
+
+def synthetic_memory(i: int, vocabulary: list) -> dict:
+    return {
+        "_id": f"mem-{i}",
+        "title": " ".join(random.choices(vocabulary, k=6)),
+        "description": " ".join(random.choices(vocabulary, k=80)),
+        "tags": random.choices(vocabulary, k=3),
+        "significance": random.randint(1, 5),
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=i),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 memory index benchmark")
+    parser.add_argument("--memories", type=int, default=10000)
+    parser.add_argument("--vocabulary", type=int, default=8000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(7)
+    vocabulary = [f"w{i}" for i in range(args.vocabulary)]
+    index = UserMemoryIndex()
+    start = time.perf_counter()
+    for i in range(args.memories):
+        index.upsert(synthetic_memory(i, vocabulary))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    search_ms = []
+    for _ in range(args.queries):
+        query = " ".join(random.choices(vocabulary, k=random.randint(5, 40)))
+        start = time.perf_counter()
+        index.search(query, 10)
+        search_ms.append((time.perf_counter() - start) * 1000)
+
+    update_ms = []
+    for i in random.sample(range(args.memories), min(200, args.memories)):
+        start = time.perf_counter()
+        index.upsert(synthetic_memory(i, vocabulary))
+        update_ms.append((time.perf_counter() - start) * 1000)
+
+    print(f"memories={args.memories} build={build_ms:.0f}ms terms={len(index.postings)}")
+    print(f"search  p50={statistics.median(search_ms):.3f}ms p95={percentile(search_ms, 95):.3f}ms p99={percentile(search_ms, 99):.3f}ms")
+    print(f"upsert  p50={statistics.median(update_ms):.3f}ms p95={percentile(update_ms, 95):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
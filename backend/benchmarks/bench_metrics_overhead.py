@@ -0,0 +1,67 @@
+# backend/benchmarks/bench_metrics_overhead.py
+#
+# Per-request cost of app/core/metrics.py: drives a no-op ASGI app directly (no server, no
+# sockets) with and without MetricsMiddleware, and times the Mongo CommandListener callbacks
+# for one find command. The difference is what every real request pays for metrics.
+#
+# Run from backend/:  python -m benchmarks.bench_metrics_overhead --iterations 200000
+
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+from app.core.metrics import MetricsMiddleware, bind_routes, mongo_command_metrics
+
+ROUTE = SimpleNamespace(path_format="/api/v1/memories/{memory_id}", methods={"GET"})
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def noop_app(scope, receive, send):
+    scope["route"] = ROUTE # what the router does once a route matches
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def time_app(app, iterations: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/memories/m-1"}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def time_mongo_listener(iterations: int) -> float:
+    started_event = SimpleNamespace(command_name="find", command={"find": "futureself"}, request_id=0)
+    succeeded_event = SimpleNamespace(request_id=0, duration_micros=850)
+    started = time.perf_counter()
+    for request_id in range(iterations):
+        started_event.request_id = succeeded_event.request_id = request_id
+        mongo_command_metrics.started(started_event)
+        mongo_command_metrics.succeeded(succeeded_event)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Metrics overhead per request / per Mongo command")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    bind_routes([ROUTE])
+    bare_ns = await time_app(noop_app, args.iterations)
+    instrumented_ns = await time_app(MetricsMiddleware(noop_app), args.iterations)
+    print(f"HTTP request   bare={bare_ns:7.0f}ns  with metrics={instrumented_ns:7.0f}ns  overhead={instrumented_ns - bare_ns:6.0f}ns")
+    print(f"Mongo command  listener started+succeeded={time_mongo_listener(args.iterations):6.0f}ns")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
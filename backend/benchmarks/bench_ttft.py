@@ -0,0 +1,85 @@
+# backend/benchmarks/bench_ttft.py
+#
+# Measures time-to-first-token of the streaming chat endpoint under concurrent load.
+# Start the fake LLM and the API first, e.g. from backend/:
+#   python -m benchmarks.fake_llm_server --port 9100 --first-token-ms 300 --tokens-per-sec 200
+#   GROQ_API_KEY=fake GROQ_BASE_URL=http://127.0.0.1:9100 uvicorn app.main:app --port 8000
+#   python -m benchmarks.bench_ttft --concurrency 20 --turns 200
+# Set INTERNAL_API_TOKEN (same value as the API's) to also print the LLM connection-pool counters.
+
+import os
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import percentile, register_and_login
+
+
+async def streamed_turn(client: httpx.AsyncClient, conversation_id: str, headers: dict):
+    """Returns (time to first token, total time) in milliseconds for one streamed turn."""
+    start = time.perf_counter()
+    first_token_ms = None
+    async with client.stream(
+        "POST", f"/api/v1/conversations/{conversation_id}/messages/stream",
+        json={"content": "What would you tell me about patience?"}, headers=headers,
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token_ms is None and line == "event: token":
+                first_token_ms = (time.perf_counter() - start) * 1000
+            elif line in ("event: done", "event: error"):
+                break
+    return first_token_ms, (time.perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Streaming chat time-to-first-token benchmark")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+        token = await register_and_login(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = await client.post("/api/v1/conversations", json={"initial_message": "Hello"}, headers=headers)
+        response.raise_for_status()
+        conversation_id = response.json()["id"]
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        ttft, totals, errors = [], [], 0
+
+        async def worker():
+            nonlocal errors
+            async with semaphore:
+                try:
+                    first, total = await streamed_turn(client, conversation_id, headers)
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                if first is None:
+                    errors += 1
+                    return
+                ttft.append(first)
+                totals.append(total)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.turns)))
+        elapsed = time.perf_counter() - started
+
+        internal_token = os.getenv("INTERNAL_API_TOKEN")
+        pool = "n/a (INTERNAL_API_TOKEN not set)"
+        if internal_token:
+            pool = (await client.get("/api/v1/internal/llm-pool", headers={"Authorization": f"Bearer {internal_token}"})).json()
+
+    print(f"turns={args.turns} concurrency={args.concurrency} errors={errors} elapsed={elapsed:.1f}s")
+    print(f"llm pool: {pool}")
+    for name, samples in (("ttft", ttft), ("total", totals)):
+        print(f"{name:>6} ms  p50={percentile(samples, 50):8.1f}  p95={percentile(samples, 95):8.1f}  p99={percentile(samples, 99):8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+# backend/benchmarks/bench_upload_rss.py
+#
+# Peak server RSS while N users upload large attachments at once. The multipart bodies are
+# generated on the fly, so the client itself stays small. Needs the API running (single worker)
+# and its PID for RSS sampling (Linux /proc). The benchmark memories are deleted afterwards.
+#
+# Run from backend/:  python -m benchmarks.bench_upload_rss --server-pid 12345 --users 10 --file-mb 500
+
+import time
+import uuid
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.common import register_and_login
+
+CHUNK = b"\xa5" * (1024 * 1024)
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status_file:
+        for line in status_file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def multipart_body(boundary: str, file_mb: int):
+    yield (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nUpload bench\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"description\"\r\n\r\nLarge attachment\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"bench.bin\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    for _ in range(file_mb):
+        yield CHUNK
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def upload(client: httpx.AsyncClient, file_mb: int) -> str:
+    token = await register_and_login(client, prefix="upload")
+    headers = {"Authorization": f"Bearer {token}"}
+    boundary = uuid.uuid4().hex
+    response = await client.post(
+        "/api/v1/memories", content=multipart_body(boundary, file_mb),
+        headers={**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    response.raise_for_status()
+    memory_id = response.json()["id"]
+    await client.delete(f"/api/v1/memories/{memory_id}", headers=headers)
+    return memory_id
+
+
+async def sample_rss(pid: int, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        samples.append(rss_mb(pid))
+        await asyncio.sleep(0.1)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Server RSS during concurrent large uploads")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, required=True)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--file-mb", type=int, default=500)
+    args = parser.parse_args()
+
+    baseline = rss_mb(args.server_pid)
+    samples: list = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(args.server_pid, stop, samples))
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None) as client:
+        await asyncio.gather(*(upload(client, args.file_mb) for _ in range(args.users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    total_mb = args.users * args.file_mb
+    print(f"uploaded {args.users} x {args.file_mb} MB in {elapsed:.1f}s ({total_mb / elapsed:.0f} MB/s)")
+    print(f"server RSS baseline={baseline:.0f} MB peak={max(samples, default=baseline):.0f} MB "
+          f"growth={max(samples, default=baseline) - baseline:.0f} MB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+# backend/benchmarks/check_command_counts.py
+#
+# Asserts how many MongoDB CRUD commands each write endpoint issues (one round trip per write).
+# Runs the real app in-process against a local mongod with a throwaway database; the LLM is
+# replaced by a canned PersonaService so only Mongo traffic is measured.
+#
+# Run from backend/:  python -m benchmarks.check_command_counts     (exit code 1 on mismatch)
+
+import os
+import sys
+import asyncio
+from collections import Counter
+
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "command-count-check")
+os.environ.setdefault("DB_NAME", "future_self_command_check")
+
+from pymongo import monitoring
+
+
+class CrudCommandCounter(monitoring.CommandListener):
+    COUNTED = {"find", "insert", "update", "delete", "findAndModify", "aggregate", "getMore"}
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        if event.command_name in self.COUNTED:
+            self.commands[(event.command_name, event.command.get(event.command_name))] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def total(self) -> int:
+        return sum(self.commands.values())
+
+
+counter = CrudCommandCounter()
+monitoring.register(counter) # must happen before the app creates its Motor client
+
+import httpx
+
+from app.main import app, app_state, DB_NAME
+from app.routers import conversation
+
+
+class CannedPersonaService:
+    async def get_initial_response(self, user, first_message_content):
+        return "canned reply"
+
+    async def get_next_response(self, user, conversation_history):
+        return "canned reply"
+
+
+async def expect(label: str, expected: int, request):
+    counter.commands.clear()
+    response = await request()
+    response.raise_for_status()
+    ok = counter.total() == expected
+    print(f"{'ok  ' if ok else 'FAIL'} {label:<40} expected={expected} got={counter.total()} {dict(counter.commands)}")
+    return ok, response
+
+
+async def main() -> int:
+    app.dependency_overrides[conversation.get_persona_service] = lambda: CannedPersonaService()
+    for handler in app.router.on_startup:
+        await handler()
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            ok, _ = await expect("POST /auth/register", 1, lambda: client.post(
+                "/api/v1/auth/register", json={"email": "check@example.com", "username": "checker", "password": "check-password"}))
+            results.append(ok)
+            token = (await client.post("/api/v1/auth/token", data={"username": "checker", "password": "check-password"})).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            await client.get("/api/v1/auth/users/me", headers=headers) # warm the user cache
+            await client.post("/api/v1/conversations", json={"initial_message": "warm up"}, headers=headers) # warm memory index
+
+            ok, response = await expect("POST /conversations", 1, lambda: client.post(
+                "/api/v1/conversations", json={"initial_message": "hello"}, headers=headers))
+            results.append(ok)
+            conversation_id = response.json()["id"]
+            ok, _ = await expect("POST /conversations/{id}/messages", 2, lambda: client.post(
+                f"/api/v1/conversations/{conversation_id}/messages", json={"content": "again"}, headers=headers))
+            results.append(ok) # tail read + atomic append
+
+            ok, response = await expect("POST /memories", 1, lambda: client.post(
+                "/api/v1/memories", data={"title": "t", "description": "d"}, headers=headers))
+            results.append(ok)
+            memory_id = response.json()["id"]
+            ok, _ = await expect("PATCH /memories/{id}", 1, lambda: client.patch(
+                f"/api/v1/memories/{memory_id}", json={"title": "t2"}, headers=headers))
+            results.append(ok)
+            ok, _ = await expect("POST /memories/{id}/upload-attachment", 2, lambda: client.post(
+                f"/api/v1/memories/{memory_id}/upload-attachment", files={"file": ("a.txt", b"abc", "text/plain")}, headers=headers))
+            results.append(ok) # blob reference + atomic $push
+            ok, _ = await expect("DELETE /memories/{id}", 4, lambda: client.delete(
+                f"/api/v1/memories/{memory_id}", headers=headers))
+            results.append(ok) # delete + reference release, then background GC claim + blob record delete
+    finally:
+        await app_state["mongodb_client"].drop_database(DB_NAME)
+        for handler in app.router.on_shutdown:
+            await handler()
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
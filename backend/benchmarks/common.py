@@ -0,0 +1,28 @@
+# backend/benchmarks/common.py
+# Small helpers shared by the HTTP benchmark scripts.
+
+import uuid
+from typing import List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def register_and_login(client: httpx.AsyncClient, prefix: str = "bench") -> str:
+    """Registers a throwaway user against the running API and returns a bearer token."""
+    username = f"{prefix}_{uuid.uuid4().hex[:10]}"
+    password = "benchmark-password"
+    response = await client.post("/api/v1/auth/register", json={
+        "email": f"{username}@example.com", "username": username, "password": password,
+    })
+    response.raise_for_status()
+    response = await client.post("/api/v1/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
@@ -0,0 +1,137 @@
+# backend/benchmarks/fake_llm_server.py
+#
+# Minimal Groq/OpenAI-compatible chat completions server for local benchmarks.
+# Point the API at it with GROQ_BASE_URL=http://127.0.0.1:9100 (any GROQ_API_KEY works)
+#
+# Fault injection (per request, drawn in this order): --error-rate answers --error-status,
+# --rate-limit-rate answers 429 with retry-after: --retry-after-s, --slow-rate adds --slow-ms
+# before the first token. GET/POST /faults reads or changes these while running, e.g. to take
+# the "provider" down and bring it back: curl -XPOST :9100/faults -d '{"error_rate": 1}'
+#
+# Run from backend/:  python -m benchmarks.fake_llm_server --port 9100 --first-token-ms 300 --tokens-per-sec 200
+#                     python -m benchmarks.fake_llm_server --error-rate 0.1 --rate-limit-rate 0.05 --slow-rate 0.05 --slow-ms 5000
+
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake LLM")
+app.state.first_token_ms = 300.0
+app.state.tokens_per_sec = 200.0
+app.state.completion_tokens = 120
+FAULT_FIELDS = ("error_rate", "error_status", "rate_limit_rate", "retry_after_s", "slow_rate", "slow_ms")
+app.state.faults = {"error_rate": 0.0, "error_status": 503, "rate_limit_rate": 0.0, "retry_after_s": 1.0,
+                    "slow_rate": 0.0, "slow_ms": 0.0}
+app.state.rng = random.Random()
+
+
+def _completion_tokens(max_tokens: int):
+    count = min(app.state.completion_tokens, max_tokens)
+    return [f"word{i} " for i in range(count)]
+
+
+def _usage(body: dict, completion_tokens: int) -> dict:
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _injected_fault():
+    """An error response to send instead of a completion, or the extra delay (seconds) to add."""
+    faults, draw = app.state.faults, app.state.rng.random()
+    if draw < faults["error_rate"]:
+        return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=int(faults["error_status"])), 0.0
+    draw -= faults["error_rate"]
+    if draw < faults["rate_limit_rate"]:
+        return JSONResponse(
+            {"error": {"message": "injected rate limit", "type": "rate_limit_exceeded"}}, status_code=429,
+            headers={"retry-after": str(faults["retry_after_s"])},
+        ), 0.0
+    draw -= faults["rate_limit_rate"]
+    return None, (faults["slow_ms"] / 1000 if draw < faults["slow_rate"] else 0.0)
+
+
+@app.get("/faults")
+async def get_faults():
+    return app.state.faults
+
+
+@app.post("/faults")
+async def set_faults(request: Request):
+    changes = await request.json()
+    app.state.faults.update({k: float(v) for k, v in changes.items() if k in FAULT_FIELDS})
+    return app.state.faults
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error_response, extra_delay = _injected_fault()
+    if error_response is not None:
+        return error_response
+    model = body.get("model", "fake-model")
+    tokens = _completion_tokens(body.get("max_tokens") or app.state.completion_tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    token_interval = 1.0 / app.state.tokens_per_sec if app.state.tokens_per_sec > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(extra_delay + app.state.first_token_ms / 1000 + token_interval * len(tokens))
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": _usage(body, len(tokens)),
+        })
+
+    async def event_stream():
+        await asyncio.sleep(extra_delay + app.state.first_token_ms / 1000)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(token_interval)
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"usage": _usage(body, len(tokens))},
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after-s", type=float, default=1.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, help="fixed fault sequence")
+    args = parser.parse_args()
+    app.state.first_token_ms = args.first_token_ms
+    app.state.tokens_per_sec = args.tokens_per_sec
+    app.state.completion_tokens = args.completion_tokens
+    app.state.faults.update({field: float(getattr(args, field)) for field in FAULT_FIELDS})
+    app.state.rng = random.Random(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
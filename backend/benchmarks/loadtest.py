@@ -0,0 +1,487 @@
+# backend/benchmarks/loadtest.py
+#
+# End-to-end load test. Starts a throwaway mongod, the fake Groq server (fake_llm_server.py)
+# and the real API under uvicorn. Virtual users (async httpx) then run a weighted scenario
+# mix, and per-endpoint throughput, latency percentiles and errors are written as JSON
+# (sorted keys, so two runs diff cleanly).
+#
+# Scenarios: login, chat (POST messages), chat_stream (SSE, also records time to first token),
+# memory_crud (create with an upload, get, patch, delete) and listing (memories, memory pages,
+# conversation summaries). Mixes: a preset from MIXES or "login=1,chat=3,...".
+#
+# Run from backend/:
+#   python -m benchmarks.loadtest run --mix mixed --users 50 --duration 60 --output before.json
+#   python -m benchmarks.loadtest run --mix chat --first-token-ms 500 --tokens-per-sec 80
+#   python -m benchmarks.loadtest run --mix chat --llm local   # in-process engine, no fake server
+#   python -m benchmarks.loadtest run --base-url http://127.0.0.1:8000 --mix listing   # API already running
+#   python -m benchmarks.loadtest compare before.json after.json
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.common import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadtest-password"
+
+MIXES: Dict[str, Dict[str, float]] = {
+    "login-storm": {"login": 1},
+    "chat": {"chat": 3, "chat_stream": 1, "listing": 1},
+    "memory-crud": {"memory_crud": 3, "listing": 1},
+    "listing": {"listing": 1},
+    "mixed": {"login": 1, "chat": 2, "chat_stream": 1, "memory_crud": 2, "listing": 4},
+}
+
+
+# --- Local services ---
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn(stack: ExitStack, name: str, command: List[str], workdir: str, env: Optional[dict] = None) -> subprocess.Popen:
+    """Starts a child process logging to <workdir>/<name>.log; it is stopped when the stack unwinds."""
+    log = open(os.path.join(workdir, f"{name}.log"), "wb")
+    stack.callback(log.close)
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    stack.callback(stop)
+    return process
+
+
+def fail_with_log(name: str, workdir: str, reason: str):
+    path = os.path.join(workdir, f"{name}.log")
+    tail = open(path, errors="replace").read()[-3000:] if os.path.exists(path) else ""
+    raise SystemExit(f"{name} {reason}. Last output:\n{tail}")
+
+
+def wait_for_mongod(uri: str, process: subprocess.Popen, workdir: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            fail_with_log("mongod", workdir, "exited during startup")
+        try:
+            with MongoClient(uri, serverSelectionTimeoutMS=500) as client:
+                client.admin.command("ping")
+            return
+        except Exception:
+            time.sleep(0.2)
+    fail_with_log("mongod", workdir, "did not accept connections")
+
+
+def wait_for_http(name: str, url: str, process: subprocess.Popen, workdir: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            fail_with_log(name, workdir, "exited during startup")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    fail_with_log(name, workdir, f"did not answer {url}")
+
+
+def drop_database(uri: str, db_name: str):
+    with MongoClient(uri) as client:
+        client.drop_database(db_name)
+
+
+def start_stack(stack: ExitStack, args, workdir: str) -> str:
+    """Starts mongod (unless --mongo-uri), the fake LLM (unless --llm local) and the API; returns the API base URL."""
+    mongo_uri = args.mongo_uri
+    if not mongo_uri:
+        port = free_port()
+        dbpath = os.path.join(workdir, "db")
+        os.makedirs(dbpath)
+        mongod = spawn(stack, "mongod", [args.mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1"], workdir)
+        mongo_uri = f"mongodb://127.0.0.1:{port}"
+        wait_for_mongod(mongo_uri, mongod, workdir)
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    if args.mongo_uri: # shared server: drop the scratch database afterwards
+        stack.callback(drop_database, mongo_uri, db_name)
+
+    env = dict(os.environ)
+    if args.llm == "local":
+        env.update({
+            "LLM_PROVIDER": "local", "LOCAL_LLM_FIRST_TOKEN_MS": str(args.first_token_ms),
+            "LOCAL_LLM_TOKENS_PER_SEC": str(args.tokens_per_sec), "LOCAL_LLM_COMPLETION_TOKENS": str(args.completion_tokens),
+        })
+    else:
+        llm_port = free_port()
+        llm = spawn(stack, "fake_llm", [
+            sys.executable, "-m", "benchmarks.fake_llm_server", "--port", str(llm_port),
+            "--first-token-ms", str(args.first_token_ms), "--tokens-per-sec", str(args.tokens_per_sec),
+            "--completion-tokens", str(args.completion_tokens),
+        ], workdir)
+        wait_for_http("fake_llm", f"http://127.0.0.1:{llm_port}/openapi.json", llm, workdir)
+        env.update({"LLM_PROVIDER": "groq", "GROQ_API_KEY": "loadtest", "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}"})
+
+    api_port = free_port()
+    env.update({
+        "MONGODB_URI": mongo_uri, "DB_NAME": db_name, "SECRET_KEY": "loadtest-secret",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"), "LOG_LEVEL": "WARNING",
+    })
+    api = spawn(stack, "api", [
+        sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(api_port),
+        "--workers", str(args.api_workers), "--log-level", "warning",
+    ], workdir, env=env)
+    base_url = f"http://127.0.0.1:{api_port}"
+    wait_for_http("api", f"{base_url}/api/v1/", api, workdir)
+    return base_url
+
+
+# --- Measurement ---
+class Recorder:
+    """Latency samples, status codes and error kinds per endpoint name."""
+
+    def __init__(self):
+        self.recording = False
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.scenario_runs: Counter = Counter()
+
+    def add(self, name: str, elapsed_ms: float, status: str, error: Optional[str] = None):
+        if not self.recording:
+            return
+        self.samples[name].append(elapsed_ms)
+        self.statuses[name][status] += 1
+        if error:
+            self.errors[name][error] += 1
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str,
+                      expected=(200,), **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.add(name, (time.perf_counter() - started) * 1000, "exception", type(e).__name__)
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        ok = response.status_code in expected
+        self.add(name, elapsed_ms, str(response.status_code), None if ok else f"http_{response.status_code}")
+        return response if ok else None
+
+
+class VirtualUser:
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, args):
+        self.client, self.recorder, self.args = client, recorder, args
+        self.rng = random.Random(args.seed * 100_003 + index)
+        self.username = f"lt{index}_{uuid.uuid4().hex[:8]}"
+        self.headers: Dict[str, str] = {}
+        self.conversation_id: Optional[str] = None
+
+    async def _setup_call(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # Registration/login before the measured window; retried while bcrypt sheds load with 503.
+        for _ in range(30):
+            response = await self.client.request(method, url, **kwargs)
+            if response.status_code != 503:
+                response.raise_for_status()
+                return response
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+        response.raise_for_status()
+        return response
+
+    async def setup(self):
+        await self._setup_call("POST", "/api/v1/auth/register", json={
+            "email": f"{self.username}@example.com", "username": self.username, "password": PASSWORD,
+        })
+        token = (await self._setup_call("POST", "/api/v1/auth/token", data={"username": self.username, "password": PASSWORD})).json()
+        self.headers = {"Authorization": f"Bearer {token['access_token']}"}
+        for i in range(self.args.seed_memories):
+            await self._setup_call("POST", "/api/v1/memories", headers=self.headers, data={
+                "title": f"Seed memory {i}", "description": "Seeded before the run.", "significance": "3", "tags_json": "[]",
+            })
+
+    # --- Scenarios ---
+    async def login(self):
+        await self.recorder.request(self.client, "POST /api/v1/auth/token", "POST", "/api/v1/auth/token",
+                                    data={"username": self.username, "password": PASSWORD})
+
+    async def _ensure_conversation(self) -> bool:
+        if self.conversation_id is None:
+            response = await self.recorder.request(
+                self.client, "POST /api/v1/conversations", "POST", "/api/v1/conversations", expected=(201,),
+                headers=self.headers, json={"initial_message": "Hello from my past self.", "title": "Load test"},
+            )
+            if response is None:
+                return False
+            self.conversation_id = response.json()["id"]
+        return True
+
+    async def chat(self):
+        if await self._ensure_conversation():
+            await self.recorder.request(
+                self.client, "POST /api/v1/conversations/{conversation_id}/messages", "POST",
+                f"/api/v1/conversations/{self.conversation_id}/messages",
+                headers=self.headers, json={"content": "What should I focus on this year?"},
+            )
+
+    async def chat_stream(self):
+        if not await self._ensure_conversation():
+            return
+        name = "POST /api/v1/conversations/{conversation_id}/messages/stream"
+        started = time.perf_counter()
+        status, error, first_token_ms = "exception", None, None
+        try:
+            async with self.client.stream(
+                "POST", f"/api/v1/conversations/{self.conversation_id}/messages/stream",
+                headers=self.headers, json={"content": "Tell me about patience."},
+            ) as response:
+                status = str(response.status_code)
+                if response.status_code != 200:
+                    error = f"http_{response.status_code}"
+                else:
+                    async for line in response.aiter_lines():
+                        if first_token_ms is None and line == "event: token":
+                            first_token_ms = (time.perf_counter() - started) * 1000
+                        elif line == "event: error":
+                            error = "sse_error"
+                        elif line == "event: done":
+                            break
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        self.recorder.add(name, (time.perf_counter() - started) * 1000, status, error)
+        if first_token_ms is not None:
+            self.recorder.add(f"{name} [first token]", first_token_ms, status)
+
+    async def memory_crud(self):
+        files = None
+        if self.args.upload_bytes:
+            payload = self.rng.randbytes(self.args.upload_bytes)
+            files = [("files", ("photo.jpg", payload, "image/jpeg"))]
+        response = await self.recorder.request(
+            self.client, "POST /api/v1/memories", "POST", "/api/v1/memories", expected=(201,), headers=self.headers,
+            data={"title": "Load test memory", "description": "Created by the load test.", "significance": "4",
+                  "tags_json": json.dumps(["loadtest"])},
+            files=files,
+        )
+        if response is None:
+            return
+        memory_id = response.json()["_id"]
+        path = f"/api/v1/memories/{memory_id}"
+        await self.recorder.request(self.client, "GET /api/v1/memories/{memory_id}", "GET", path, headers=self.headers)
+        await self.recorder.request(self.client, "PATCH /api/v1/memories/{memory_id}", "PATCH", path,
+                                    headers=self.headers, json={"title": "Edited by the load test"})
+        await self.recorder.request(self.client, "DELETE /api/v1/memories/{memory_id}", "DELETE", path,
+                                    expected=(204,), headers=self.headers)
+
+    async def listing(self):
+        await self.recorder.request(self.client, "GET /api/v1/memories", "GET", "/api/v1/memories",
+                                    headers=self.headers, params={"limit": 20})
+        await self.recorder.request(self.client, "GET /api/v1/memories/page", "GET", "/api/v1/memories/page",
+                                    headers=self.headers, params={"limit": 20})
+        await self.recorder.request(self.client, "GET /api/v1/conversations/summaries", "GET",
+                                    "/api/v1/conversations/summaries", headers=self.headers, params={"limit": 20})
+
+    async def run(self, mix: Dict[str, float], deadline: float):
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(names, weights)[0]
+            if self.recorder.recording:
+                self.recorder.scenario_runs[scenario] += 1
+            await getattr(self, scenario)()
+            if self.args.think_ms:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_ms) / 1000)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    if spec in MIXES:
+        return dict(MIXES[spec])
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(VirtualUser, name) or name.startswith("_") or name in ("setup", "run"):
+            raise SystemExit(f"Unknown scenario '{name}' (presets: {', '.join(MIXES)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_report(recorder: Recorder, args, mix: Dict[str, float], measured_seconds: float) -> dict:
+    endpoints = {}
+    total_requests = total_errors = 0
+    for name, samples in recorder.samples.items():
+        errors = sum(recorder.errors[name].values())
+        is_derived = name.endswith("[first token]") # not a separate request
+        if not is_derived:
+            total_requests += len(samples)
+            total_errors += errors
+        endpoints[name] = {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            "throughput_rps": round(len(samples) / measured_seconds, 2),
+            "latency_ms": {
+                "p50": round(percentile(samples, 50), 2), "p95": round(percentile(samples, 95), 2),
+                "p99": round(percentile(samples, 99), 2), "mean": round(sum(samples) / len(samples), 2),
+                "max": round(max(samples), 2),
+            },
+            "status": dict(recorder.statuses[name]),
+            "error_kinds": dict(recorder.errors[name]),
+        }
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "mix": mix, "users": args.users, "duration_s": args.duration, "warmup_s": args.warmup,
+            "seed": args.seed, "think_ms": args.think_ms, "upload_bytes": args.upload_bytes,
+            "api_workers": args.api_workers, "external_api": bool(args.base_url),
+            "llm": args.llm,
+            "fake_llm": {"first_token_ms": args.first_token_ms, "tokens_per_sec": args.tokens_per_sec,
+                         "completion_tokens": args.completion_tokens},
+        },
+        "totals": {
+            "requests": total_requests, "errors": total_errors,
+            "throughput_rps": round(total_requests / measured_seconds, 2),
+        },
+        "scenarios": dict(recorder.scenario_runs),
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def drive(base_url: str, args, mix: Dict[str, float]) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        users = [VirtualUser(i, client, recorder, args) for i in range(args.users)]
+        setup_gate = asyncio.Semaphore(16)
+
+        async def setup(user: VirtualUser):
+            async with setup_gate:
+                await user.setup()
+
+        await asyncio.gather(*(setup(user) for user in users))
+
+        deadline = time.monotonic() + args.warmup + args.duration
+        runners = asyncio.gather(*(user.run(mix, deadline) for user in users))
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measure_started = time.monotonic()
+        await runners
+        measured = time.monotonic() - measure_started # includes requests finishing after the deadline
+    return build_report(recorder, args, mix, measured)
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    with ExitStack() as stack:
+        if args.base_url:
+            base_url = args.base_url
+        else:
+            if not args.mongo_uri and not shutil.which(args.mongod):
+                raise SystemExit(f"'{args.mongod}' not found; install MongoDB or pass --mongo-uri / --base-url")
+            workdir = tempfile.mkdtemp(prefix="loadtest-")
+            if args.keep_workdir:
+                print(f"service logs and data: {workdir}", file=sys.stderr)
+            else:
+                stack.callback(shutil.rmtree, workdir, True)
+            base_url = start_stack(stack, args, workdir)
+        report = asyncio.run(drive(base_url, args, mix))
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"wrote {args.output}: {report['totals']['requests']} requests, "
+              f"{report['totals']['errors']} errors, {report['totals']['throughput_rps']} req/s", file=sys.stderr)
+    else:
+        print(text)
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    def change(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+6.1f}%" if old else "   n/a"
+
+    print(f"{'endpoint':<66} {'req/s':>16} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'errors':>12}")
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        old, new = before["endpoints"].get(name), after["endpoints"].get(name)
+        if old is None or new is None:
+            print(f"{name:<66} only in {'after' if old is None else 'before'}")
+            continue
+        cells = [f"{new['throughput_rps']:8.1f} {change(old['throughput_rps'], new['throughput_rps'])}"]
+        for key in ("p50", "p95", "p99"):
+            cells.append(f"{new['latency_ms'][key]:8.1f} {change(old['latency_ms'][key], new['latency_ms'][key])}")
+        cells.append(f"{old['errors']:>5}->{new['errors']:<5}")
+        print(f"{name:<66} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="start the stack and run a scenario mix")
+    run_parser.add_argument("--mix", default="mixed", help=f"preset ({', '.join(MIXES)}) or 'scenario=weight,...'")
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--duration", type=float, default=30.0)
+    run_parser.add_argument("--warmup", type=float, default=5.0)
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between scenarios per user")
+    run_parser.add_argument("--seed-memories", type=int, default=5, help="memories created per user before the run")
+    run_parser.add_argument("--upload-bytes", type=int, default=64 * 1024, help="attachment size in memory_crud (0: none)")
+    run_parser.add_argument("--request-timeout", type=float, default=120.0)
+    run_parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    run_parser.add_argument("--base-url", help="use an already running API instead of starting one")
+    run_parser.add_argument("--mongo-uri", help="use this MongoDB (scratch database, dropped afterwards) instead of starting mongod")
+    run_parser.add_argument("--mongod", default="mongod", help="mongod binary")
+    run_parser.add_argument("--api-workers", type=int, default=1)
+    run_parser.add_argument("--llm", choices=("fake-server", "local"), default="fake-server",
+                            help="fake Groq server over HTTP, or LLM_PROVIDER=local inside the API")
+    run_parser.add_argument("--first-token-ms", type=float, default=300.0)
+    run_parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    run_parser.add_argument("--completion-tokens", type=int, default=120)
+    run_parser.add_argument("--keep-workdir", action="store_true", help="keep service logs and data")
+
+    compare_parser = commands.add_parser("compare", help="per-endpoint change between two reports")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
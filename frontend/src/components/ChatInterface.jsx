@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { startConversation, sendMessage } from '../services/apiService';
+import { startConversation, sendMessage, createIdempotencyKeys } from '../services/apiService';
 import './ConversationPage.css'; // Import the CSS file
 
 function ChatInterface() {
@@ -9,6 +9,7 @@ function ChatInterface() {
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState('');
     const messagesEndRef = useRef(null); // To auto-scroll
+    const idempotencyKeys = useRef(createIdempotencyKeys()); // resending the same message reuses its key
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -32,18 +33,19 @@ function ChatInterface() {
         setError('');
         setIsLoading(true);
 
+        const idempotencyKey = idempotencyKeys.current.keyFor({ conversationId, content: userMessage.content });
         try {
-            let updatedConversation;
             if (!conversationId) {
                 // Start a new conversation
-                updatedConversation = await startConversation(userMessage.content);
-                setConversationId(updatedConversation.id);
+                const createdConversation = await startConversation(userMessage.content, idempotencyKey);
+                setConversationId(createdConversation.id);
+                setMessages(createdConversation.messages);
             } else {
-                // Send message to existing conversation
-                updatedConversation = await sendMessage(conversationId, userMessage.content);
+                // Send message to existing conversation; the response holds just this turn (user + reply)
+                const turn = await sendMessage(conversationId, userMessage.content, idempotencyKey, 2);
+                setMessages(prevMessages => [...prevMessages.filter(msg => msg.id !== userMessage.id), ...turn.messages]);
             }
-            // Update messages state with the full list from the API response
-            setMessages(updatedConversation.messages);
+            idempotencyKeys.current.reset();
         } catch (err) {
             setError(err.detail || err.message || 'Failed to send message. Please try again.');
             // Optional: remove the optimistic user message if sending failed
@@ -1,5 +1,6 @@
 import React from 'react';
 import PropTypes from 'prop-types';
+import { attachmentUrl as resolveAttachmentUrl } from '../services/apiService';
 import './MemoryCard.css';
 
 // Helper to format date
@@ -20,6 +21,10 @@ const isImageUrl = (url) => {
     return /\.(jpe?g|png|gif|webp|svg)$/i.test(url);
 };
 
+// Small server-side thumbnail (resized WebP/JPEG) for card previews; the link still opens the original.
+// Same signed, API-origin URL as the link (the size parameter is not part of the signature).
+const thumbnailUrl = (signedPath) => resolveAttachmentUrl(signedPath, { size: 'small' });
+
 // Truncate text with ellipsis
 const truncateText = (text, maxLength) => {
     if (!text) return '';
@@ -37,7 +42,7 @@ function MemoryCard({ memory, onDelete, onEdit }) {
     }
 
     const {
-        id, title, description, significance, tags, attachments, created_at,
+        id, title, description, significance, tags, attachments, attachment_urls, created_at,
     } = memory;
 
     const handleDeleteClick = (e) => {
@@ -98,25 +103,29 @@ function MemoryCard({ memory, onDelete, onEdit }) {
                                 const attachmentName = typeof attachmentUrl === 'string' 
                                     ? attachmentUrl.split('/').pop() 
                                     : `attachment-${index}`;
+                                // Signed (token-free) URL when the API sent one, resolved against the API origin
+                                const signedPath = attachment_urls?.[index] || attachmentUrl;
+                                const href = typeof signedPath === 'string' ? resolveAttachmentUrl(signedPath) : '#';
                                 
                                 return (
                                     <li key={`attachment-${id}-${index}`} className="attachment-list-item">
                                         {isImageUrl(attachmentUrl) ? (
                                             <a 
-                                                href={attachmentUrl} 
+                                                href={href} 
                                                 target="_blank" 
                                                 rel="noopener noreferrer" 
                                                 title={`View ${attachmentName}`}
                                             >
                                                 <img 
-                                                    src={attachmentUrl} 
+                                                    src={thumbnailUrl(signedPath)} 
                                                     alt={attachmentName || 'Attachment'} 
                                                     className="attachment-thumbnail" 
+                                                    loading="lazy"
                                                 />
                                             </a>
                                         ) : (
                                             <a 
-                                                href={attachmentUrl || '#'} 
+                                                href={href} 
                                                 target="_blank" 
                                                 rel="noopener noreferrer" 
                                                 className="attachment-link"
@@ -153,6 +162,7 @@ MemoryCard.propTypes = {
         significance: PropTypes.number,
         tags: PropTypes.arrayOf(PropTypes.string),
         attachments: PropTypes.arrayOf(PropTypes.string),
+        attachment_urls: PropTypes.arrayOf(PropTypes.string),
         created_at: PropTypes.string,
     }).isRequired,
     onDelete: PropTypes.func.isRequired,
@@ -4,7 +4,7 @@
 
 import React, { useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { createMemory } from '../services/apiService'; // Ensure this service is correct
+import { createMemory, createIdempotencyKeys } from '../services/apiService'; // Ensure this service is correct
 import './AddMemoryPage.css'; // Styles remain unchanged
 
 function AddMemoryPage() {
@@ -19,6 +19,7 @@ function AddMemoryPage() {
     const [files, setFiles] = useState([]);
     const [previewUrls, setPreviewUrls] = useState([]);
     const fileInputRef = useRef(null);
+    const idempotencyKeys = useRef(createIdempotencyKeys()); // resubmitting an unchanged form reuses its key
     // -----------------------------
 
     // handleFileChange and removeFile remain unchanged
@@ -87,7 +88,11 @@ function AddMemoryPage() {
 
             console.log("4. Calling createMemory API...");
             // Ensure apiService.js->createMemory sets 'Content-Type': 'multipart/form-data'
-            const createdMemory = await createMemory(formData);
+            const idempotencyKey = idempotencyKeys.current.keyFor({
+                title, description, significance, tags: tagsList, files: files.map(file => [file.name, file.size]),
+            });
+            const createdMemory = await createMemory(formData, idempotencyKey);
+            idempotencyKeys.current.reset();
             console.log("5. API Call Successful:", createdMemory); // Log success response
 
             console.log("6. Navigating to /memories...");
@@ -1,5 +1,5 @@
-import React, { useState, useEffect, useCallback } from 'react';
-import { getMemories, deleteMemory as apiDeleteMemory, updateMemory as apiUpdateMemory, createMemory as apiCreateMemory } from '../services/apiService';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
+import { getMemories, deleteMemory as apiDeleteMemory, updateMemory as apiUpdateMemory, createMemory as apiCreateMemory, createIdempotencyKeys } from '../services/apiService';
 import MemoryCard from '../components/MemoryCard';
 import MemoryFormModal from '../components/MemoryFormModal';
 import './MemoriesPage.css'; // Import the new styles
@@ -7,6 +7,16 @@ import './MemoriesPage.css'; // Import the new styles
 // Placeholder for icons (replace with actual SVG components or library)
 const IconPlaceholder = ({ text, className }) => <span className={className}>[{text}]</span>;
 
+const normalizeMemories = (items) => (Array.isArray(items) ? items : []).map(mem => {
+    if (mem && mem._id && mem.id === undefined) {
+        return { ...mem, id: mem._id };
+    }
+    if (mem && mem.id !== undefined) {
+        return mem;
+    }
+    return null;
+}).filter(mem => mem !== null);
+
 
 function MemoriesPage() {
     const [memories, setMemories] = useState([]);
@@ -15,34 +25,40 @@ function MemoriesPage() {
     const [editingMemory, setEditingMemory] = useState(null); // For editing or creating new
     const [isFormOpen, setIsFormOpen] = useState(false);
     const [isEditMode, setIsEditMode] = useState(false); // To distinguish between create and edit
+    const [nextCursor, setNextCursor] = useState(null); // null once the last page is loaded
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
+    const idempotencyKeys = useRef(createIdempotencyKeys()); // re-saving an unchanged new memory reuses its key
 
     const fetchAndSetMemories = useCallback(async () => {
         setIsLoading(true);
         setError(null);
         try {
-            const fetchedData = await getMemories();
-            if (Array.isArray(fetchedData)) {
-                const transformedMemories = fetchedData.map(mem => {
-                    if (mem && mem._id && mem.id === undefined) {
-                        return { ...mem, id: mem._id };
-                    }
-                    if (mem && mem.id !== undefined) {
-                        return mem;
-                    }
-                    return null;
-                }).filter(mem => mem !== null);
-                setMemories(transformedMemories);
-            } else {
-                setMemories([]);
-            }
+            const page = await getMemories();
+            setMemories(normalizeMemories(page?.items));
+            setNextCursor(page?.next_cursor || null);
         } catch (err) {
             setError(err.message || "Failed to load memories.");
             setMemories([]);
+            setNextCursor(null);
         } finally {
             setIsLoading(false);
         }
     }, []);
 
+    const handleLoadMore = async () => {
+        if (!nextCursor || isLoadingMore) return;
+        setIsLoadingMore(true);
+        try {
+            const page = await getMemories(nextCursor);
+            setMemories(prev => [...prev, ...normalizeMemories(page?.items)]);
+            setNextCursor(page?.next_cursor || null);
+        } catch (err) {
+            setError(err.message || "Failed to load more memories.");
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     useEffect(() => {
         fetchAndSetMemories();
     }, [fetchAndSetMemories]);
@@ -87,7 +103,11 @@ function MemoriesPage() {
                         formData.append('files', files[i]);
                     }
                 }
-                await apiCreateMemory(formData);
+                const idempotencyKey = idempotencyKeys.current.keyFor({
+                    ...memoryData, files: Array.from(files || []).map(file => [file.name, file.size]),
+                });
+                await apiCreateMemory(formData, idempotencyKey);
+                idempotencyKeys.current.reset();
             } else if (editingMemory && editingMemory.id) {
                 // For updates, send JSON. File updates would be a separate mechanism.
                 const payload = {
@@ -179,6 +199,14 @@ function MemoriesPage() {
                         })}
                     </div>
                 )}
+
+                {!isLoading && nextCursor && (
+                    <div className="load-more-container" style={{ marginTop: '2rem', textAlign: 'center' }}>
+                        <button onClick={handleLoadMore} className="secondary-button" disabled={isLoadingMore}>
+                            {isLoadingMore ? 'Loading...' : 'Load More'}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
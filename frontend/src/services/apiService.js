@@ -23,6 +23,37 @@ apiClient.interceptors.request.use(
     }
 );
 
+// Pass the same key when retrying a create/send after a timeout: the backend replays the first
+// result instead of creating a duplicate (e.g. crypto.randomUUID(), kept until the call succeeds).
+const idempotencyHeaders = (idempotencyKey) => (idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {});
+
+// One key per user action: keyFor(payload) returns the same key while the same payload is being
+// resubmitted (retry after an error or timeout) and a fresh one once it changes; reset() after success.
+export const createIdempotencyKeys = () => {
+    let current = null;
+    return {
+        keyFor(payload) {
+            const signature = JSON.stringify(payload);
+            if (!current || current.signature !== signature) {
+                current = { signature, key: crypto.randomUUID() };
+            }
+            return current.key;
+        },
+        reset() {
+            current = null;
+        },
+    };
+};
+
+// Attachment paths from the API are server-relative ("/api/v1/attachments/..."), so <img>/<a> must
+// resolve them against the API origin, not the frontend's. Pass the signed URL from a memory's
+// attachment_urls: browsers cannot add the Authorization header to those requests.
+export const attachmentUrl = (path, params = {}) => {
+    const url = new URL(path, new URL(API_BASE_URL, window.location.href));
+    Object.entries(params).forEach(([key, value]) => url.searchParams.set(key, value));
+    return url.href;
+};
+
 // --- Authentication API Calls ---
 export const loginUser = async (username, password) => {
     const params = new URLSearchParams();
@@ -71,10 +102,11 @@ export const getCurrentUser = async () => {
 };
 
 // --- Memory API Calls ---
-export const getMemories = async (skip = 0, limit = 20) => {
+// Newest-first page of memories: { items, next_cursor }. Pass next_cursor back to get the following page.
+export const getMemories = async (cursor = null, limit = 20) => {
     try {
-        // FIXED: Removed trailing slash before query parameters
-        const response = await apiClient.get(`/memories?skip=${skip}&limit=${limit}`);
+        const params = cursor ? { cursor, limit } : { limit };
+        const response = await apiClient.get('/memories/page', { params });
         console.log("apiService.getMemories - Response Data:", response.data); // Log received data
         return response.data;
     } catch (error) {
@@ -83,7 +115,7 @@ export const getMemories = async (skip = 0, limit = 20) => {
     }
 };
 
-export const createMemory = async (formData) => {
+export const createMemory = async (formData, idempotencyKey) => {
     if (!(formData instanceof FormData)) {
          console.error("createMemory expects FormData as input when sending files.");
          throw new Error("Invalid data format for createMemory");
@@ -93,6 +125,7 @@ export const createMemory = async (formData) => {
         const response = await apiClient.post('/memories', formData, {
             headers: {
                 'Content-Type': 'multipart/form-data',
+                ...idempotencyHeaders(idempotencyKey),
             },
         });
         return response.data;
@@ -165,11 +198,11 @@ export const uploadMemoryAttachment = async (memoryId, file) => {
 };
 
 // --- Conversation API Calls ---
-export const startConversation = async (initialMessage) => {
+export const startConversation = async (initialMessage, idempotencyKey) => {
      try {
         // FIXED: Removed trailing slash from URL
         const response = await apiClient.post('/conversations', { initial_message: initialMessage }, {
-             headers: { 'Content-Type': 'application/json' }
+             headers: { 'Content-Type': 'application/json', ...idempotencyHeaders(idempotencyKey) }
         });
         return response.data;
     } catch (error) {
@@ -178,11 +211,13 @@ export const startConversation = async (initialMessage) => {
     }
 };
 
-export const sendMessage = async (conversationId, messageContent) => {
+// messageWindow: only return the last N messages (e.g. 2 for just this turn) instead of the whole conversation
+export const sendMessage = async (conversationId, messageContent, idempotencyKey, messageWindow) => {
     try {
         // FIXED: Removed trailing slash from URL
         const response = await apiClient.post(`/conversations/${conversationId}/messages`, { content: messageContent }, {
-             headers: { 'Content-Type': 'application/json' }
+             headers: { 'Content-Type': 'application/json', ...idempotencyHeaders(idempotencyKey) },
+             params: messageWindow ? { message_window: messageWindow } : undefined,
         });
         return response.data;
     } catch (error) {